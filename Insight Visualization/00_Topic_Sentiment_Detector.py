@@ -19,14 +19,15 @@ Created on Fri Apr 11 21:16:47 2025
 # =====================================================================================
 # HOW TO USE:
 # -------------------------------------------------------------------------------------
-# 1. Place all Excel files in the Thematic Mentions folder, named like:
-#       RAW AI Mentions_part1.xlsx, RAW Efficiency Mentions_part1.xlsx, etc.
+# 1. Run 01_Keyword_Filter.py, which writes the RAW Thematic Mentions Dataset (Parquet, one folder per
+#    theme and quarter) to the Thematic Mentions folder.
 #
 # 2. Ensure OpenAI API access is enabled and valid.
 #
 # 3. Run the script. It will:
-#    - Detect all themes from filenames
-#    - Send each row’s transcript excerpt to OpenAI
+#    - Detect all themes from the dataset manifest and load each theme's partition
+#    - Answer the excerpts the local pre-classifier is confident about (sentiment only, see sentiment_cascade.py)
+#    - Send each remaining unique excerpt to OpenAI once, asking about every theme it mentions
 #    - Append subthemes, sentiment, and reasoning
 #    - Export enriched files to "Processed {theme} Mentions.xlsx"
 #
@@ -34,41 +35,112 @@ Created on Fri Apr 11 21:16:47 2025
 # INPUT:
 # -------------------------------------------------------------------------------------
 # Folder: S:/Strategy Research/Transcripts/Data/Thematic Mentions/
-# Files:  RAW {theme} Mentions_part1.xlsx
-# Required Column: transcript_text
+# Dataset: RAW Thematic Mentions Dataset (theme=<theme>/quarter=<YYYYQn>/part-0.parquet + _manifest.json)
+# Required Column: Combined Transcript
 #
 # =====================================================================================
 # OUTPUT:
 # -------------------------------------------------------------------------------------
 # Folder: S:/Strategy Research/Transcripts/Data/Thematic Mentions/
 # Files:  Processed {theme} Mentions.xlsx
-# Each output includes columns for subthemes, sentiment, and reasoning per excerpt.
+# Each output includes columns for subthemes, sentiment, reasoning and sentiment_source ('llm' or 'local') per excerpt.
 # =====================================================================================
 
 # -------------------------------
 # Import Required Libraries
 # -------------------------------
 import pandas as pd  # Used for working with tabular data (Excel, CSV)
-#import openai  # Connects to OpenAI to run language model prompts
-from tqdm import tqdm  # Shows a progress bar when looping through data
 import json  # Helps handle responses in JSON format
 import os  # Allows for working with file paths
+import sys  # To import the shared LLM annotation engine
+import random  # Draws the pre-classifier's calibration sample
+import numpy as np  # Combines the pre-classifier's per-theme confidences
+
+# The concurrent, rate-limit-aware LLM client lives in the Thematic Analysis folder (see llm_annotation.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Thematic Analysis'))
+from llm_annotation import AnnotationEngine, annotation_from_result, parse_theme_annotations, is_valid_theme_annotation
+from llm_backend import OpenAIBackend, FakeBackend
+from response_cache import ResponseCache, normalize_excerpt
+from cost_governor import CostGovernor
+from annotation_checkpoint import AnnotationCheckpoint
+from sentiment_cascade import SentimentCascade, describe_agreement
 
 # -------------------------------
 # Define input/output paths
 # -------------------------------
-input_path = r'S:/Strategy Research/Transcripts/Data/Thematic Mentions/RAW Thematic Mentions_part1.xlsx'
-output_path = r'S:/Strategy Research/Transcripts/Data/Thematic Mentions/Processed Thematic Mentions.xlsx'
+input_path = r'S:/Strategy Research/Transcripts/Data/Thematic Mentions/RAW Thematic Mentions Dataset'
+output_path = r'S:/Strategy Research/Transcripts/Data/Thematic Mentions/Processed {theme} Mentions.xlsx'  # One file per theme
+
+# Annotate every theme in one run (False = only the first theme). An excerpt that hits several themes is sent
+# once with a multi-theme prompt, and its per-theme answers are fanned back out to each theme's output.
+process_all_themes = True
+
+# Every result is appended to the checkpoint as soon as it arrives; with resume = True a rerun after a crash
+# only sends the rows not yet in the checkpoint. Set resume = False to start over.
+checkpoint_folder = r'S:/Strategy Research/Transcripts/Data/Thematic Mentions/Checkpoints'
+resume = True
+
+# -------------------------------
+# LLM settings
+# -------------------------------
+# Requests run concurrently within your account's rate limits. For a dry run without credits or network, set
+# use_fake_llm = True (a local deterministic stand-in, see Thematic Analysis/llm_backend.py), or start
+# Thematic Analysis/mock_llm_server.py and set api_base = 'http://127.0.0.1:8011/v1'
+use_fake_llm = False
+api_key = None  # None reads the OPENAI_API_KEY environment variable
+api_base = 'https://api.openai.com/v1'
+max_concurrency = 16  # Requests in flight at once
+requests_per_minute = 500  # Your account's RPM limit for the model
+tokens_per_minute = 300000  # Your account's TPM limit for the model
+model = "gpt-4"  # You can use "gpt-3.5-turbo" if GPT-4 is unavailable
+temperature = 0.2  # Lower temperature = more consistent responses
+
+# Responses are cached by excerpt text, theme, prompt version, model and temperature, so reruns only pay for
+# new excerpts. Bump prompt_version whenever build_prompt changes.
+cache_path = r'S:/Strategy Research/Transcripts/Data/Thematic Mentions/LLM Response Cache.sqlite'
+prompt_version = 1
+
+# Batched prompts: up to batch_size excerpts share one prompt (the instructions are paid once per batch). Fewer go in
+# a batch when excerpts are long, keeping each request within max_batch_tokens (prompt + expected answers).
+use_batched_prompts = True
+batch_size = 10
+max_batch_tokens = 6000
+
+# Cost governor: tokens are counted with the model's tokenizer, every request reserves its cost before it is sent,
+# and the run stops cleanly at MAX_COST (the finished rows are still written)
+MAX_COST = 50  # 💸 Adjust your safety budget cap here (in USD)
+cost_input_per_1k = 0.01  # for GPT-4 Turbo
+cost_output_per_1k = 0.03
+expected_output_tokens = 150  # Reserved per excerpt until the actual usage is known
+
+# Local pre-classifier (Thematic Analysis/sentiment_cascade.py): a finance lexicon and a linear model, trained on the
+# sentiments the LLM already gave, answer the excerpts they are confident about for every theme; only the rest go to
+# the LLM. Locally answered rows get a sentiment but no subthemes, and sentiment_source says 'llm' or 'local'.
+# With too few LLM labels yet, a random calibration sample goes to the LLM first and the classifier is trained on it.
+use_local_cascade = True
+cascade_target_agreement = 0.9  # Agreement with the LLM required of the local answers (estimated on held-out labels)
+cascade_min_training = 300  # LLM labels (excerpt and theme pairs) needed before anything is answered locally
+cascade_calibration_size = 500  # Excerpts sent to the LLM first when there are too few labels
+cascade_audit_rate = 0.05  # Share of the confident excerpts still sent to the LLM, to measure agreement every run
+
+if use_fake_llm:
+    backend = FakeBackend(latency=0.2, error_rate=0.02)
+else:
+    backend = OpenAIBackend(api_key, model=model, temperature=temperature, api_base=api_base)
+
+# The backend's model name keys the cache, so fake answers never mix with real ones
+cache = ResponseCache(cache_path, model=backend.model, temperature=temperature, prompt_version=prompt_version)
+governor = CostGovernor(MAX_COST, cost_input_per_1k, cost_output_per_1k)
+engine = AnnotationEngine(backend=backend, max_concurrency=max_concurrency,
+                          requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                          expected_output_tokens=expected_output_tokens, cache=cache, governor=governor)
 
 # -------------------------------
 #%% Define Function to Analyze Each Transcript
 # -------------------------------
-def get_subthemes_and_sentiment(text, theme):
+def build_prompt(text, theme):
     """
-    Sends the transcript excerpt to the OpenAI LLM and extracts:
-    - Subthemes: 1–3 specific ideas within the broader theme
-    - Sentiment: A score between -1 and +1 (decimal allowed)
-    - Reasoning: One-sentence explanation for the sentiment
+    Creates the prompt asking the OpenAI LLM for the subthemes, sentiment and reasoning of one excerpt.
     """
     
     # Create the prompt that will be sent to the LLM
@@ -95,55 +167,119 @@ def get_subthemes_and_sentiment(text, theme):
         }}
     """
 
-    try:
-        # Send the prompt to the GPT-4 model
-        response = openai.ChatCompletion.create(
-            model="gpt-4",  # You can use "gpt-3.5-turbo" if GPT-4 is unavailable
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2  # Lower temperature = more consistent responses
-        )
-        
-        # Extract the model's response and clean it
-        content = response.choices[0].message["content"].strip()
-        if not content.startswith("{"):
-            content = content[content.find("{"):]  # Fix partial response issues
-
-        # Convert string response into JSON (Python dictionary)
-        result = json.loads(content)
-
-        # Return individual fields from the result
-        return result.get("subthemes", []), result.get("sentiment", ""), result.get("reasoning", "")
-    
-    except Exception as e:
+    return prompt
+
+def build_themes_prompt(text, themes):
+    """
+    Creates the prompt for one excerpt that mentions one or more themes; the LLM answers with subthemes, sentiment
+    and reasoning for each theme, so an excerpt hitting several themes is only sent once.
+    """
+
+    # Same instructions as build_prompt, answered per theme
+    prompt = f"""
+        You are a professional equity strategist analyzing earnings call transcripts for thematic trends.
+
+        For EACH theme listed, identify:
+        1. Subthemes (1–3) — short, specific concepts within that theme.
+        2. Sentiment — classified on a +1 to -1 scale, decimals allowed.
+        3. Reasoning — a brief explanation of why that sentiment was chosen.
+
+        Requirements:
+        - Respond ONLY in valid JSON format, with one entry per theme, using the theme names exactly as listed.
+        - Use precise phrases (e.g., ["Cost Reduction", "Internal GenAI Tools"])
+        - Avoid generic labels like "AI" or "Strategy"
+
+        Themes: {", ".join(themes)}
+
+        Here is the text to analyze: {text}
+
+        Respond only in this JSON format:
+        {{
+          "themes": {{
+            "<theme>": {{"subthemes": [...], "sentiment": "...", "reasoning": "..."}}
+          }}
+        }}
+    """
+
+    return prompt
+
+def build_themes_batch_prompt(excerpts, themes_by_id):
+    """
+    Creates one prompt for several excerpts. excerpts is a list of (id, text) and themes_by_id gives each id's
+    themes; the LLM answers with a JSON array holding one object per id.
+    """
+    excerpt_block = "\n\n".join(f'[{excerpt_id}] (themes: {", ".join(themes_by_id[excerpt_id])})\n"""{text}"""'
+                                 for excerpt_id, text in excerpts)
+
+    # Same instructions as build_themes_prompt, sent once for the whole batch
+    prompt = f"""
+        You are a professional equity strategist analyzing earnings call transcripts for thematic trends.
+
+        For EACH excerpt below and EACH theme listed with it, identify:
+        1. Subthemes (1–3) — short, specific concepts within that theme.
+        2. Sentiment — classified on a +1 to -1 scale, decimals allowed.
+        3. Reasoning — a brief explanation of why that sentiment was chosen.
+
+        Requirements:
+        - Respond ONLY with a valid JSON array, exactly one object per excerpt id.
+        - Analyze every excerpt on its own, with one entry per listed theme, using the theme names exactly as listed.
+        - Use precise phrases (e.g., ["Cost Reduction", "Internal GenAI Tools"])
+        - Avoid generic labels like "AI" or "Strategy"
+
+        Here are the excerpts to analyze, each tagged with its id and themes:
+{excerpt_block}
+
+        Respond only in this JSON format:
+        [
+          {{"id": "E1", "themes": {{"<theme>": {{"subthemes": [...], "sentiment": "...", "reasoning": "..."}}}}}},
+          ...
+        ]
+    """
+
+    return prompt
+
+def get_subthemes_and_sentiment(text, theme):
+    """
+    Sends the transcript excerpt to the OpenAI LLM and extracts:
+    - Subthemes: 1–3 specific ideas within the broader theme
+    - Sentiment: A score between -1 and +1 (decimal allowed)
+    - Reasoning: One-sentence explanation for the sentiment
+    Cached excerpts are answered from the response cache without an API call.
+    """
+    result = engine.annotate([build_prompt(text, theme)], [cache.key(text, theme)], show_progress=False)[0]
+    subthemes, sentiment, reasoning = annotation_from_result(result)
+    if sentiment == "Error":
         # Handle errors gracefully
-        print(f"❌ Error during LLM processing: {e}")
-        return [], "Error", str(e)
+        print(f"❌ Error during LLM processing: {reasoning}")
+    return subthemes, sentiment, reasoning
 
 # -------------------------------
-#%% Load Input Excel File
+#%% Load Mentions Dataset Manifest
 # -------------------------------
 print("Loading transcript data from:", input_path)
 
-# Check if the file exists before trying to load it
-if not os.path.exists(input_path):
-    raise FileNotFoundError(f"❌ File not found: {input_path}")
+# Check if the dataset exists before trying to load it
+manifest_path = os.path.join(input_path, '_manifest.json')
+if not os.path.exists(manifest_path):
+    raise FileNotFoundError(f"❌ Mentions dataset not found: {input_path}")
 
-# Read the Excel file into a pandas DataFrame
-raw_transcript_data = pd.read_excel(input_path)
+# The manifest lists every theme, its keyword count column and the dataset's columns
+with open(manifest_path, encoding='utf-8') as f:
+    manifest = json.load(f)
 
-# Check that required column exists in the file
-if "Combined Transcript" not in raw_transcript_data.columns:
-    raise KeyError("❌ Missing 'Combined Transcript' column in the input file")
+# Check that required column exists in the dataset
+if "Combined Transcript" not in manifest['columns']:
+    raise KeyError("❌ Missing 'Combined Transcript' column in the mentions dataset")
 
 # -------------------------------
-#%% Transform Excel File
+#%% Load Each Theme's Partition
 # -------------------------------
 
 # Initialize a blank dictionary to store filtered DataFrames by keyword
 raw_transcript_dict = {}
 
 # Identify all keyword columns (those ending in '_keyword_count')
-available_keywords = [col for col in raw_transcript_data.columns if col.endswith('_keyword_count')]
+available_keywords = manifest['count_columns']
 
 print(f"Found {len(available_keywords)} keyword columns.")
 
@@ -152,12 +288,11 @@ for keyword_col in available_keywords:
     # Extract the base theme name (remove the '_keyword_count' suffix)
     theme_name = keyword_col.replace('_keyword_count', '')
 
-    # Filter rows where the current keyword count is greater than 0
-    filtered_df = raw_transcript_data[raw_transcript_data[keyword_col] > 0].copy()
-
+    # Read only this theme's partition: every row already has keyword_col > 0
     # Optional: Keep only relevant columns for analysis
     columns_to_keep = ['Ticker', 'Company Name', 'Quarter', 'Combined Transcript', keyword_col]
-    filtered_df = filtered_df[[col for col in columns_to_keep if col in filtered_df.columns]]
+    filtered_df = pd.read_parquet(input_path, filters=[('theme', '==', theme_name)],
+                                  columns=[col for col in columns_to_keep if col in manifest['columns']])
 
     # Save filtered DataFrame to dictionary
     raw_transcript_dict[theme_name] = filtered_df
@@ -197,72 +332,222 @@ if proceed.lower() != "y":
     exit()
 
 # -------------------------------
-#%% Process All Rows for First Theme
+#%% Process Themes (Each Unique Excerpt Once)
 # -------------------------------
 
-# Get the first theme name and its associated DataFrame
-first_theme_col = available_keywords[0]
-theme_name = first_theme_col.replace("_keyword_count", "")
-transcript_data = raw_transcript_dict[theme_name]  # This will be processed
-print(f"🧠 Processing transcripts for theme: {theme_name}")
-
-# Initialize lists to hold model outputs
-all_subthemes = []
-all_sentiments = []
-all_reasonings = []
-
-# Initialize cost tracking
-total_cost = 0
-MAX_COST = 50  # 💸 Adjust your safety budget cap here (in USD)
-cost_input_per_1k = 0.01  # for GPT-4 Turbo
-cost_output_per_1k = 0.03
-
-# Loop through each transcript row using tqdm to track progress
-for idx, row in tqdm(transcript_data.iterrows(), total=len(transcript_data)):
-    text = row["Combined Transcript"]
-
-    # Estimate token counts (very rough: 1 word ~ 1.3 tokens)
-    estimated_input_tokens = len(text.split()) * 1.3
-    estimated_output_tokens = 150  # conservative estimate for JSON output
-
-    # Estimate cost for this row
-    cost_this_row = (estimated_input_tokens / 1000) * cost_input_per_1k + \
-                    (estimated_output_tokens / 1000) * cost_output_per_1k
-    total_cost += cost_this_row
-
-    # Budget cap check
-    if total_cost > MAX_COST:
-        print(f"❌ Stopping early due to budget cap of ${MAX_COST}. Reached ${total_cost:.2f}.")
-        break
-
-    # Run LLM analysis
-    sub, sen, rea = get_subthemes_and_sentiment(text, theme_name)
-
-    # Store the results
-    all_subthemes.append(", ".join(sub))  # Convert list to comma-separated string
-    all_sentiments.append(sen)
-    all_reasonings.append(rea)
-
-    # Optional progress print
-    if idx % 10 == 0:
-        print(f"[Row {idx}] Sentiment = {sen} | Subthemes = {sub}")
-
-    # Optional cost print
-    if idx % 50 == 0:
-        print(f"💰 Estimated total cost so far: ${total_cost:.2f}")
+# Pick the themes to annotate in this run
+first_theme_name = available_keywords[0].replace("_keyword_count", "")
+themes_to_process = list(raw_transcript_dict) if process_all_themes else [first_theme_name]
+
+# An excerpt that hits several themes appears in each theme's partition: group the copies by their normalised text
+excerpt_texts = {}  # normalised text -> excerpt text
+excerpt_themes = {}  # normalised text -> themes the excerpt hits
+for theme_name in themes_to_process:
+    for text in raw_transcript_dict[theme_name]["Combined Transcript"]:
+        excerpt = normalize_excerpt(text)
+        excerpt_texts.setdefault(excerpt, text)
+        if theme_name not in excerpt_themes.setdefault(excerpt, []):
+            excerpt_themes[excerpt].append(theme_name)
+
+theme_rows = sum(len(raw_transcript_dict[theme_name]) for theme_name in themes_to_process)
+print(f"🧠 Processing {len(themes_to_process)} themes: {theme_rows} theme rows -> {len(excerpt_texts)} unique excerpts")
+
+# Checkpoint ids are the (excerpt, theme) cache keys; an excerpt is only sent for the themes an earlier run has not
+# finished
+checkpoint = AnnotationCheckpoint(os.path.join(checkpoint_folder, "Theme Annotations.jsonl"), resume=resume)
+completed_ids = checkpoint.completed_ids()
+todo_texts = []
+todo_themes = []
+for excerpt, text in excerpt_texts.items():
+    missing_themes = [theme for theme in excerpt_themes[excerpt] if cache.key(text, theme) not in completed_ids]
+    if missing_themes:
+        todo_texts.append(text)
+        todo_themes.append(missing_themes)
+if len(todo_texts) < len(excerpt_texts):
+    print(f"⏯️ Resuming: {len(excerpt_texts) - len(todo_texts)} of {len(excerpt_texts)} excerpts already in the checkpoint")
+
+def llm_requests(texts, themes_list):
+    """Response cache keys and prompt builders of excerpts asked about their themes."""
+    # The response cache key covers the excerpt and the set of themes it is asked about
+    keys = [cache.key(text, "themes: " + ", ".join(themes)) for text, themes in zip(texts, themes_list)]
+    themes_of_text = dict(zip(texts, themes_list))
+    themes_by_id = {f"E{position}": themes for position, themes in enumerate(themes_list)}  # Batch ids are 'E' + position
+    single_prompt = lambda text: build_themes_prompt(text, themes_of_text[text])
+    batch_prompt = lambda excerpts: build_themes_batch_prompt(excerpts, themes_by_id)
+    return keys, single_prompt, batch_prompt
+
+def annotate_excerpts(texts, themes_list):
+    """Sends excerpts to the LLM and fans each answer out to its themes in the checkpoint."""
+    keys, single_prompt, batch_prompt = llm_requests(texts, themes_list)
+
+    def save_result(position, result):
+        """Fans one excerpt's answer out to its themes and appends them to the checkpoint (skipped rows are left out)."""
+        if result['skipped']:
+            return
+        try:
+            annotations = parse_theme_annotations(result['content']) if result['error'] is None else {}
+            error = result['error'] or "Theme missing from the LLM response"
+        except ValueError as e:
+            annotations, error = {}, str(e)
+        annotations = {theme.lower(): annotation for theme, annotation in annotations.items()}
+
+        text = texts[position]
+        for theme in themes_list[position]:
+            sub, sen, rea = annotations.get(theme.lower(), ([], "Error", error))
+            checkpoint.append(cache.key(text, theme), sub, sen, rea)
+
+    # Send the excerpts concurrently. Excerpts past the budget come back 'skipped'.
+    with checkpoint:
+        if use_batched_prompts:
+            engine.annotate_batched(texts, single_prompt, batch_prompt, keys, max_batch_size=batch_size,
+                                    max_batch_tokens=max_batch_tokens, on_result=save_result,
+                                    validate=is_valid_theme_annotation)
+            print(f"📡 LLM calls finished: {engine.batch_summary()}")
+        else:
+            prompts = [single_prompt(text) for text in texts]
+            engine.annotate(prompts, keys, validate=is_valid_theme_annotation, on_result=save_result)
+            print(f"📡 LLM calls finished: {engine.summary()}")
+
+# Local pre-classifier: trained on the LLM's (excerpt, theme) sentiments so far, with the theme as a feature
+cascade = SentimentCascade(cascade_target_agreement, cascade_min_training) if use_local_cascade else None
+local_results = {}  # (normalised excerpt, theme) -> (sentiment, confidence) answered by the pre-classifier
+audit_results = {}  # (normalised excerpt, theme) -> local sentiment of the confident excerpts also sent to the LLM
+
+def train_cascade():
+    """Trains the pre-classifier on the LLM's sentiments in the checkpoint."""
+    records = checkpoint.load()
+    pairs = [(text, theme, records[cache.key(text, theme)]["sentiment"]) for excerpt, text in excerpt_texts.items()
+             for theme in excerpt_themes[excerpt] if cache.key(text, theme) in records]
+    texts, themes, sentiments = zip(*pairs) if pairs else ((), (), ())
+    cascade.fit(texts, sentiments, themes)
+    print(f"🤖 Local pre-classifier: {cascade.describe_validation()}")
+    # The prompts ask for +1 to -1 scores: make sure the classifier can read the LLM's answers as labels
+    answered = sum(sentiment != "Error" for sentiment in sentiments)
+    if answered and cascade.training_examples < answered:
+        print(f"⚠️ The pre-classifier could not read {answered - cascade.training_examples:,} of {answered:,} LLM "
+              f"sentiments as a +1 to -1 score or class; check the sentiment format of the answers")
+
+def route_excerpts(texts, themes_list):
+    """
+    Answers the excerpts that are confident for every theme locally (kept in local_results) and returns the
+    (texts, themes) left for the LLM. An excerpt is only as confident as its least confident theme.
+    """
+    if cascade is None or not cascade.trained or not texts:
+        return texts, themes_list
+    pair_texts = [text for text, themes in zip(texts, themes_list) for _ in themes]
+    pair_themes = [theme for themes in themes_list for theme in themes]
+    sentiments, confidence = cascade.predict(pair_texts, pair_themes)
+    owner = np.repeat(np.arange(len(texts)), [len(themes) for themes in themes_list])
+    excerpt_confidence = np.full(len(texts), np.inf)
+    np.minimum.at(excerpt_confidence, owner, confidence)
+    local, audit = cascade.route(excerpt_confidence, cascade_audit_rate)
+
+    for position, text, theme, sentiment, pair_confidence in zip(owner, pair_texts, pair_themes, sentiments, confidence):
+        if local[position] and not audit[position]:
+            local_results[(normalize_excerpt(text), theme)] = (sentiment, pair_confidence)
+        elif audit[position]:
+            audit_results[(normalize_excerpt(text), theme)] = sentiment
+    llm = ~local | audit
+    print(f"🤖 {(~llm).sum()} of {len(texts)} excerpts answered locally; {llm.sum()} go to the LLM "
+          f"({audit.sum()} of them audits of confident excerpts)")
+    return [text for text, send in zip(texts, llm) if send], [themes for themes, send in zip(themes_list, llm) if send]
+
+# Route the excerpts: confident ones are answered locally. Without a trained classifier yet, a calibration sample
+# goes to the LLM first and the rest are routed once it is trained.
+calibration = []
+llm_texts, llm_themes = todo_texts, todo_themes
+if cascade is not None:
+    train_cascade()
+    if not cascade.trained and len(todo_texts) > cascade_calibration_size:
+        calibration = sorted(random.Random(0).sample(range(len(todo_texts)), cascade_calibration_size))
+        print(f"🎯 The pre-classifier is trained on a calibration sample of {len(calibration)} excerpts sent to the LLM first")
+    else:
+        llm_texts, llm_themes = route_excerpts(todo_texts, todo_themes)
+
+# Forecast the spend before sending anything (cached excerpts and local answers cost nothing)
+llm_keys, single_prompt, batch_prompt = llm_requests(llm_texts, llm_themes)
+forecast = engine.forecast(llm_texts, single_prompt, batch_prompt if use_batched_prompts else None, llm_keys,
+                           max_batch_size=batch_size, max_batch_tokens=max_batch_tokens)
+print(f"💰 Forecast: {governor.describe_forecast(forecast)}")
+if calibration:
+    print("   (an upper bound: excerpts the pre-classifier answers after the calibration sample cost nothing)")
+
+if calibration:
+    annotate_excerpts([todo_texts[i] for i in calibration], [todo_themes[i] for i in calibration])
+    train_cascade()
+    calibrated = set(calibration)
+    llm_texts, llm_themes = route_excerpts([text for i, text in enumerate(todo_texts) if i not in calibrated],
+                                           [themes for i, themes in enumerate(todo_themes) if i not in calibrated])
+annotate_excerpts(llm_texts, llm_themes)
+print(f"🗄️ Response cache: {cache.summary()}")
 
 # Done
-print(f"✅ Finished theme: {theme_name} | Total estimated cost: ${total_cost:.2f}")
+if governor.stopped:
+    print(f"❌ Stopped early due to budget cap of ${MAX_COST}.")
+print(f"✅ Finished {len(themes_to_process)} themes | Cost: {governor.summary()}")
 
 # -------------------------------
-#%%  Add LLM Results to the DataFrame
+#%% Add LLM Results to Each Theme and Save to Excel
 # -------------------------------
-transcript_data["subthemes"] = all_subthemes
-transcript_data["sentiment"] = all_sentiments
-transcript_data["reasoning"] = all_reasonings
 
-# -------------------------------
-#%% Save the Results to Excel
-# -------------------------------
-transcript_data.to_excel(output_path, index=False)
-print(f"\n✅ Output saved to: {output_path}")
+# Assemble this and earlier runs' results from the checkpoint, in each theme's row order
+records = checkpoint.load()
+
+# How often the local answers agree with the LLM, on the confident excerpts that were sent to the LLM as well
+if audit_results:
+    audited = [(excerpt, theme) for excerpt, theme in audit_results if cache.key(excerpt_texts[excerpt], theme) in records]
+    print("🤖 Pre-classifier audit: " + describe_agreement(
+        [audit_results[pair] for pair in audited],
+        [records[cache.key(excerpt_texts[excerpt], theme)]["sentiment"] for excerpt, theme in audited]))
+
+for theme_name in themes_to_process:
+    transcript_data = raw_transcript_dict[theme_name]
+
+    # Initialize lists to hold model outputs
+    all_subthemes = []
+    all_sentiments = []
+    all_reasonings = []
+    all_sources = []
+
+    for idx, text in enumerate(transcript_data["Combined Transcript"]):
+        key = cache.key(text, theme_name)
+
+        # Rows answered by the local pre-classifier have a sentiment only
+        local_key = (normalize_excerpt(text), theme_name)
+        if key not in records and local_key in local_results:
+            sen, confidence = local_results[local_key]
+            all_subthemes.append("")
+            all_sentiments.append(sen)
+            all_reasonings.append(f"Local pre-classifier ({confidence:.0%} confident)")
+            all_sources.append("local")
+            continue
+
+        # Rows skipped at the budget cap stay empty
+        if key not in records:
+            all_subthemes.append(None)
+            all_sentiments.append(None)
+            all_reasonings.append(None)
+            all_sources.append(None)
+            continue
+
+        sub, sen, rea = (records[key][field] for field in ("subthemes", "sentiment", "reasoning"))
+
+        # Store the results
+        all_subthemes.append(", ".join(sub))  # Convert list to comma-separated string
+        all_sentiments.append(sen)
+        all_reasonings.append(rea)
+        all_sources.append("llm")
+
+        # Optional progress print
+        if idx % 10 == 0:
+            print(f"[{theme_name} Row {idx}] Sentiment = {sen} | Subthemes = {sub}")
+
+    # One result per row, so the columns line up even when the budget cap stopped the run
+    transcript_data["subthemes"] = all_subthemes
+    transcript_data["sentiment"] = all_sentiments
+    transcript_data["reasoning"] = all_reasonings
+    transcript_data["sentiment_source"] = all_sources
+
+    theme_output_path = output_path.format(theme=theme_name)
+    transcript_data.to_excel(theme_output_path, index=False)
+    print(f"\n✅ Output saved to: {theme_output_path}")
@@ -29,7 +29,8 @@ Created on Thu Aug 29 11:54:49 2024
 # ============================================
 # INPUT FILES:
 # ============================================
-# - Transcripts by part: RAW Thematic Mentions_part*.xlsx OR RAW Thematic Mentions w Embedding+Sentiment_part*.xlsx
+# - Mentions: RAW Thematic Mentions Dataset (Parquet, partitioned by theme and quarter; only quarters from
+#   start_date's year are read) OR, with sentiment, RAW Thematic Mentions w Embedding+Sentiment_part*.xlsx
 # - Thematic keyword dictionary: Thematic Vocab.xlsx (each column is a theme, rows are keywords)
 # - Sector and size mapping: Tickers_ALL.xlsx (Sheet1)
 #
@@ -39,6 +40,8 @@ Created on Thu Aug 29 11:54:49 2024
 # (Saved as Excel files to S:/Strategy Research/Transcripts/Data/Thematic Mentions)
 # - Fig1 - Mentions by Quarter.xlsx
 # - Fig1a - Topic Mentions by Quarter and Sector.xlsx
+# - Fig1b - Mentions by Quarter and Section.xlsx (Management vs Q&A mentions, if the dataset has the split)
+# - Fig1c - Intensity by Quarter.xlsx (mentions per 10k words spoken, if the dataset has transcript lengths)
 # - Fig2 - Heatmap by Quarter and Sector.xlsx
 # - Fig2a - Topic Mentions by Quarter and Size.xlsx
 # - Fig3 - % Mention by Quarter.xlsx
@@ -77,6 +80,7 @@ sentiment_run = False
 # File Paths
 keyword_file_path = r'S:\Strategy Research\Transcripts\Additional\Themes\Thematic Vocab.xlsx'
 base_directory = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions'
+mentions_dataset_dir = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\RAW Thematic Mentions Dataset'
 sector_file_path = r'S:\Strategy Research\Transcripts\Additional\Tickers_ALL.xlsx'
 
 # File Patterns for Import
@@ -118,9 +122,37 @@ def import_all_parts(directory, sentiment_run):
     print(f"Successfully loaded {len(df_list)} files.")
     return pd.concat(df_list, ignore_index=True)
 
+def import_mentions_dataset(dataset_dir, start_date):
+    """Load the partitioned mentions dataset, reading only the quarter partitions from start_date on"""
+    if not os.path.isdir(dataset_dir):
+        raise FileNotFoundError(f"Mentions dataset not found at {dataset_dir}")
+
+    # Quarter labels run on a shifted calendar (e.g. March 2021 is labelled Q4 '21), so read from the first
+    # calendar quarter of start_date's year; rows before start_date are dropped by the figures as before
+    first_quarter = f"{start_date.year}Q1"
+    df = pd.read_parquet(dataset_dir, filters=[('quarter', '>=', first_quarter)])
+
+    # An excerpt with hits for several themes is stored once per theme partition
+    df = df.drop_duplicates('Excerpt ID').sort_values('Excerpt ID')
+    print(f"Loaded {len(df):,} excerpts from {dataset_dir} (quarters >= {first_quarter}).")
+    return df.drop(columns=['theme', 'quarter', 'Excerpt ID']).reset_index(drop=True)
+
+def import_transcript_stats(dataset_dir):
+    """Load the words / sentences / theme counts of every transcript (with or without mentions), if present"""
+    stats_path = os.path.join(dataset_dir, '_transcript_stats.parquet')
+    if not os.path.exists(stats_path):
+        return pd.DataFrame()
+    stats_df = pd.read_parquet(stats_path)
+    stats_df['Date'] = pd.to_datetime(stats_df['Date'], errors='coerce')
+    return stats_df
+
 # Import Data
 try:
-    transcripts_chunks = import_all_parts(base_directory, sentiment_run)
+    if sentiment_run:
+        transcripts_chunks = import_all_parts(base_directory, sentiment_run)
+    else:
+        transcripts_chunks = import_mentions_dataset(mentions_dataset_dir, start_date)
+    transcript_stats_df = pd.DataFrame() if sentiment_run else import_transcript_stats(mentions_dataset_dir)
     if 'Glove Embedding' in transcripts_chunks.columns:
         transcripts_chunks = transcripts_chunks.drop(columns=['Glove Embedding'])
         print("Glove Embeddings Removed")
@@ -129,6 +161,7 @@ try:
 except FileNotFoundError as e:
     print(e)
     transcripts_chunks = pd.DataFrame()
+    transcript_stats_df = pd.DataFrame()
 
 # Import Thematic Vocabulary
 try:
@@ -247,6 +280,45 @@ mentions_by_quarter = pd.concat(quarterly_rows, ignore_index=True)
 # Export Thematic Mention Count By Quarter
 mentions_by_quarter.to_excel(export_fig1_file_path, index=False)
 
+### Fig 1 By Section (Management vs Q&A) ###
+
+# Define Export File Path
+export_section_fig1_file_path = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\Fig1b - Mentions by Quarter and Section.xlsx'
+
+# Unprompted (Management remarks) vs analyst-prompted (Q&A) mentions of each theme per quarter
+section_themes = [theme for theme in themes
+                  if f'{theme}_mgmt' in transcripts_chunks.columns and f'{theme}_qa' in transcripts_chunks.columns]
+if section_themes:
+    with pd.ExcelWriter(export_section_fig1_file_path, engine='xlsxwriter') as writer:
+        for theme in section_themes:
+            section_df = transcripts_chunks.groupby('Quarter_Label')[[f'{theme}_mgmt', f'{theme}_qa']].sum()
+            section_df.columns = ['Management', 'Q&A']
+
+            # Same quarter order as the other figures, from start_date on
+            section_df['Quarter_Date'] = section_df.index.map(parse_quarter_label)
+            section_df = section_df[section_df['Quarter_Date'] >= start_date].sort_values('Quarter_Date')
+            section_df['Management Share'] = section_df['Management'] / (section_df['Management'] + section_df['Q&A'])
+            section_df.drop(columns=['Quarter_Date']).to_excel(writer, sheet_name=theme[:31])
+
+### Fig 1 Intensity (mentions per 10k words) ###
+
+# Define Export File Path
+export_intensity_fig1_file_path = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\Fig1c - Intensity by Quarter.xlsx'
+
+# Raw counts grow with the number and length of calls; dividing by the words spoken in every call of the quarter
+# (including calls without a mention) gives a length-normalised intensity that is comparable across quarters
+if not transcript_stats_df.empty:
+    intensity_df = transcript_stats_df[transcript_stats_df['Date'] >= start_date].copy()
+    intensity_df['Quarter_Label'] = intensity_df['Date'].apply(get_quarter_label)
+    intensity_themes = [theme for theme in themes if theme in intensity_df.columns]
+    quarterly_intensity = intensity_df.groupby('Quarter_Label')[['Words'] + intensity_themes].sum()
+    for theme in intensity_themes:
+        quarterly_intensity[theme.replace('_keyword_count', '_mentions_per_10k_words')] = (
+            quarterly_intensity[theme] * 10000 / quarterly_intensity['Words'])
+    quarterly_intensity['Quarter_Date'] = quarterly_intensity.index.map(parse_quarter_label)
+    quarterly_intensity = quarterly_intensity.sort_values('Quarter_Date').drop(columns=['Quarter_Date'] + intensity_themes)
+    quarterly_intensity.to_excel(export_intensity_fig1_file_path)
+
 ### Fig 1 By Sector ###
 
 # Define Export File Path
@@ -16,6 +16,8 @@ Created on Mon Apr 14 14:18:24 2025
 # - View how often that theme was mentioned each quarter (overall)
 # - View how frequently it's mentioned *by sector*, normalized to highlight
 #   which sectors are relatively more engaged each quarter.
+# - See which keywords of the theme drive the mentions, and read sample
+#   excerpts with the matched keywords highlighted.
 #
 # You can run this script in a Python IDE or terminal, and then interact
 # with the dashboard in your web browser.
@@ -29,30 +31,37 @@ import dash                       # Main Dash library for building the dashboard
 from dash import dcc, html        # Dash components for layout
 from dash.dependencies import Input, Output  # For callbacks
 import socket                     # To print your local IP address for access
+import json                       # To read the mentions dataset manifest
+import os                         # For building file paths
+import numpy as np                # For the keyword-level hit arrays
 
 # ==========================================
 #  Step 1: Load and Process Data
 # ==========================================
-# Define the Excel file that contains keyword mentions
-input_path = r'S:/Strategy Research/Transcripts/Data/Thematic Mentions/RAW Thematic Mentions_part1.xlsx'
+# Define the mentions dataset written by 01_Keyword_Filter.py (Parquet, one folder per theme and quarter)
+input_path = r'S:/Strategy Research/Transcripts/Data/Thematic Mentions/RAW Thematic Mentions Dataset'
 
-# Load the Excel file
-raw_transcript_data = pd.read_excel(input_path)
+# The manifest lists the themes and their keyword count columns (ending with '_keyword_count')
+with open(os.path.join(input_path, '_manifest.json'), encoding='utf-8') as f:
+    manifest = json.load(f)
 
-# Identify which columns represent theme keyword counts (ending with '_keyword_count')
-available_keywords = [col for col in raw_transcript_data.columns if col.endswith('_keyword_count')]
+# Keyword-level hits: every excerpt stores which keyword matched where (ids resolved with the manifest's keyword table)
+hit_columns = ['Hit Keyword IDs', 'Hit Theme IDs', 'Hit Starts', 'Hit Ends']
+keyword_names = {entry['id']: entry['keyword'] for entry in manifest.get('keywords', [])}
+theme_ids = {entry['theme']: entry['theme_id'] for entry in manifest.get('keywords', [])}
+
+# Number of sample excerpts shown with highlighted keywords
+n_sample_excerpts = 5
 
 # Initialize a dictionary to store filtered data for each theme
 raw_transcript_dict = {}
 
-# Loop over each keyword column and preprocess the data
-for keyword_col in available_keywords:
-    theme = keyword_col.replace('_keyword_count', '')  # Extract theme name
-    df = raw_transcript_data[raw_transcript_data[keyword_col] > 0].copy()
-
+# Loop over each theme and load only its partition (every row already has a hit for that theme)
+for theme, keyword_col in manifest['themes'].items():
     # Keep only necessary columns
-    columns_to_keep = ['Ticker', 'Company Name', 'Date', 'Sector', 'Combined Transcript', keyword_col]
-    df = df[[col for col in columns_to_keep if col in df.columns]]
+    columns_to_keep = ['Ticker', 'Company Name', 'Date', 'Sector', 'Combined Transcript', keyword_col] + hit_columns
+    df = pd.read_parquet(input_path, filters=[('theme', '==', theme)],
+                         columns=[col for col in columns_to_keep if col in manifest['columns']])
 
     # Parse and clean the Date column
     df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
@@ -99,8 +108,14 @@ app.layout = html.Div([
     # Second chart: Sector-clustered normalized mentions chart
     dcc.Graph(id="mentions-by-sector-chart"),
 
-    # Summary block at the bottom
-    html.Div(id="mention-summary", style={"padding": "20px", "fontSize": "16px"})
+    # Third chart: Keywords driving the theme's mentions
+    dcc.Graph(id="top-keywords-chart"),
+
+    # Summary block
+    html.Div(id="mention-summary", style={"padding": "20px", "fontSize": "16px"}),
+
+    # Sample excerpts with the matched keywords highlighted
+    html.Div(id="sample-excerpts", style={"padding": "20px"})
 
 ])
 
@@ -111,12 +126,15 @@ app.layout = html.Div([
 # Here, when the dropdown value changes, we'll update:
 #   - The mentions-over-time chart
 #   - The sector-level normalized chart
-#   - The summary text
+#   - The top keywords chart
+#   - The summary text and the highlighted sample excerpts
 
 @app.callback(
     Output("mentions-over-time-chart", "figure"),
     Output("mentions-by-sector-chart", "figure"),
+    Output("top-keywords-chart", "figure"),
     Output("mention-summary", "children"),
+    Output("sample-excerpts", "children"),
     Input("theme-dropdown", "value")
 )
 def update_charts(selected_theme):
@@ -166,6 +184,29 @@ def update_charts(selected_theme):
     else:
         fig_sector = {}
 
+    # -------------------------------
+    # Chart 3: Top Keywords
+    # -------------------------------
+    has_hits = "Hit Keyword IDs" in df.columns and selected_theme in theme_ids
+    if has_hits:
+        # Flatten the per-excerpt hit arrays and keep the hits of the selected theme
+        all_keyword_ids = np.concatenate(df["Hit Keyword IDs"].to_list() + [np.empty(0, dtype=np.uint32)])
+        all_theme_ids = np.concatenate(df["Hit Theme IDs"].to_list() + [np.empty(0, dtype=np.uint16)])
+        theme_keyword_ids = all_keyword_ids[all_theme_ids == theme_ids[selected_theme]]
+
+        top_keywords = (pd.Series(theme_keyword_ids).map(keyword_names).value_counts()
+                        .head(20).rename_axis("Keyword").reset_index(name="Mentions"))
+        fig_keywords = px.bar(
+            top_keywords,
+            x="Mentions",
+            y="Keyword",
+            orientation="h",
+            title=f"Top Keywords for '{selected_theme}'",
+        )
+        fig_keywords.update_layout(yaxis={"categoryorder": "total ascending"})
+    else:
+        fig_keywords = {}
+
     # -------------------------------
     # Summary Section
     # -------------------------------
@@ -173,7 +214,31 @@ def update_charts(selected_theme):
     unique_companies = df["Ticker"].nunique()
     summary = f"Total mentions: {total_mentions:,} across {unique_companies:,} unique companies."
 
-    return fig_time, fig_sector, summary
+    # -------------------------------
+    # Sample Excerpts (highlighted)
+    # -------------------------------
+    samples = []
+    if has_hits:
+        for _, row in df.sort_values("Date", ascending=False).head(n_sample_excerpts).iterrows():
+            samples.append(html.P([
+                html.B(f"{row['Ticker']} ({row['Date']:%Y-%m-%d}): "),
+                *highlight_hits(row, theme_ids[selected_theme])
+            ]))
+
+    return fig_time, fig_sector, fig_keywords, summary, samples
+
+
+def highlight_hits(row, theme_id):
+    """Splits an excerpt into text and <mark> pieces at the offsets of the theme's keyword hits."""
+    text = row["Combined Transcript"]
+    pieces, position = [], 0
+    for start, end, hit_theme in zip(row["Hit Starts"], row["Hit Ends"], row["Hit Theme IDs"]):
+        if hit_theme != theme_id or start < position:
+            continue
+        pieces += [text[position:start], html.Mark(text[start:end])]
+        position = end
+    pieces.append(text[position:])
+    return pieces
 
 # ==========================================
 # ▶️ Run the App
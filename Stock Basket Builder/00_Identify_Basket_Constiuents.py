@@ -20,12 +20,14 @@ Created on Sun Apr  6 17:37:49 2025
 # -----------------------------------------------------------------------------
 #
 # INPUT REQUIREMENTS:
-# The input must be an Excel file with the following columns:
+# The input is the partitioned mentions dataset written by 01_Keyword_Filter.py (Parquet) with the following columns:
 # - Ticker: Unique identifier
 # - Company Name: Company name
 # - Date: Report date
 # - Transcript text columns
 # - One or more *_keyword_count columns (e.g., AI_keyword_count)
+# - Their Management / Q&A split (e.g., ai_keyword_count_mgmt, ai_keyword_count_qa), if present
+# - _transcript_stats.parquet (words per transcript), used to turn mentions into mentions per 10k words
 #
 # Default file path (can be changed in the script):
 # file_path = "S:/Strategy Research/Transcripts/Data/Excel/Raw Tariff Mentions.xlsx"
@@ -37,6 +39,7 @@ Created on Sun Apr  6 17:37:49 2025
 import pandas as pd
 import numpy as np
 import os
+import json
 import warnings
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
@@ -50,18 +53,45 @@ warnings.filterwarnings("ignore")
 #%% STEP 1: LOAD & PREPARE TRANSCRIPT DATA
 # -------------------------------------------
 
-import_path = "S:/Strategy Research/Transcripts/Data/Thematic Mentions/Raw Thematic Mentions_part1.xlsx"
+import_path = "S:/Strategy Research/Transcripts/Data/Thematic Mentions/RAW Thematic Mentions Dataset"
 export_path = "S:/Strategy Research/Transcripts/Data/Thematic Mentions/Thematic Basket Constiuents.xlsx"
 
-if not os.path.exists(import_path):
-    raise FileNotFoundError(f"Excel file not found at {import_path}")
+# Weight of unprompted (Management remarks) vs analyst-prompted (Q&A) mentions in Theme_Mentions.
+# Equal weights reproduce the plain keyword counts; e.g. {"mgmt": 1.0, "qa": 0.5} favours companies raising a theme themselves
+section_weights = {"mgmt": 1.0, "qa": 1.0}
 
-df = pd.read_excel(import_path)
+if not os.path.exists(import_path):
+    raise FileNotFoundError(f"Mentions dataset not found at {import_path}")
+
+# Read only the columns the clustering needs (no excerpt text); an excerpt with hits for several themes is
+# stored once per theme partition, so keep one copy of each
+with open(os.path.join(import_path, "_manifest.json"), encoding="utf-8") as f:
+    manifest = json.load(f)
+section_columns = manifest.get("section_columns", {})
+section_cols = [col for sections in section_columns.values() for col in sections.values()]
+df = pd.read_parquet(import_path, columns=["Excerpt ID", "Ticker", "Company Name", "Date"] + manifest["count_columns"]
+                     + section_cols)
+df = df.drop_duplicates("Excerpt ID").drop(columns=["Excerpt ID"])
 df = df[pd.to_datetime(df["Date"], errors='coerce').notna()]
 df["Date"] = pd.to_datetime(df["Date"], errors='coerce')
 df["Quarter"] = df["Date"].dt.to_period("Q").astype(str)
 
 keyword_cols = [col for col in df.columns if col.endswith("_keyword_count")]
+
+# Words spoken per company and quarter (all transcripts, including those without any mention), so mentions can
+# be length-normalised: a 2-hour call no longer looks more engaged than a 40-minute one just for being longer
+if "transcript_stats" in manifest:
+    stats_df = pd.read_parquet(os.path.join(import_path, manifest["transcript_stats"]), columns=["Ticker", "Date", "Words"])
+    stats_df["Quarter"] = pd.to_datetime(stats_df["Date"], errors='coerce').dt.to_period("Q").astype(str)
+    words_by_quarter = stats_df.groupby(["Ticker", "Quarter"])["Words"].sum()
+else:
+    words_by_quarter = None
+
+# Replace each theme's count with its section-weighted count where the dataset has the Management / Q&A split
+for theme_col in keyword_cols:
+    sections = section_columns.get(theme_col.replace("_keyword_count", ""), {})
+    if len(sections) == len(section_weights):
+        df[theme_col] = sum(df[col] * section_weights[section] for section, col in sections.items())
 print("[INFO] Data Imported")
 
 # -------------------------------------------
@@ -96,6 +126,14 @@ for theme_col in keyword_cols:
     total_by_quarter = theme_df.groupby("Quarter")["Theme_Mentions"].transform("sum")
     theme_df["Share_Mentions"] = theme_df["Theme_Mentions"] / total_by_quarter
 
+    # Intensity: mentions per 10k words the company spoke that quarter
+    if words_by_quarter is not None:
+        words = words_by_quarter.reindex(pd.MultiIndex.from_frame(theme_df[["Ticker", "Quarter"]])).to_numpy()
+        theme_df["Mention_Intensity"] = np.nan_to_num(theme_df["Theme_Mentions"].to_numpy() * 10000 / words,
+                                                      nan=0.0, posinf=0.0)
+    else:
+        theme_df["Mention_Intensity"] = 0.0
+
     # Sort for momentum calculation
     theme_df = theme_df.sort_values(["Ticker", "Quarter"])
     
@@ -108,11 +146,12 @@ for theme_col in keyword_cols:
     ).replace([np.inf, -np.inf], 0).fillna(0)
 
     # Define numeric features
-    feature_cols = ["Theme_Mentions", "Share_Mentions", "Mention_Momentum"]
+    feature_cols = ["Theme_Mentions", "Share_Mentions", "Mention_Momentum", "Mention_Intensity"]
 
-    # Log transform mentions and share to reduce skew
+    # Log transform mentions, share and intensity to reduce skew
     theme_df["Theme_Mentions"] = np.log1p(theme_df["Theme_Mentions"])
     theme_df["Share_Mentions"] = np.log1p(theme_df["Share_Mentions"])
+    theme_df["Mention_Intensity"] = np.log1p(theme_df["Mention_Intensity"])
     
     # Cap momentum to avoid outliers dominating the score (e.g. within +/-5 range)
     # theme_df["Mention_Momentum"] = theme_df["Mention_Momentum"].clip(lower=-5, upper=5)
@@ -121,15 +160,17 @@ for theme_col in keyword_cols:
     theme_df["Mention_Momentum"] = np.tanh(theme_df["Mention_Momentum"])  # compress but retain direction
 
     
-    # Prepare features for scoring
+    # Prepare features for scoring (intensity only when the dataset has transcript lengths)
     feature_cols = ["Theme_Mentions", "Share_Mentions", "Mention_Momentum"]
+    if words_by_quarter is not None:
+        feature_cols.append("Mention_Intensity")
     X = theme_df[feature_cols].values
     
     # Standardize features
     X_scaled = StandardScaler().fit_transform(X)
     
     # Assign custom weights if desired (equal weights for now)
-    weights = np.array([1.0, 1.0, 1.0])
+    weights = np.ones(len(feature_cols))
     theme_df["Engagement_Score"] = (X_scaled @ weights) / weights.sum()
     
     # Mark top 100 per quarter
@@ -214,7 +255,7 @@ for theme_col in keyword_cols:
 
     # Save relevant columns
     final_cols = ["Ticker", "Company Name", "Quarter", "Theme", "Theme_Mentions",
-                  "Share_Mentions", "Mention_Momentum", "Engagement_Score", "Thematic_Engaged"]
+                  "Share_Mentions", "Mention_Momentum", "Mention_Intensity", "Engagement_Score", "Thematic_Engaged"]
     all_outputs.append(theme_df[final_cols])
 
 # -------------------------------------------
@@ -228,7 +269,7 @@ print("[INFO] Final thematic baskets created")
 with pd.ExcelWriter(export_path, engine="xlsxwriter") as writer:
     for theme_name, group in final_df.groupby("Theme"):
         export_cols = ["Quarter", "Ticker", "Company Name", "Theme_Mentions", 
-                       "Share_Mentions", "Mention_Momentum", "Engagement_Score", "Thematic_Engaged"]
+                       "Share_Mentions", "Mention_Momentum", "Mention_Intensity", "Engagement_Score", "Thematic_Engaged"]
         group[export_cols].to_excel(writer, sheet_name=theme_name[:31], index=False)
 
 print("[INFO] Excel export completed")
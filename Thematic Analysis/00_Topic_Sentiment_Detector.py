@@ -9,28 +9,106 @@ Created on Fri Apr 11 21:16:47 2025
 # 📚 Import necessary libraries
 # -------------------------------
 import pandas as pd
-import openai
-from tqdm import tqdm
-import json
 import os
+import sys
+import random
+
+# Make the helper modules in this folder importable when run from Spyder or another working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from llm_annotation import AnnotationEngine, annotation_from_result
+from llm_backend import OpenAIBackend, FakeBackend
+from response_cache import ResponseCache
+from cost_governor import CostGovernor
+from annotation_checkpoint import AnnotationCheckpoint
+from sentiment_cascade import SentimentCascade, read_llm_labels, describe_agreement
 
 # -------------------------------
 # STEP 1: Set your Topic, OpenAI API 🔐, and Define 📁 Paths
 # -------------------------------
 
 current_theme = 'AI' # Replace with your Current Theme
-openai.api_key = "YOUR_OPENAI_API_KEY" # Replace with your actual API key
+api_key = "YOUR_OPENAI_API_KEY" # Replace with your actual API key
 input_path = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\RAW {current_theme} Mentionss.xlsx'  
+mentions_dataset_path = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\RAW Thematic Mentions Dataset'
+use_mentions_dataset = True  # Read the theme's partition of the mentions dataset instead of input_path
+quarter_range = None  # Optional ('YYYYQn', 'YYYYQn') range of calendar quarters to annotate, e.g. ('2024Q1', '2024Q4')
 output_path = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\Proccessed {current_theme} Mentionss.xlsx'  
 
+# Every result is appended to the checkpoint as soon as it arrives; with resume = True a rerun after a crash only
+# sends the rows not yet in the checkpoint. Set resume = False to start over.
+checkpoint_path = rf'S:\Strategy Research\Transcripts\Data\Thematic Mentions\Checkpoints\{current_theme} Annotations.jsonl'
+resume = True
+
+# LLM settings: requests run concurrently within your account's rate limits (see llm_annotation.py).
+# For a dry run without credits or network, set use_fake_llm = True (a local deterministic stand-in, see
+# llm_backend.py), or start mock_llm_server.py and set api_base = 'http://127.0.0.1:8011/v1'
+use_fake_llm = False
+model = "gpt-4"  # Use gpt-3.5-turbo for faster, cheaper runs
+api_base = 'https://api.openai.com/v1'
+max_concurrency = 16  # Requests in flight at once
+requests_per_minute = 500  # Your account's RPM limit for the model
+tokens_per_minute = 300000  # Your account's TPM limit for the model
+temperature = 0.2  # Low temperature = deterministic, reproducible answers
+
+# Responses are cached by excerpt text, prompt version, model and temperature, so reruns only pay for new excerpts.
+# Bump prompt_version whenever build_prompt changes.
+cache_path = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\LLM Response Cache.sqlite'
+prompt_version = 1
+
+# Batched prompts: up to batch_size excerpts share one prompt (the instructions are paid once per batch). Fewer go in
+# a batch when excerpts are long, keeping each request within max_batch_tokens (prompt + expected answers).
+use_batched_prompts = True
+batch_size = 10
+max_batch_tokens = 6000
+
+# Cost: the run's tokens are forecast before you confirm it, and the actual spend is tracked from the API's usage.
+# With max_cost set, the run stops cleanly at the budget and the rows it finished are still saved.
+max_cost = None  # Optional budget cap in USD
+cost_input_per_1k = 0.03  # GPT-4 prices per 1,000 tokens
+cost_output_per_1k = 0.06
+
+# Local pre-classifier (sentiment_cascade.py): a finance lexicon and a linear model, trained on the sentiments the LLM
+# already gave, answer the excerpts they are confident about; only the rest go to the LLM. Locally answered rows get
+# a sentiment but no subthemes, and the sentiment_source column says which rows came from 'llm' and which 'local'.
+# With too few LLM labels yet, a random calibration sample goes to the LLM first and the classifier is trained on it.
+use_local_cascade = True
+cascade_target_agreement = 0.9  # Agreement with the LLM required of the local answers (estimated on held-out labels)
+cascade_min_training = 300  # LLM labels needed before any excerpt is answered locally
+cascade_calibration_size = 500  # Excerpts sent to the LLM first when there are too few labels
+cascade_audit_rate = 0.05  # Share of the confident excerpts still sent to the LLM, to measure agreement every run
+cascade_training_paths = []  # Earlier processed outputs to learn from as well, e.g. [r'S:\...\Proccessed Tariffs Mentionss.xlsx']
+
+if use_fake_llm:
+    backend = FakeBackend(latency=0.2, error_rate=0.02)
+else:
+    backend = OpenAIBackend(api_key, model=model, temperature=temperature, api_base=api_base)
+
+# The backend's model name keys the cache, so fake answers never mix with real ones
+cache = ResponseCache(cache_path, model=backend.model, temperature=temperature, prompt_version=prompt_version)
+governor = CostGovernor(max_cost, cost_input_per_1k, cost_output_per_1k)
+engine = AnnotationEngine(backend=backend, max_concurrency=max_concurrency, requests_per_minute=requests_per_minute,
+                          tokens_per_minute=tokens_per_minute, cache=cache, governor=governor)
+
 # -------------------------------
 #%% 📥 STEP 2: Load the Excel data
 # -------------------------------
-print("📥 Loading transcript mentions from Excel...")
-if not os.path.exists(input_path):
-    raise FileNotFoundError(f"❌ File not found at path: {input_path}")
-
-df = pd.read_excel(input_path)
+if use_mentions_dataset:
+    # Only the current theme's (and quarters') partition files are read; each row has a hit for the theme
+    print("📥 Loading transcript mentions from the mentions dataset...")
+    if not os.path.exists(mentions_dataset_path):
+        raise FileNotFoundError(f"❌ Dataset not found at path: {mentions_dataset_path}")
+
+    dataset_filters = [('theme', '==', current_theme.replace(' ', '_').lower())]
+    if quarter_range is not None:
+        dataset_filters += [('quarter', '>=', quarter_range[0]), ('quarter', '<=', quarter_range[1])]
+    df = pd.read_parquet(mentions_dataset_path, filters=dataset_filters)
+    df = df.drop(columns=['theme', 'quarter']).rename(columns={'Combined Transcript': 'transcript_text'})
+else:
+    print("📥 Loading transcript mentions from Excel...")
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"❌ File not found at path: {input_path}")
+
+    df = pd.read_excel(input_path)
 
 # Preview the first few rows
 print("\n✅ Preview of loaded data:")
@@ -43,14 +121,9 @@ if "transcript_text" not in df.columns:
 # -------------------------------
 #%% 🧠 STEP 3: Define function to extract subthemes + sentiment
 # -------------------------------------------------------------
-def get_subthemes_and_sentiment(text):
+def build_prompt(text):
     """
-    Given one transcript excerpt, this sends a well-structured prompt to the OpenAI model (GPT-4 or 3.5).
-    
-    It returns:
-    - subthemes: A list of specific subtopics or angles mentioned in the passage
-    - sentiment: "Positive", "Neutral", or "Negative" tone classification
-    - reasoning: A short natural-language rationale explaining why that sentiment was chosen
+    Builds the well-structured prompt for one transcript excerpt that is sent to the OpenAI model (GPT-4 or 3.5).
     """
 
     # -----------------------------
@@ -84,37 +157,59 @@ Respond only in the following JSON format:
 }}
 """
 
-    try:
-        # Send prompt to OpenAI and get response
-        response = openai.ChatCompletion.create(
-            model="gpt-4",  # Use gpt-3.5-turbo for faster, cheaper runs
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2  # Low = deterministic, reproducible answers
-        )
+    return prompt
 
-        # Extract the actual message text from the response
-        content = response.choices[0].message["content"].strip()
 
-        # Optional: Check that the response begins with '{' to ensure clean JSON
-        # This can prevent parsing errors if the model adds extra explanation
-        if not content.startswith("{"):
-            json_start = content.find("{")
-            content = content[json_start:]
+def build_batch_prompt(excerpts):
+    """
+    Builds one prompt for several excerpts. excerpts is a list of (id, text); the model answers with a JSON array
+    holding one object per id.
+    """
+    excerpt_block = "\n\n".join(f'[{excerpt_id}]\n"""{text}"""' for excerpt_id, text in excerpts)
 
-        # Parse the JSON string into a Python dictionary
-        result = json.loads(content)
+    prompt = f"""
+You are a professional equity strategist analyzing earnings call transcripts for thematic trends.
 
-        # Extract relevant fields, providing defaults in case any are missing
-        subthemes = result.get("subthemes", [])
-        sentiment = result.get("sentiment", "")
-        reasoning = result.get("reasoning", "")
+For EACH excerpt below, identify:
+1. Subthemes (1–3) — These are specific, concrete ideas or concepts within the broader topic being discussed. Use concise noun phrases.
+2. Sentiment — Classify tone as one of the following:
+   - "Positive" if the language is optimistic, confident, or constructive.
+   - "Negative" if the language is concerned, cautious, or pessimistic.
+   - "Neutral" if the tone is factual, mixed, or uncertain.
+3. Reasoning — Explain briefly (in one sentence) *why* the sentiment is what it is, referencing the tone or intent in the statement.
 
-        return subthemes, sentiment, reasoning
+Requirements:
+- Analyze every excerpt on its own; return exactly one object per excerpt id
+- Keep subthemes short and specific (e.g., ["Cost Reduction", "Internal GenAI Tools"])
+- Avoid generalities like "AI", "Strategy", "Technology"
+
+Here are the excerpts to analyze, each tagged with its id:
+{excerpt_block}
 
-    except Exception as e:
-        # Gracefully handle API errors, parsing issues, or formatting problems
-        print(f"⚠️ Error during LLM processing: {e}")
-        return [], "Error", str(e)
+Respond only with a valid JSON array in the following format:
+[
+  {{"id": "E1", "subthemes": [...], "sentiment": "...", "reasoning": "..."}},
+  ...
+]
+"""
+
+    return prompt
+
+
+def get_subthemes_and_sentiment(text):
+    """
+    Given one transcript excerpt, this sends the prompt from build_prompt to the model.
+    
+    It returns:
+    - subthemes: A list of specific subtopics or angles mentioned in the passage
+    - sentiment: "Positive", "Neutral", or "Negative" tone classification
+    - reasoning: A short natural-language rationale explaining why that sentiment was chosen
+    
+    API errors, parsing issues and formatting problems return ([], "Error", message).
+    The response cache is checked first, so a cached excerpt costs nothing.
+    """
+    result = engine.annotate([build_prompt(text)], [cache.key(text)], show_progress=False)[0]
+    return annotation_from_result(result)
 
 
 # -------------------------------
@@ -133,6 +228,70 @@ print("Subthemes:", sample_subthemes)
 print("Sentiment:", sample_sentiment)
 print("Reasoning:", sample_reasoning)
 
+# Excerpt ids key the checkpoint; rows already annotated by an earlier run are skipped
+excerpt_ids = [cache.key(text) for text in df["transcript_text"]]
+checkpoint = AnnotationCheckpoint(checkpoint_path, resume=resume)
+completed_ids = checkpoint.completed_ids()
+todo = [position for position, excerpt_id in enumerate(excerpt_ids) if excerpt_id not in completed_ids]
+if len(todo) < len(excerpt_ids):
+    print(f"⏯️ Resuming: {len(excerpt_ids) - len(todo)} of {len(excerpt_ids)} rows already in the checkpoint")
+
+cascade = SentimentCascade(cascade_target_agreement, cascade_min_training) if use_local_cascade else None
+local_results = {}  # row -> (sentiment, confidence) answered by the pre-classifier
+audit_results = {}  # row -> local sentiment of the confident rows also sent to the LLM
+
+
+def train_cascade():
+    """Trains the pre-classifier on the LLM's sentiments in the checkpoint (and cascade_training_paths)."""
+    records = checkpoint.load()
+    texts, sentiments = read_llm_labels(cascade_training_paths)
+    for text, excerpt_id in zip(df["transcript_text"], excerpt_ids):
+        if excerpt_id in records:
+            texts.append(text)
+            sentiments.append(records[excerpt_id]["sentiment"])
+    cascade.fit(texts, sentiments)
+    print(f"🤖 Local pre-classifier: {cascade.describe_validation()}")
+
+
+def route_rows(rows):
+    """Answers the confident rows locally (kept in local_results) and returns the rows left for the LLM."""
+    if cascade is None or not cascade.trained or not rows:
+        return rows
+    sentiments, confidence = cascade.predict(df["transcript_text"].iloc[rows].tolist())
+    local, audit = cascade.route(confidence, cascade_audit_rate)
+    llm_rows = []
+    for row, sentiment, row_confidence, is_local, is_audit in zip(rows, sentiments, confidence, local, audit):
+        if is_local and not is_audit:
+            local_results[row] = (sentiment, row_confidence)
+        else:
+            llm_rows.append(row)
+        if is_audit:
+            audit_results[row] = sentiment
+    print(f"🤖 {local.sum() - audit.sum()} of {len(rows)} rows answered locally; {len(llm_rows)} go to the LLM "
+          f"({audit.sum()} of them audits of confident rows)")
+    return llm_rows
+
+
+# Route the rows: confident ones are answered locally. Without a trained classifier yet, a calibration sample is
+# sent to the LLM first (in STEP 5) and the rest are routed once it is trained.
+calibration_rows = []
+llm_rows = todo
+if cascade is not None:
+    train_cascade()
+    if not cascade.trained and len(todo) > cascade_calibration_size:
+        calibration_rows = sorted(random.Random(0).sample(todo, cascade_calibration_size))
+        print(f"🎯 The pre-classifier is trained on a calibration sample of {len(calibration_rows)} rows sent to the LLM first")
+    else:
+        llm_rows = route_rows(todo)
+
+# Forecast the cost of the full run (cached excerpts, rows in the checkpoint and local answers cost nothing)
+forecast = engine.forecast(df["transcript_text"].iloc[llm_rows], build_prompt,
+                           build_batch_prompt if use_batched_prompts else None, [excerpt_ids[row] for row in llm_rows],
+                           max_batch_size=batch_size, max_batch_tokens=max_batch_tokens)
+print(f"\n💰 Forecast: {governor.describe_forecast(forecast)}")
+if calibration_rows:
+    print("   (an upper bound: rows the pre-classifier answers after the calibration sample cost nothing)")
+
 # Ask the user if they want to continue
 proceed = input("\n⚠️ Proceed with full run? This will use OpenAI credits. (y/n): ")
 if proceed.lower() != "y":
@@ -144,19 +303,72 @@ if proceed.lower() != "y":
 # -------------------------------
 print("\n🚀 Processing full dataset. This may take a few minutes...\n")
 
+
+def annotate_rows(rows):
+    """Sends rows to the LLM, appending each finished row to the checkpoint as it arrives."""
+    texts = df["transcript_text"].iloc[rows]
+    ids = [excerpt_ids[row] for row in rows]
+
+    def save_result(position, result):
+        """Appends one finished row to the checkpoint (rows skipped at the budget cap are left for a later run)."""
+        if result['skipped']:
+            return
+        subthemes, sentiment, reasoning = annotation_from_result(result)
+        checkpoint.append(ids[position], subthemes, sentiment, reasoning)
+
+    # Send every excerpt not in the response cache concurrently (tqdm shows the progress)
+    with checkpoint:
+        if use_batched_prompts:
+            engine.annotate_batched(texts, build_prompt, build_batch_prompt, ids, max_batch_size=batch_size,
+                                    max_batch_tokens=max_batch_tokens, on_result=save_result)
+            print(f"\n📡 LLM calls finished: {engine.batch_summary()}")
+        else:
+            prompts = [build_prompt(text) for text in texts]
+            engine.annotate(prompts, ids, on_result=save_result)
+            print(f"\n📡 LLM calls finished: {engine.summary()}")
+
+
+if calibration_rows:
+    annotate_rows(calibration_rows)
+    train_cascade()
+    calibrated = set(calibration_rows)
+    llm_rows = route_rows([row for row in todo if row not in calibrated])
+annotate_rows(llm_rows)
+print(f"🗄️ Response cache: {cache.summary()}")
+print(f"💰 Cost: {governor.summary()}")
+
+# Assemble the results of this and earlier runs from the checkpoint, in row order
+records = checkpoint.load()
 subthemes_list = []
 sentiment_list = []
 reasoning_list = []
-
-# tqdm adds a progress bar
-for idx, row in tqdm(df.iterrows(), total=len(df)):
-    text = row["transcript_text"]
-    subthemes, sentiment, reasoning = get_subthemes_and_sentiment(text)
+source_list = []
+
+for idx, excerpt_id in enumerate(excerpt_ids):
+    # Rows answered by the local pre-classifier have a sentiment only
+    if excerpt_id not in records and idx in local_results:
+        sentiment, confidence = local_results[idx]
+        subthemes_list.append("")
+        sentiment_list.append(sentiment)
+        reasoning_list.append(f"Local pre-classifier ({confidence:.0%} confident)")
+        source_list.append("local")
+        continue
+
+    # Rows skipped at the budget cap stay empty
+    if excerpt_id not in records:
+        subthemes_list.append(None)
+        sentiment_list.append(None)
+        reasoning_list.append(None)
+        source_list.append(None)
+        continue
+
+    subthemes, sentiment, reasoning = (records[excerpt_id][field] for field in ("subthemes", "sentiment", "reasoning"))
 
     # Join list of subthemes into a single string for easier display
     subthemes_list.append(", ".join(subthemes))
     sentiment_list.append(sentiment)
     reasoning_list.append(reasoning)
+    source_list.append("llm")
 
     # Optional: Print intermediate output every 10 rows for sanity check
     if idx % 10 == 0:
@@ -168,6 +380,13 @@ for idx, row in tqdm(df.iterrows(), total=len(df)):
 df["subthemes"] = subthemes_list
 df["sentiment"] = sentiment_list
 df["reasoning"] = reasoning_list
+df["sentiment_source"] = source_list
+
+# How often the local answers agree with the LLM, on the confident rows that were sent to the LLM as well
+if audit_results:
+    audited = [row for row in audit_results if excerpt_ids[row] in records]
+    print("\n🤖 Pre-classifier audit: " + describe_agreement([audit_results[row] for row in audited],
+                                                            [records[excerpt_ids[row]]["sentiment"] for row in audited]))
 
 # Preview the final result
 print("\n📊 Preview of final enhanced DataFrame:")
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark of the annotation engine against a fake LLM backend.
+"""
+
+# Background: The throughput of the annotation engine (concurrency, rate limits, retries, batching) could only be
+# measured against the paid API. This script runs the engine against llm_backend.FakeBackend - no network, no
+# credits - with a configurable latency and failure rate, and times the same synthetic excerpts sent one at a
+# time, concurrently, and concurrently in batched prompts. It also checks that every excerpt got a valid answer.
+
+# How to Use:
+# - Adjust the Benchmark Settings below and run the script (or its cells) from this folder.
+# - latency is the simulated seconds per request (GPT-4 answers take a few seconds; 0.2 keeps the run short).
+# - error_rate is the share of requests failing with a 429 or 500, retried by the engine.
+# - requests_per_minute / tokens_per_minute apply the account's rate limits as in a real run (None = unlimited).
+
+# Output: a table of seconds, requests, retries and throughput (excerpts/s) per mode; optionally exported to
+#         benchmark_results_file_path (.csv)
+
+
+#Import Libraries
+import os
+import sys
+import time
+import random
+import pandas as pd
+
+# Make the helper modules in this folder importable when run from Spyder or another working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from llm_backend import FakeBackend
+from llm_annotation import AnnotationEngine, annotation_from_result
+
+# Benchmark Settings
+# - modes: (name, max_concurrency, batch size or None for one excerpt per prompt)
+n_excerpts = 200
+latency = 0.2
+error_rate = 0.02
+skip_rate = 0.0
+requests_per_minute = None
+tokens_per_minute = None
+modes = [('Sequential', 1, None), ('Concurrent', 16, None), ('Concurrent + Batched', 16, 10)]
+seed = 0
+
+benchmark_results_file_path = None  # e.g. r'S:\Strategy Research\Transcripts\Data\Benchmarks\Annotation Benchmark.csv'
+
+
+#%% Synthetic Excerpts
+
+SENTENCE_PARTS = [
+    ["We continue to see", "Customers are reporting", "Management expects", "Our teams delivered", "We are cautious about"],
+    ["strong demand for", "pressure on", "early adoption of", "slower spending on", "margin expansion from"],
+    ["generative AI tools", "tariff-exposed inputs", "supply chain capacity", "consumer credit", "data center builds"],
+    ["this quarter.", "into next year.", "across every region.", "despite the macro backdrop.", "as pricing normalizes."],
+]
+
+
+def synthetic_excerpts(n, seed=0, sentences=3):
+    """n distinct excerpts of a few earnings-call-style sentences each."""
+    rng = random.Random(seed)
+    return [f"({i}) " + " ".join(" ".join(rng.choice(part) for part in SENTENCE_PARTS) for _ in range(sentences))
+            for i in range(n)]
+
+
+def build_prompt(text):
+    """Single-excerpt prompt (a shortened version of the detector's prompt)."""
+    return ('Identify 1-3 subthemes, the sentiment (Positive, Neutral or Negative) and one sentence of reasoning. '
+            'Return a JSON object with keys "subthemes", "sentiment", "reasoning".\n\nExcerpt:\n"""' + text + '"""')
+
+
+def build_batch_prompt(excerpts):
+    """Batch prompt: excerpts tagged with their ids, answered with a JSON array."""
+    block = "\n\n".join(f'[{excerpt_id}]\n"""{text}"""' for excerpt_id, text in excerpts)
+    return ('For EACH excerpt identify 1-3 subthemes, the sentiment (Positive, Neutral or Negative) and one sentence '
+            'of reasoning. Return a JSON array with one object per excerpt id, with keys "id", "subthemes", '
+            '"sentiment", "reasoning".\n\n' + block)
+
+
+#%% Run Benchmark
+
+texts = synthetic_excerpts(n_excerpts, seed)
+rows = []
+for name, max_concurrency, batch_size in modes:
+    backend = FakeBackend(latency=latency, error_rate=error_rate, skip_rate=skip_rate, seed=seed)
+    engine = AnnotationEngine(backend=backend, max_concurrency=max_concurrency, requests_per_minute=requests_per_minute,
+                              tokens_per_minute=tokens_per_minute)
+
+    start = time.perf_counter()
+    if batch_size:
+        results = engine.annotate_batched(texts, build_prompt, build_batch_prompt, max_batch_size=batch_size,
+                                          description=name)
+    else:
+        results = engine.annotate([build_prompt(text) for text in texts], description=name)
+    seconds = time.perf_counter() - start
+
+    failed = sum(annotation_from_result(result)[1] == "Error" for result in results)
+    rows.append({'Mode': name, 'Concurrency': max_concurrency, 'Batch Size': batch_size or 1, 'Seconds': seconds,
+                 'Requests': backend.calls, 'Simulated Failures': backend.failures, 'Retries': engine.retries,
+                 'Failed Excerpts': failed, 'Excerpts/s': n_excerpts / seconds})
+    print(f"✅ {name}: {seconds:.1f}s, {engine.summary()}, {failed} failed excerpts")
+
+benchmark_df = pd.DataFrame(rows)
+benchmark_df['Speed-up'] = benchmark_df['Excerpts/s'] / benchmark_df['Excerpts/s'].iloc[0]
+print(f"\n{n_excerpts} excerpts, {latency}s latency, {error_rate:.0%} simulated failures:")
+print(benchmark_df.to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+
+if benchmark_results_file_path:
+    benchmark_df.to_csv(benchmark_results_file_path, index=False)
+    print(f"\n💾 Results saved to {benchmark_results_file_path}")
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only JSONL checkpoint of annotation results, so interrupted runs can resume.
+"""
+
+# Background: The Topic Sentiment Detectors kept every annotation in Python lists and only wrote Excel at the very
+# end, so a crash at row 18,000 of 20,000 lost every paid-for result. The checkpoint is a JSONL file the scripts
+# append to as each result arrives (one line per excerpt id, flushed immediately). A resumed run skips the ids
+# already annotated, and the enriched DataFrame is assembled from the checkpoint rather than from memory.
+#   - excerpt ids are the response cache keys (hash of the text, theme, prompt version, model and temperature), so
+#     a changed prompt or model does not resume into stale answers
+#   - error results are written too (the output shows them) but are not "completed": a resume retries them
+#   - a line cut off by a crash is ignored when the file is read back
+
+# How to Use:
+# - checkpoint = AnnotationCheckpoint(checkpoint_path, resume=True)   (resume=False starts a fresh file)
+# - todo = [id for id in excerpt_ids if id not in checkpoint.completed_ids()]
+# - with checkpoint: engine.annotate_batched(..., on_result=...) calling checkpoint.append(id, subthemes, sentiment, reasoning)
+# - records = checkpoint.load()  ->  {excerpt id: {'subthemes': [...], 'sentiment': ..., 'reasoning': ...}}
+
+
+#Import Libraries
+import os
+import json
+
+
+class AnnotationCheckpoint:
+    """
+    Append-only JSONL file of annotation results keyed by excerpt id.
+
+    Parameters:
+        path (str): Checkpoint file (created with its folder if missing).
+        resume (bool): Keep the results of earlier runs; False deletes the file first.
+    """
+
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.file = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not resume and os.path.exists(path):
+            os.remove(path)
+
+    def load(self):
+        """Returns {excerpt id: record} of every result written so far (the latest line of an id wins)."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # Cut off by a crash
+                    continue
+                records[record.pop('id')] = record
+        return records
+
+    def completed_ids(self):
+        """Ids with a successful annotation (errors are retried on resume)."""
+        return {excerpt_id for excerpt_id, record in self.load().items() if record['sentiment'] != "Error"}
+
+    def append(self, excerpt_id, subthemes, sentiment, reasoning):
+        """Writes one result and flushes it to disk."""
+        if self.file is None:
+            # Start on a fresh line if a crash cut the last one off
+            cut_off = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    cut_off = f.read(1) != b'\n'
+            self.file = open(self.path, 'a', encoding='utf-8')
+            if cut_off:
+                self.file.write('\n')
+        record = {'id': excerpt_id, 'subthemes': subthemes, 'sentiment': sentiment, 'reasoning': reasoning}
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
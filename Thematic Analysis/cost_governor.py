@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Token-based cost estimation and budget enforcement for LLM annotation runs.
+"""
+
+# Background: The Insight Visualization detector estimated cost as words * 1.3 input tokens plus a flat 150 output
+# tokens per row and broke out of its loop at MAX_COST, leaving its result lists shorter than the DataFrame so the
+# column assignment failed. This module replaces that guess with:
+#   - count_tokens: the model's own tokenizer (tiktoken) when installed, otherwise a local approximation of the
+#     same byte-pair splitting (pre-tokens like tiktoken's, long words split further)
+#   - CostGovernor: a budget the engine checks before every request. Each request reserves its prompt tokens plus
+#     the expected answer; the reservation is settled with the API's reported usage when the answer arrives. Once a
+#     request no longer fits, the run stops cleanly: the rest are skipped and the finished rows are kept.
+# AnnotationEngine.forecast counts the tokens of a run before anything is sent, for a pre-run cost estimate.
+
+# How to Use:
+# - governor = CostGovernor(max_cost=50, cost_input_per_1k=0.01, cost_output_per_1k=0.03)
+# - engine = AnnotationEngine(..., governor=governor); print(governor.describe_forecast(engine.forecast(...)))
+# - After the run: print(governor.summary()); rows whose result has 'skipped' were not sent (budget reached)
+
+
+#Import Libraries
+import re
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to the local approximation
+    tiktoken = None
+
+# Tokens every chat request adds around the messages (role markers and reply priming)
+CHAT_OVERHEAD_TOKENS = 7
+
+# Pre-tokens as in the GPT tokenizers: contractions, words with their leading space, 1-3 digit groups, punctuation runs
+PRETOKEN_PATTERN = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+", re.IGNORECASE)
+
+_encodings = {}
+
+
+def _encoding(model):
+    """tiktoken encoding of a model (cached), or None without tiktoken."""
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding('cl100k_base')
+    return _encodings[model]
+
+
+def count_tokens(text, model='gpt-4'):
+    """
+    Number of tokens of a text for a model.
+
+    Uses tiktoken when it is installed. Otherwise each pre-token counts as one token, plus one more per 8 characters
+    beyond the first 4 of a word (common English words are one token; rare long words split into several).
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(1 + max(0, len(piece.strip()) - 4) // 8 for piece in PRETOKEN_PATTERN.findall(text))
+
+
+def count_prompt_tokens(prompt, model='gpt-4'):
+    """Input tokens billed for a one-message chat request."""
+    return count_tokens(prompt, model) + CHAT_OVERHEAD_TOKENS
+
+
+class CostGovernor:
+    """
+    Spending cap for a run of LLM requests.
+
+    Parameters:
+        max_cost (float or None): Budget in USD (None = no cap; spend is still tracked).
+        cost_input_per_1k (float): USD per 1,000 prompt tokens.
+        cost_output_per_1k (float): USD per 1,000 completion tokens.
+    """
+
+    def __init__(self, max_cost, cost_input_per_1k, cost_output_per_1k):
+        self.max_cost = max_cost
+        self.cost_input_per_1k = cost_input_per_1k
+        self.cost_output_per_1k = cost_output_per_1k
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.reserved = 0.0
+        self.requests = 0
+        self.skipped = 0
+        self.stopped = False
+
+    def cost(self, prompt_tokens, completion_tokens):
+        """USD cost of a number of prompt and completion tokens."""
+        return prompt_tokens / 1000 * self.cost_input_per_1k + completion_tokens / 1000 * self.cost_output_per_1k
+
+    @property
+    def spent(self):
+        """USD spent so far, from the usage reported by the API."""
+        return self.cost(self.prompt_tokens, self.completion_tokens)
+
+    def reserve(self, prompt_tokens, completion_tokens):
+        """
+        Reserves the estimated cost of a request before it is sent.
+
+        Returns:
+            The reserved amount, or None if the request does not fit the budget now. If it would not fit even with
+            no requests in flight, the governor stops (check stopped): this request and all later ones are skipped.
+            Otherwise wait for the requests in flight to settle and try again.
+        """
+        amount = self.cost(prompt_tokens, completion_tokens)
+        if not self.stopped and self.max_cost is not None and self.spent + amount > self.max_cost:
+            self.stopped = True
+        if self.stopped:
+            self.skipped += 1
+            return None
+        if self.max_cost is not None and self.spent + self.reserved + amount > self.max_cost:
+            return None
+        self.reserved += amount
+        return amount
+
+    def settle(self, amount, usage):
+        """Replaces a reservation with the actual usage (usage None = the request failed and was not billed)."""
+        self.reserved -= amount
+        if usage:
+            self.prompt_tokens += usage.get('prompt_tokens', 0)
+            self.completion_tokens += usage.get('completion_tokens', 0)
+            self.requests += 1
+
+    def describe_forecast(self, forecast):
+        """One-line pre-run estimate of a run from AnnotationEngine.forecast."""
+        cost = self.cost(forecast['prompt_tokens'], forecast['completion_tokens'])
+        line = (f"{forecast['excerpts']:,} excerpts ({forecast['cached']:,} cached) -> {forecast['requests']:,} requests, "
+                f"{forecast['prompt_tokens']:,} prompt + ~{forecast['completion_tokens']:,} completion tokens, "
+                f"forecast ${cost:.2f}")
+        if self.max_cost is not None:
+            remaining = max(0.0, self.max_cost - self.spent)
+            line += f" (budget left ${remaining:.2f}" + (", the run will stop early)" if cost > remaining else ")")
+        return line
+
+    def summary(self):
+        """One-line description of the spend so far."""
+        line = (f"${self.spent:.2f} spent on {self.requests:,} requests ({self.prompt_tokens:,} prompt + "
+                f"{self.completion_tokens:,} completion tokens)")
+        if self.stopped:
+            line += f"; budget of ${self.max_cost:.2f} reached, {self.skipped:,} requests skipped"
+        return line
@@ -0,0 +1,569 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent, rate-limited LLM annotation engine for the Topic Sentiment Detectors.
+"""
+
+# Background: Both Topic Sentiment Detectors (this folder and Insight Visualization) called the LLM one excerpt
+# at a time inside df.iterrows(), so tens of thousands of excerpts took a day, almost all of it spent waiting on
+# the network. This engine sends the requests concurrently while staying inside the account's rate limits:
+#   - at most max_concurrency requests are in flight (asyncio semaphore)
+#   - token buckets cap requests per minute and tokens per minute (prompt + expected completion tokens)
+#   - a 429 response pauses every worker for the server's Retry-After time (or an exponential backoff) and the
+#     request is retried; timeouts and 5xx errors are retried the same way
+#   - results come back in the order of the prompts, whatever order the responses arrive in
+#   - with a CostGovernor (cost_governor.py), every request reserves its cost against a budget before it is sent
+#     and the run stops cleanly once the budget is reached; forecast() estimates a run's tokens before sending
+#   - batched mode (annotate_batched) packs several excerpts with ids into one prompt, so the instructions are paid
+#     once per batch instead of once per excerpt; excerpts missing from the JSON array answer are retried alone
+#   - with a ResponseCache (response_cache.py), cached excerpts are answered locally, repeated excerpts are sent
+#     once, and new valid responses are stored as they arrive (so a crashed run keeps what it paid for)
+# Requests go through an llm_backend backend: OpenAIBackend (any OpenAI-compatible endpoint, including
+# mock_llm_server.py) by default, or FakeBackend to run offline.
+
+# How to Use:
+# - engine = AnnotationEngine(api_key, model='gpt-4', max_concurrency=16, requests_per_minute=500, tokens_per_minute=300000)
+# - results = engine.annotate(prompts)          (one dict per prompt, in order; see AnnotationEngine.annotate)
+# - With a cache: AnnotationEngine(..., cache=ResponseCache(...)), then engine.annotate(prompts, cache_keys)
+# - subthemes, sentiment, reasoning = annotation_from_result(results[0])
+# - Batched: results = engine.annotate_batched(texts, build_prompt, build_batch_prompt, cache_keys, max_batch_size=10)
+# - Budget: AnnotationEngine(..., governor=CostGovernor(max_cost, ...)); results with 'skipped' were not sent
+# - Testing: python mock_llm_server.py --port 8011, then AnnotationEngine('test', api_base='http://127.0.0.1:8011/v1'),
+#   or offline: AnnotationEngine(backend=FakeBackend(latency=0.2, error_rate=0.05))
+
+
+#Import Libraries
+import json
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from cost_governor import count_tokens, count_prompt_tokens
+from llm_backend import DEFAULT_API_BASE, RateLimitError, OpenAIBackend
+
+
+def parse_annotation(content):
+    """
+    Parses the JSON object of an annotation response.
+
+    Returns:
+        (subthemes, sentiment, reasoning); raises ValueError if the content holds no JSON object.
+    """
+    content = content.strip()
+
+    # The model sometimes adds a sentence before the JSON; start at the first '{'
+    if not content.startswith("{"):
+        json_start = content.find("{")
+        if json_start < 0:
+            raise ValueError(f"No JSON object in response: {content[:100]!r}")
+        content = content[json_start:]
+
+    result = json.loads(content[:content.rfind("}") + 1])
+    return result.get("subthemes", []), result.get("sentiment", ""), result.get("reasoning", "")
+
+
+def has_sentiment(sentiment):
+    """True for a given sentiment, including a score of 0 on the +1 to -1 scale; False for missing or empty ones."""
+    return sentiment is not None and sentiment != ""
+
+
+def is_valid_annotation(content):
+    """True if a response holds a parseable annotation with a sentiment (only these are cached)."""
+    try:
+        return has_sentiment(parse_annotation(content)[1])
+    except ValueError:
+        return False
+
+
+def parse_theme_annotations(content):
+    """
+    Parses a multi-theme annotation: {"themes": {theme: {"subthemes": [...], "sentiment": ..., "reasoning": ...}}}.
+
+    Returns:
+        {theme: (subthemes, sentiment, reasoning)}; raises ValueError if the content holds no JSON object.
+    """
+    content = content.strip()
+    json_start = content.find("{")
+    if json_start < 0:
+        raise ValueError(f"No JSON object in response: {content[:100]!r}")
+    result = json.loads(content[json_start:content.rfind("}") + 1])
+
+    themes = result.get("themes") if isinstance(result, dict) else None
+    if not isinstance(themes, dict):
+        raise ValueError(f"No 'themes' object in response: {content[:100]!r}")
+    return {theme: (annotation.get("subthemes", []), annotation.get("sentiment", ""), annotation.get("reasoning", ""))
+            for theme, annotation in themes.items() if isinstance(annotation, dict)}
+
+
+def is_valid_theme_annotation(content):
+    """True if a multi-theme response holds at least one theme with a sentiment."""
+    try:
+        return any(has_sentiment(sentiment) for _, sentiment, _ in parse_theme_annotations(content).values())
+    except ValueError:
+        return False
+
+
+def annotation_from_result(result):
+    """
+    Turns one engine result into (subthemes, sentiment, reasoning), the return value of the scripts'
+    get_subthemes_and_sentiment. API and parsing errors give ([], "Error", message), as before.
+    """
+    if result['error'] is not None:
+        return [], "Error", result['error']
+    try:
+        return parse_annotation(result['content'])
+    except ValueError as e:  # json.JSONDecodeError is a ValueError
+        return [], "Error", str(e)
+
+
+def parse_batch_annotations(content, validate=is_valid_annotation):
+    """
+    Parses the JSON array answer to a batch prompt.
+
+    Parameters:
+        validate (callable): Check of one item's annotation (is_valid_theme_annotation for multi-theme batches).
+
+    Returns:
+        {excerpt id: that excerpt's annotation as a JSON object string (the item without its id)}, for the valid
+        items only; raises ValueError if the content holds no JSON array.
+    """
+    json_start, json_end = content.find("["), content.rfind("]")
+    if json_start < 0 or json_end < json_start:
+        raise ValueError(f"No JSON array in response: {content[:100]!r}")
+
+    items = json.loads(content[json_start:json_end + 1])
+    annotations = {}
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and "id" in item:
+            annotation = json.dumps({key: value for key, value in item.items() if key != "id"})
+            if validate(annotation):
+                annotations[str(item["id"])] = annotation
+    return annotations
+
+
+def pack_batches(token_counts, max_batch_size, max_batch_tokens, output_tokens_per_excerpt):
+    """
+    Greedily groups excerpts, in order, into batches of at most max_batch_size excerpts whose tokens plus expected
+    answers fit max_batch_tokens. An excerpt too long for any batch goes alone.
+
+    Parameters:
+        token_counts (list): Tokens of each excerpt.
+        max_batch_size (int): Most excerpts per batch.
+        max_batch_tokens (int): Token budget of a batch, excluding the shared instructions.
+        output_tokens_per_excerpt (int): Answer tokens reserved per excerpt.
+
+    Returns:
+        list of lists of excerpt positions.
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for position, tokens in enumerate(token_counts):
+        cost = tokens + output_tokens_per_excerpt + 10  # 10 tokens for the id and delimiters
+        if batch and (len(batch) >= max_batch_size or batch_tokens + cost > max_batch_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(position)
+        batch_tokens += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most burst_seconds' worth (so a run cannot
+    open with a full minute's burst on top of the steady rate).
+
+    acquire(amount) waits until amount can be taken. adjust(amount) charges (or refunds) a correction once the
+    actual usage is known; the balance may go negative, which delays the next acquire.
+    """
+
+    def __init__(self, rate_per_minute, burst_seconds=6):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # A request larger than the whole bucket could never be served; let it wait for a full bucket instead
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+    def adjust(self, amount):
+        self._refill()
+        self.available = min(self.capacity, self.available - amount)
+
+
+class AnnotationEngine:
+    """
+    Concurrent, rate-limit-aware client for chat completions.
+
+    Parameters:
+        api_key (str): API key (None reads the OPENAI_API_KEY environment variable).
+        model (str): Model name.
+        temperature (float): Sampling temperature.
+        api_base (str): Base URL of the API, e.g. the mock server's 'http://127.0.0.1:8011/v1'.
+        backend (backend or None): An llm_backend backend (e.g. FakeBackend); None builds an OpenAIBackend from
+            api_key, model, temperature, api_base, timeout and max_tokens (which are then ignored).
+        max_concurrency (int): Maximum number of requests in flight.
+        requests_per_minute (int or None): Request rate limit (None = unlimited).
+        tokens_per_minute (int or None): Token rate limit, prompt plus expected completion tokens (None = unlimited).
+        expected_output_tokens (int): Completion tokens reserved per request until the actual usage is known.
+        max_retries (int): Retries per request after a 429, 5xx or timeout.
+        timeout (float): Seconds before a request times out.
+        max_tokens (int or None): Completion token limit sent with every request.
+        cache (ResponseCache or None): Response cache consulted before any request (see annotate).
+        governor (CostGovernor or None): Budget checked before every request; tracks the actual spend.
+    """
+
+    def __init__(self, api_key=None, model='gpt-4', temperature=0.2, api_base=DEFAULT_API_BASE, max_concurrency=8,
+                 requests_per_minute=None, tokens_per_minute=None, expected_output_tokens=150, max_retries=6,
+                 timeout=120, max_tokens=None, cache=None, governor=None, backend=None):
+        self.backend = backend or OpenAIBackend(api_key, model, temperature, api_base, timeout, max_tokens)
+        self.model = self.backend.model
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.expected_output_tokens = expected_output_tokens
+        self.max_retries = max_retries
+        self.cache = cache
+        self.governor = governor
+
+    # -------------------------------
+    # Scheduling
+    # -------------------------------
+
+    async def _wait_for_pause(self):
+        """Sleeps while a 429 has paused all workers."""
+        while True:
+            remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    async def _request(self, position, prompt, semaphore, executor, output_tokens=None):
+        """Sends one prompt with rate limiting and retries. Returns the result dict for that position."""
+        prompt_tokens, output_tokens = count_prompt_tokens(prompt, self.model), output_tokens or self.expected_output_tokens
+        estimated = prompt_tokens + output_tokens
+        result = {'position': position, 'content': None, 'usage': None, 'error': None, 'attempts': 0, 'cached': False,
+                  'skipped': False}
+        loop = asyncio.get_running_loop()
+
+        async with semaphore:
+            # Reserve the cost before sending; once the budget is reached every remaining request is skipped
+            reservation = 0.0
+            while self.governor is not None:
+                reservation = self.governor.reserve(prompt_tokens, output_tokens)
+                if reservation is not None or self.governor.stopped:
+                    break
+                await asyncio.sleep(0.05)  # Fits once the requests in flight report their actual usage
+            if reservation is None:
+                result['error'], result['skipped'] = "Skipped: LLM budget reached", True
+                return result
+
+            for attempt in range(self.max_retries + 1):
+                await self._wait_for_pause()
+                if self._request_bucket is not None:
+                    await self._request_bucket.acquire(1)
+                if self._token_bucket is not None:
+                    await self._token_bucket.acquire(estimated)
+                result['attempts'] = attempt + 1
+
+                try:
+                    response = await loop.run_in_executor(executor, self.backend.complete,
+                                                          [{'role': 'user', 'content': prompt}])
+                except RateLimitError as e:
+                    self.retries += 1
+                    if e.status == 429:
+                        self.rate_limited += 1
+                    if attempt == self.max_retries:
+                        result['error'] = str(e)
+                        break
+                    # Honour Retry-After; otherwise back off exponentially with jitter. A 429 pauses every worker.
+                    delay = e.retry_after if e.retry_after is not None else min(60.0, 2 ** attempt) * (0.5 + random.random())
+                    if e.status == 429:
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                        await self._wait_for_pause()
+                    else:
+                        await asyncio.sleep(delay)
+                    continue
+                except Exception as e:
+                    result['error'] = str(e)
+                    break
+
+                result['content'] = response['content']
+                result['usage'] = response['usage']
+                # Correct the token bucket with the actual usage
+                if self._token_bucket is not None and result['usage']:
+                    self._token_bucket.adjust(result['usage'].get('total_tokens', estimated) - estimated)
+                break
+
+            if self.governor is not None:
+                self.governor.settle(reservation, result['usage'])
+
+        return result
+
+    def _start_run(self):
+        """Resets the rate limiters and counters at the start of a run."""
+        self._paused_until = 0.0
+        self._request_bucket = TokenBucket(self.requests_per_minute) if self.requests_per_minute else None
+        self._token_bucket = TokenBucket(self.tokens_per_minute) if self.tokens_per_minute else None
+        self.retries = 0
+        self.rate_limited = 0
+        self.requests_sent = 0
+
+    def _split_cached(self, count, cache_keys):
+        """
+        Answers cached positions and groups the others by key (each group is sent once).
+
+        Returns:
+            (results with the cached positions filled in, {key: positions} of the positions still to send)
+        """
+        results = [None] * count
+        if self.cache is None or cache_keys is None:
+            return results, {position: [position] for position in range(count)}
+
+        cached = self.cache.get_many(cache_keys)
+        positions_by_key = {}
+        for position, key in enumerate(cache_keys):
+            if key in cached:
+                results[position] = {'position': position, 'content': cached[key], 'usage': None, 'error': None,
+                                     'attempts': 0, 'cached': True, 'skipped': False}
+            else:
+                positions_by_key.setdefault(key, []).append(position)
+        return results, positions_by_key
+
+    async def _send(self, prompts, show_progress, description, output_tokens=None, on_result=None):
+        """Sends the prompts concurrently; on_result(result) is called as each one finishes. Returns results in order."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = [None] * len(prompts)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            tasks = [asyncio.ensure_future(self._request(position, prompt, semaphore, executor,
+                                                         output_tokens[position] if output_tokens else None))
+                     for position, prompt in enumerate(prompts)]
+            self.requests_sent += len(tasks)
+            with tqdm(total=len(tasks), desc=description, disable=not show_progress) as progress:
+                for task in asyncio.as_completed(tasks):
+                    result = await task
+                    results[result['position']] = result
+                    progress.update(1)
+                    if on_result is not None:
+                        on_result(result)
+        return results
+
+    def _result_sink(self, results, positions_by_key, cache_keys, validate, on_result):
+        """
+        Returns (finish, flush). finish(position, result) stores the answer of a sent excerpt at every position sharing
+        its key, calls on_result(position, result) for each, and queues valid answers for the cache; flush() writes
+        the queued answers (every 50 answers, and at the end or on interruption, so paid answers are kept).
+        """
+        positions_of = {positions[0]: positions for positions in positions_by_key.values()}
+        pending = []
+
+        def flush():
+            if pending:
+                self.cache.put_many(pending)
+                pending.clear()
+
+        def finish(position, result):
+            for copy_position in positions_of[position]:
+                results[copy_position] = dict(result, position=copy_position)
+                if on_result is not None:
+                    on_result(copy_position, results[copy_position])
+            if cache_keys is not None and self.cache is not None and result['error'] is None and validate(result['content']):
+                pending.append((cache_keys[position], result['content'], result['usage']))
+                if len(pending) >= 50:
+                    flush()
+
+        if on_result is not None:
+            for position, result in enumerate(results):
+                if result is not None:  # Answered from the cache
+                    on_result(position, result)
+        return finish, flush
+
+    async def _annotate(self, prompts, cache_keys, show_progress, description, validate, on_result):
+        results, positions_by_key = self._split_cached(len(prompts), cache_keys)
+        to_send = [positions[0] for positions in positions_by_key.values()]
+        finish, flush = self._result_sink(results, positions_by_key, cache_keys, validate, on_result)
+        try:
+            await self._send([prompts[position] for position in to_send], show_progress, description,
+                             on_result=lambda result: finish(to_send[result['position']], result))
+        finally:
+            flush()
+        return results
+
+    async def annotate_async(self, prompts, cache_keys=None, show_progress=True, description='LLM annotation',
+                             validate=is_valid_annotation, on_result=None):
+        """Coroutine version of annotate (use it from code that already runs an event loop)."""
+        self._start_run()
+        return await self._annotate(list(prompts), None if cache_keys is None else list(cache_keys), show_progress,
+                                    description, validate, on_result)
+
+    @staticmethod
+    def _run(coroutine):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        # Spyder / Jupyter already run an event loop in this thread; run ours in a helper thread
+        with ThreadPoolExecutor(max_workers=1) as helper:
+            return helper.submit(asyncio.run, coroutine).result()
+
+    def annotate(self, prompts, cache_keys=None, show_progress=True, description='LLM annotation',
+                 validate=is_valid_annotation, on_result=None):
+        """
+        Sends every prompt and returns the results in prompt order.
+
+        Parameters:
+            prompts (list): Prompt texts.
+            cache_keys (list or None): One ResponseCache key per prompt; with the engine's cache, cached prompts are
+                not sent and new valid responses are stored.
+            validate (callable): content -> bool; only responses passing it are cached.
+            on_result (callable or None): on_result(position, result) is called as soon as each prompt's result is
+                known (cached ones first), e.g. to checkpoint results during a long run.
+
+        Returns:
+            list of dicts with 'content' (response text or None), 'usage' (the API's token usage or None),
+            'error' (message or None), 'attempts' and 'cached' (True if answered from the cache).
+        """
+        return self._run(self.annotate_async(prompts, cache_keys, show_progress, description, validate, on_result))
+
+    async def annotate_batched_async(self, texts, build_prompt, build_batch_prompt, cache_keys=None, max_batch_size=10,
+                                     max_batch_tokens=6000, show_progress=True, description='LLM annotation',
+                                     on_result=None, validate=is_valid_annotation):
+        """Coroutine version of annotate_batched (use it from code that already runs an event loop)."""
+        texts = list(texts)
+        cache_keys = None if cache_keys is None else list(cache_keys)
+        self._start_run()
+        results, positions_by_key = self._split_cached(len(texts), cache_keys)
+        finish, flush = self._result_sink(results, positions_by_key, cache_keys, validate, on_result)
+
+        # Pack the uncached excerpts into batches that fit the context budget
+        batch_items = self._batch_items(texts, [positions[0] for positions in positions_by_key.values()],
+                                        build_batch_prompt, max_batch_size, max_batch_tokens)
+        missing = []
+
+        def on_batch(batch_result):
+            # Split the batch answer into one result per excerpt; the excerpts it lacks are retried later
+            items = batch_items[batch_result['position']]
+            annotations = {}
+            if batch_result['error'] is None:
+                try:
+                    annotations = parse_batch_annotations(batch_result['content'], validate)
+                except ValueError:
+                    pass
+            for excerpt_id, _ in items:
+                position = int(excerpt_id[1:])
+                if batch_result['skipped']:  # Budget reached: no retries either
+                    finish(position, batch_result)
+                elif excerpt_id in annotations:
+                    finish(position, dict(batch_result, content=annotations[excerpt_id], usage=None, batched=True))
+                else:
+                    missing.append(position)
+
+        try:
+            await self._send([build_batch_prompt(items) for items in batch_items], show_progress,
+                             f"{description} (batches)", on_result=on_batch,
+                             output_tokens=[self.expected_output_tokens * len(items) for items in batch_items])
+
+            # Excerpts the model left out (or whose batch failed) are retried one by one
+            missing.sort()
+            if missing:
+                await self._send([build_prompt(texts[position]) for position in missing], show_progress,
+                                 f"{description} (retries)",
+                                 on_result=lambda result: finish(missing[result['position']], result))
+        finally:
+            flush()
+
+        self.batches_sent = len(batch_items)
+        self.batch_retries = len(missing)
+        return results
+
+    def _batch_items(self, texts, positions, build_batch_prompt, max_batch_size, max_batch_tokens):
+        """Packs the excerpts at positions into batches of (id, text) lists (see pack_batches)."""
+        # The instructions are counted once per batch; every excerpt adds its own tokens plus room for its answer
+        overhead = count_prompt_tokens(build_batch_prompt([]), self.model)
+        batches = pack_batches([count_tokens(texts[position], self.model) for position in positions], max_batch_size,
+                               max_batch_tokens - overhead, self.expected_output_tokens)
+        return [[(f"E{positions[i]}", texts[positions[i]]) for i in batch] for batch in batches]
+
+    def forecast(self, texts, build_prompt, build_batch_prompt=None, cache_keys=None, max_batch_size=10,
+                 max_batch_tokens=6000):
+        """
+        Counts the requests and tokens a run would need, without sending anything (cached excerpts cost nothing).
+
+        Parameters:
+            texts, build_prompt, cache_keys: As in annotate_batched (build_prompt builds the prompts of annotate).
+            build_batch_prompt (callable or None): Forecast annotate_batched with this; None forecasts annotate.
+
+        Returns:
+            dict with 'excerpts', 'cached', 'requests', 'prompt_tokens' and 'completion_tokens' (expected).
+        """
+        texts = list(texts)
+        cached = self.cache.contains(cache_keys) if self.cache is not None and cache_keys is not None else set()
+        positions_by_key = {}
+        for position in range(len(texts)):
+            key = cache_keys[position] if cache_keys is not None else position
+            if key not in cached:
+                positions_by_key.setdefault(key, position)
+        to_send = list(positions_by_key.values())
+
+        if build_batch_prompt is None:
+            prompts = [build_prompt(texts[position]) for position in to_send]
+        else:
+            prompts = [build_batch_prompt(items)
+                       for items in self._batch_items(texts, to_send, build_batch_prompt, max_batch_size, max_batch_tokens)]
+        return {
+            'excerpts': len(texts),
+            'cached': sum(key in cached for key in cache_keys) if cached else 0,
+            'requests': len(prompts),
+            'prompt_tokens': sum(count_prompt_tokens(prompt, self.model) for prompt in prompts),
+            'completion_tokens': len(to_send) * self.expected_output_tokens,
+        }
+
+    def annotate_batched(self, texts, build_prompt, build_batch_prompt, cache_keys=None, max_batch_size=10,
+                         max_batch_tokens=6000, show_progress=True, description='LLM annotation', on_result=None,
+                         validate=is_valid_annotation):
+        """
+        Annotates excerpts several at a time: up to max_batch_size excerpts, each with a stable id ('E' + its
+        position), share one prompt and the model answers with a JSON array. Fewer excerpts go in a batch when they
+        are long, so the prompt plus the expected answers stay within max_batch_tokens. Excerpts missing from an
+        answer are retried individually with build_prompt.
+
+        Parameters:
+            texts (list): Excerpt texts.
+            build_prompt (callable): text -> single-excerpt prompt (for the retries).
+            build_batch_prompt (callable): list of (id, text) -> batch prompt asking for a JSON array of objects
+                with "id" plus the fields of a single answer ("subthemes", "sentiment" and "reasoning").
+            cache_keys (list or None): One ResponseCache key per excerpt (see annotate).
+            max_batch_size (int): Most excerpts per request.
+            max_batch_tokens (int): Token budget of a request: prompt plus expected answers.
+            on_result (callable or None): As in annotate, called once per excerpt as soon as its result is known.
+            validate (callable): content -> bool check of one excerpt's answer; invalid answers are retried alone
+                and never cached (is_valid_theme_annotation for multi-theme prompts).
+
+        Returns:
+            One result per excerpt, in order, as in annotate; 'content' is that excerpt's JSON annotation.
+        """
+        return self._run(self.annotate_batched_async(texts, build_prompt, build_batch_prompt, cache_keys,
+                                                     max_batch_size, max_batch_tokens, show_progress, description,
+                                                     on_result, validate))
+
+    def summary(self):
+        """One-line description of the requests and retries of the last run."""
+        return f"{self.requests_sent} requests sent, {self.retries} retries ({self.rate_limited} rate limited)"
+
+    def batch_summary(self):
+        """One-line description of the last annotate_batched run."""
+        return f"{self.batches_sent} batches sent, {self.batch_retries} excerpts retried individually; {self.summary()}"
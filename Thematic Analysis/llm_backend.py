@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Common interface to the LLM backends (OpenAI, local model, fake) used by the pipeline.
+"""
+
+# Background: The keyword generator and both Topic Sentiment Detectors each called the LLM their own way (the
+# deprecated openai.ChatCompletion.create with model="gpt-4" hard-coded), so the pipeline could not be benchmarked
+# or run offline. Every LLM call now goes through one small interface:
+#   backend.complete(messages, max_tokens=None) -> {'content': str, 'usage': {'prompt_tokens', 'completion_tokens',
+#   'total_tokens'}}
+#   raising RateLimitError for retryable failures (429, 5xx, timeouts) and BackendError for the rest.
+# Two backends ship with it:
+#   - OpenAIBackend: any OpenAI-compatible /chat/completions endpoint over plain HTTP (the OpenAI API, a self-hosted
+#     model behind an OpenAI-compatible server, or mock_llm_server.py)
+#   - FakeBackend: an in-process, deterministic stand-in with configurable latency and failure rates (same answers
+#     as mock_llm_server.py), for offline runs, tests and throughput benchmarks without network access
+
+# How to Use:
+# - backend = OpenAIBackend(api_key, model='gpt-4', temperature=0.2)             (real API)
+# - backend = FakeBackend(latency=0.2, error_rate=0.05)                          (offline stand-in)
+# - response = backend.complete([{'role': 'user', 'content': prompt}]); response['content'], response['usage']
+# - AnnotationEngine(backend=backend, ...) sends its requests through the backend
+
+
+#Import Libraries
+import os
+import json
+import time
+import random
+import threading
+import urllib.request
+import urllib.error
+from email.utils import parsedate_to_datetime
+
+from cost_governor import count_tokens, count_prompt_tokens
+from mock_llm_server import mock_annotation, mock_content
+
+DEFAULT_API_BASE = 'https://api.openai.com/v1'
+
+# HTTP statuses worth retrying: rate limited, and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimitError(Exception):
+    """A retryable failure (HTTP 429, 5xx or a timeout); retry_after is the server's requested wait in seconds (or None)."""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class BackendError(RuntimeError):
+    """A failure that retrying will not fix (bad request, authentication, unknown model, ...)."""
+
+
+def retry_after_seconds(value):
+    """Parses a Retry-After header (seconds or an HTTP date) into seconds; None if missing or invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class OpenAIBackend:
+    """
+    Chat completions from an OpenAI-compatible HTTP endpoint (standard library only; safe to call from threads).
+
+    Parameters:
+        api_key (str): API key (None reads the OPENAI_API_KEY environment variable).
+        model (str): Model name.
+        temperature (float): Sampling temperature.
+        api_base (str): Base URL of the API, e.g. the mock server's 'http://127.0.0.1:8011/v1'.
+        timeout (float): Seconds before a request times out.
+        max_tokens (int or None): Default completion token limit.
+    """
+
+    def __init__(self, api_key=None, model='gpt-4', temperature=0.2, api_base=DEFAULT_API_BASE, timeout=120,
+                 max_tokens=None):
+        self.api_key = api_key or os.environ.get('OPENAI_API_KEY', '')
+        self.model = model
+        self.temperature = temperature
+        self.api_base = api_base.rstrip('/')
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+
+    def complete(self, messages, max_tokens=None):
+        """
+        Sends one chat completion request (blocking).
+
+        Returns:
+            dict with 'content' and 'usage'; raises RateLimitError on retryable failures and BackendError otherwise.
+        """
+        body = {'model': self.model, 'messages': messages, 'temperature': self.temperature}
+        if max_tokens or self.max_tokens:
+            body['max_tokens'] = max_tokens or self.max_tokens
+        request = urllib.request.Request(
+            self.api_base + '/chat/completions', data=json.dumps(body).encode('utf-8'), method='POST',
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.api_key}'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            message = e.read().decode('utf-8', errors='replace')[:200]
+            if e.code in RETRY_STATUSES:
+                raise RateLimitError(e.code, message, retry_after_seconds(e.headers.get('Retry-After'))) from None
+            raise BackendError(f"HTTP {e.code}: {message}") from None
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise RateLimitError(None, str(e)) from None
+
+        try:
+            return {'content': data['choices'][0]['message']['content'], 'usage': data.get('usage')}
+        except (KeyError, IndexError, TypeError):
+            raise BackendError(f"Unexpected response: {str(data)[:200]}") from None
+
+
+class FakeBackend:
+    """
+    Local, deterministic stand-in for an LLM: no network, no credits, same answers as mock_llm_server.py
+    (annotations, batch and multi-theme JSON, keyword lists). Safe to call from threads.
+
+    Parameters:
+        model (str): Model name, used for token counting and cache keys (a fake name keeps fake answers out of the
+            real model's response cache).
+        latency (float): Seconds each call takes.
+        error_rate (float): Share of calls failing with a retryable error (half 429 with retry_after, half 500).
+        retry_after (float): Retry-After seconds of the simulated 429s.
+        skip_rate (float): Share of batch items left out of batch answers.
+        respond (callable): prompt text -> response object for single-excerpt prompts (JSON-serialised), or a str.
+        seed (int): Seed of the simulated failures.
+    """
+
+    def __init__(self, model='fake-gpt-4', latency=0.0, error_rate=0.0, retry_after=0.1, skip_rate=0.0,
+                 respond=mock_annotation, seed=0):
+        self.model = model
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.skip_rate = skip_rate
+        self.respond = respond
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def complete(self, messages, max_tokens=None):
+        """Answers one chat completion like OpenAIBackend.complete (blocking for latency seconds)."""
+        with self.lock:
+            self.calls += 1
+            roll = self.random.random()
+            if roll < self.error_rate:
+                self.failures += 1
+        if roll < self.error_rate / 2:
+            raise RateLimitError(429, 'Rate limit reached (fake)', self.retry_after)
+        if roll < self.error_rate:
+            raise RateLimitError(500, 'Internal server error (fake)')
+
+        time.sleep(self.latency)
+        prompt = '\n'.join(message['content'] for message in messages)
+        with self.lock:
+            content = mock_content(prompt, self.respond, self.skip_rate, self.random)
+        prompt_tokens, completion_tokens = count_prompt_tokens(prompt, self.model), count_tokens(content, self.model)
+        return {'content': content, 'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                                              'total_tokens': prompt_tokens + completion_tokens}}
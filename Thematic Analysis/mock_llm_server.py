@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Local mock of the OpenAI chat completions endpoint for offline tests.
+"""
+
+# Background: A local stand-in for the OpenAI /chat/completions endpoint, to test llm_annotation.py (and the
+# Topic Sentiment Detectors pointed at it) without credits. It answers every prompt with a deterministic
+# annotation JSON after a configurable latency, reports token usage, and enforces a requests-per-minute limit
+# (a bucket of one minute's requests, refilled continuously, like the OpenAI limits) with 429 responses and a
+# Retry-After header, plus optional random 429s and 500s. Batch prompts (excerpts tagged [E<n>] """...""") get a
+# JSON array with one item per id, optionally leaving some out to exercise the individual retries. Multi-theme
+# prompts (a "Themes: a, b" line, or [E<n>] (themes: a, b) tags) get one annotation per theme, keyword
+# generation prompts get a numbered keyword list, and keyword-hit relevance prompts a {"relevant": ...} judgement.
+# Prompts asking for sentiment "on a +1 to -1 scale" get a score (e.g. 0.6) in place of Positive / Neutral / Negative.
+# llm_backend.FakeBackend gives the same answers in-process.
+
+# How to Use:
+# - Command line:  python mock_llm_server.py --port 8011 --latency 0.2 --rpm 600 --error-rate 0.05 --skip-rate 0.02
+# - In Python:     server = start_mock_server(port=0, latency=0.05); api_base = server.api_base; ...; server.shutdown()
+# - Point the engine at it: AnnotationEngine('test', api_base=server.api_base)
+
+
+#Import Libraries
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from cost_governor import count_tokens, count_prompt_tokens
+
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+BATCH_ITEM_PATTERN = re.compile(r'\[(E\d+)\](?: \(themes: ([^)]*)\))?\s*"""(.*?)"""', re.S)
+NUMERIC_SCALE_PATTERN = re.compile(r'\+1 to -1 scale')
+THEMES_PATTERN = re.compile(r'^\s*Themes: (.+)$', re.M)
+KEYWORD_THEME_PATTERN = re.compile(r"research on the theme: '([^']+)'")
+RELEVANCE_PATTERN = re.compile(r'does the keyword marked \[\[ \]\] refer to the theme', re.I)
+RELEVANCE_PASSAGE_PATTERN = re.compile(r'"""(.*?)"""', re.S)
+BOILERPLATE_CUES = ["forward-looking", "safe harbor", "risk factors", "disclaimer"]
+KEYWORD_SUFFIXES = ["adoption", "investment", "demand", "costs", "strategy", "risk", "outlook", "headwinds",
+                    "tailwinds", "exposure", "pricing", "margin impact"]
+
+
+def mock_sentiment(digest, numeric=False):
+    """
+    Sentiment of a digest: a class, or with numeric a score of the same class (Positive 0.3 to 1.0, Neutral -0.1
+    to 0.1, Negative -1.0 to -0.3).
+    """
+    sentiment = SENTIMENTS[digest[1] % 3]
+    if not numeric:
+        return sentiment
+    if sentiment == "Neutral":
+        return round((digest[2] % 3 - 1) / 10, 1)
+    score = round(0.3 + (digest[2] % 8) / 10, 1)
+    return score if sentiment == "Positive" else -score
+
+
+def mock_annotation(prompt, numeric=None):
+    """
+    Deterministic annotation of a prompt: the same text always gets the same subthemes and sentiment. The sentiment
+    is a +1 to -1 score if numeric (by default: if the prompt asks for that scale).
+    """
+    if numeric is None:
+        numeric = bool(NUMERIC_SCALE_PATTERN.search(prompt))
+    digest = hashlib.sha1(prompt.encode('utf-8')).digest()
+    words = [word for word in re.findall(r'[A-Za-z]{5,}', prompt[-600:])][:3] or ['General']
+    return {
+        "subthemes": [word.title() for word in words[:1 + digest[0] % 3]],
+        "sentiment": mock_sentiment(digest, numeric),
+        "reasoning": "Mock annotation.",
+    }
+
+
+def mock_theme_annotation(text, themes, numeric=False):
+    """Deterministic multi-theme annotation: {"themes": {theme: annotation}}."""
+    return {"themes": {theme: mock_annotation(theme + " " + text, numeric) for theme in themes}}
+
+
+def mock_batch_annotation(prompt, skip_rate=0.0, rng=random):
+    """Answers a batch prompt with a JSON array of annotations (None if the prompt holds no tagged excerpts)."""
+    items = BATCH_ITEM_PATTERN.findall(prompt)
+    if not items:
+        return None
+    numeric = bool(NUMERIC_SCALE_PATTERN.search(prompt))
+    answers = []
+    for excerpt_id, themes, text in items:
+        if rng.random() < skip_rate:
+            continue
+        if themes:
+            answers.append(dict(mock_theme_annotation(text, [theme.strip() for theme in themes.split(',')], numeric),
+                                id=excerpt_id))
+        else:
+            answers.append(dict(mock_annotation(text, numeric), id=excerpt_id))
+    return answers
+
+
+def mock_keywords(theme):
+    """Numbered keyword list for a theme, in the style of the keyword generator's answers."""
+    return "\n".join(f"{number}. {theme} {suffix}" for number, suffix in enumerate(KEYWORD_SUFFIXES, 1))
+
+
+def mock_relevance(prompt):
+    """Deterministic keyword-hit judgement: boilerplate passages are false positives, plus about 1 in 10 others."""
+    passage = RELEVANCE_PASSAGE_PATTERN.findall(prompt)
+    passage = passage[-1] if passage else prompt
+    boilerplate = any(cue in passage.lower() for cue in BOILERPLATE_CUES)
+    relevant = not boilerplate and hashlib.sha1(passage.encode('utf-8')).digest()[0] >= 26
+    return {"relevant": relevant, "reasoning": "Mock judgement."}
+
+
+def mock_response(prompt, respond):
+    """
+    Answer of a single prompt: a keyword list for keyword generation prompts, a relevance judgement for keyword-hit
+    prompts, a multi-theme annotation if the prompt lists its themes, else respond(prompt).
+    """
+    keyword_theme = KEYWORD_THEME_PATTERN.search(prompt)
+    if keyword_theme:
+        return mock_keywords(keyword_theme.group(1))
+    if RELEVANCE_PATTERN.search(prompt):
+        return mock_relevance(prompt)
+    themes = THEMES_PATTERN.search(prompt)
+    if themes:
+        return mock_theme_annotation(prompt, [theme.strip() for theme in themes.group(1).split(',')],
+                                     bool(NUMERIC_SCALE_PATTERN.search(prompt)))
+    return respond(prompt)
+
+
+def mock_content(prompt, respond=mock_annotation, skip_rate=0.0, rng=random):
+    """Message content answering a prompt (batch prompts get a JSON array; objects are JSON-serialised)."""
+    answer = mock_batch_annotation(prompt, skip_rate, rng)
+    if answer is None:
+        answer = mock_response(prompt, respond)
+    return answer if isinstance(answer, str) else json.dumps(answer)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """Handles POST /v1/chat/completions with the settings stored on the server object."""
+
+    def log_message(self, format, *args):  # Keep the console quiet
+        pass
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+
+        # Requests-per-minute limit: a bucket of rpm requests, refilled at rpm / 60 per second
+        with server.lock:
+            server.received += 1
+            if server.rpm:
+                now = time.monotonic()
+                server.allowance = min(server.rpm, server.allowance + (now - server.updated) * server.rpm / 60)
+                server.updated = now
+                if server.allowance < 1:
+                    server.rejected += 1
+                    retry_after = (1 - server.allowance) * 60 / server.rpm
+                    return self._reply(429, {'error': {'message': 'Rate limit reached'}},
+                                       {'Retry-After': f'{retry_after:.2f}'})
+                server.allowance -= 1
+            roll = server.random.random()
+
+        if roll < server.error_rate / 2:
+            with server.lock:
+                server.rejected += 1
+            return self._reply(429, {'error': {'message': 'Rate limit reached'}}, {'Retry-After': str(server.retry_after)})
+        if roll < server.error_rate:
+            return self._reply(500, {'error': {'message': 'Internal server error'}})
+
+        time.sleep(server.latency)
+        prompt = '\n'.join(message['content'] for message in request.get('messages', []))
+        with server.lock:
+            content = mock_content(prompt, server.respond, server.skip_rate, server.random)
+        prompt_tokens, completion_tokens = count_prompt_tokens(prompt), count_tokens(content)
+        with server.lock:
+            server.completed += 1
+        self._reply(200, {
+            'id': f'mock-{server.completed}', 'object': 'chat.completion', 'model': request.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        })
+
+
+def start_mock_server(host='127.0.0.1', port=8011, latency=0.2, rpm=None, error_rate=0.0, retry_after=0.5,
+                      respond=mock_annotation, skip_rate=0.0, seed=0):
+    """
+    Starts the mock server on a background thread.
+
+    Parameters:
+        port (int): Port to listen on (0 picks a free port).
+        latency (float): Seconds to wait before answering.
+        rpm (int or None): Requests per minute before answering 429 with a Retry-After header.
+        error_rate (float): Share of requests answered with a random 429 (half) or 500 (half).
+        retry_after (float): Retry-After seconds of the random 429s.
+        respond (callable): prompt text -> response object (JSON-serialised as the message content) or str.
+        skip_rate (float): Share of batch items left out of batch answers.
+
+    Returns:
+        The server; server.api_base is its base URL, and received / completed / rejected count the requests.
+    """
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.latency, server.rpm, server.error_rate, server.retry_after = latency, rpm, error_rate, retry_after
+    server.respond, server.skip_rate = respond, skip_rate
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    server.allowance, server.updated = float(rpm or 0), time.monotonic()
+    server.received = server.completed = server.rejected = 0
+    server.api_base = f'http://{host}:{server.server_address[1]}/v1'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock OpenAI chat completions server.')
+    parser.add_argument('--port', type=int, default=8011)
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds per response')
+    parser.add_argument('--rpm', type=int, default=None, help='Requests per minute before 429s')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of random 429/500 responses')
+    parser.add_argument('--skip-rate', type=float, default=0.0, help='Share of batch items left out of batch answers')
+    args = parser.parse_args()
+
+    server = start_mock_server(port=args.port, latency=args.latency, rpm=args.rpm, error_rate=args.error_rate,
+                               skip_rate=args.skip_rate)
+    print(f"Mock LLM server listening on {server.api_base} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite cache of LLM annotation responses.
+"""
+
+# Background: Every rerun of the Topic Sentiment Detectors re-sent every excerpt to the LLM and paid for it again,
+# even when only a handful of mentions changed (a theme tweak, a new quarter, a crashed run). This cache stores
+# each response in a SQLite file keyed by a hash of:
+#   - the normalised excerpt text (Unicode NFKC, whitespace collapsed), so re-exported text with different line
+#     breaks or spacing still hits
+#   - any prompt context such as the theme name
+#   - the prompt template version, model and temperature, so changing any of them starts fresh answers
+# Only valid responses are stored, so errors and unparseable answers are retried on the next run.
+
+# How to Use:
+# - cache = ResponseCache(cache_path, model='gpt-4', temperature=0.2, prompt_version=1)
+# - Pass it to the engine: AnnotationEngine(api_key, ..., cache=cache), then engine.annotate(prompts, cache_keys)
+#   with cache_keys = [cache.key(text) for text in excerpts] (add the theme when the prompt depends on it)
+# - print(cache.summary()) reports the hit rate of the run; bump prompt_version whenever the prompt changes
+
+
+#Import Libraries
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import unicodedata
+from contextlib import contextmanager
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_excerpt(text):
+    """Normalises an excerpt for cache keys: Unicode NFKC and collapsed whitespace (case is kept, the LLM sees it)."""
+    return WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFKC', str(text))).strip()
+
+
+class ResponseCache:
+    """
+    Content-addressed store of LLM responses in a SQLite file.
+
+    Parameters:
+        path (str): SQLite file (created with its folder if missing).
+        model (str): Model name, part of every key.
+        temperature (float): Sampling temperature, part of every key.
+        prompt_version (int or str): Prompt template version, part of every key.
+    """
+
+    def __init__(self, path, model, temperature, prompt_version):
+        self.path = path
+        self.model = model
+        self.temperature = temperature
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, content TEXT NOT NULL, model TEXT, prompt_version TEXT, '
+                'prompt_tokens INTEGER, completion_tokens INTEGER, created REAL)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call, so the cache works from any thread (the engine may run in a helper thread)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, text, context=''):
+        """
+        Cache key of an excerpt.
+
+        Parameters:
+            text (str): Excerpt text (normalised before hashing).
+            context (str): Anything else the prompt depends on, e.g. the theme name.
+        """
+        payload = json.dumps([normalize_excerpt(text), context, str(self.prompt_version), self.model,
+                              float(self.temperature)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys):
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._connect() as conn:
+            # Stay under SQLite's limit on query parameters
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = conn.execute(f"SELECT key, content FROM responses WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                found.update(rows)
+        return found
+
+    def contains(self, keys):
+        """Returns the set of keys already in the cache (without counting hits, e.g. to leave them out of a cost estimate)."""
+        return set(self._lookup(keys))
+
+    def get_many(self, keys):
+        """Returns {key: content} for the keys in the cache, and counts hits and misses."""
+        found = self._lookup(keys)
+        hits = sum(key in found for key in keys)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, entries):
+        """
+        Stores responses.
+
+        Parameters:
+            entries (list): (key, content, usage) tuples; usage is the API's token usage dict or None.
+        """
+        if not entries:
+            return
+        now = time.time()
+        rows = [(key, content, self.model, str(self.prompt_version), (usage or {}).get('prompt_tokens'),
+                 (usage or {}).get('completion_tokens'), now) for key, content, usage in entries]
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        self.stored += len(rows)
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def hit_rate(self):
+        """Share of lookups answered from the cache since the cache was opened."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        """One-line description of the cache use so far."""
+        return (f"{self.hits:,} hits / {self.hits + self.misses:,} lookups ({self.hit_rate():.1%} hit rate), "
+                f"{self.stored:,} responses stored, {len(self):,} in {os.path.basename(self.path)}")
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Local first-stage sentiment scoring that sends only uncertain excerpts to the LLM.
+"""
+
+# Background: The Topic Sentiment Detectors sent every matched excerpt to GPT-4 for its sentiment, including the
+# plainly neutral, procedural mentions ("we will discuss AI later in the call"). This module is a cheap first stage
+# that scores every excerpt locally at CPU speed; only the excerpts it is unsure about go to the LLM:
+#   - features: a finance sentiment lexicon in the style of Loughran-McDonald (positive, negative and uncertainty
+#     words; a positive word right after a negation counts as negative), plus hashed word and bigram counts
+#   - model: a logistic regression trained on the sentiments the LLM already gave (checkpoints, earlier outputs)
+#   - routing: part of the labels is held out to find the confidence above which the model agrees with the LLM at
+#     least target_agreement of the time. Excerpts above it are answered locally; the rest go to the LLM
+#   - audit: a share of the confident excerpts still goes to the LLM, so the agreement of the local answers is
+#     measured on every run, not only at training time
+# Local answers give a sentiment only (no subthemes); the detectors record them with sentiment_source = 'local'.
+# The LLM's labels may be classes ("Positive") or scores on a +1 to -1 scale ("0.6"). Scores are bucketed into the
+# three classes for training (|score| <= NEUTRAL_BAND is Neutral), and a model trained mostly on scores answers with
+# scores too: the mean LLM score of the predicted class, so local rows sit on the same scale as the LLM's.
+
+# How to Use:
+# - cascade = SentimentCascade(target_agreement=0.9).fit(llm_texts, llm_sentiments)
+# - print(cascade.describe_validation())
+# - sentiments, confidence = cascade.predict(texts); local, audit = cascade.route(confidence, audit_rate=0.05)
+#   -> send texts[~local | audit] to the LLM, keep sentiments[local & ~audit]
+# - After the run: print(describe_agreement(sentiments[audit], llm_sentiments_of_audited))
+# - The full Loughran-McDonald Master Dictionary (CSV) can replace the built-in word lists: lexicon=load_lexicon(path)
+
+
+#Import Libraries
+import os
+import re
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+NEUTRAL_BAND = 0.2  # Scores within +/- NEUTRAL_BAND count as Neutral
+DEFAULT_CLASS_SCORES = {"Positive": 0.5, "Neutral": 0.0, "Negative": -0.5}
+
+# Compact Loughran-McDonald-style word lists, with a few earnings-call staples ("headwinds", "tailwinds")
+POSITIVE_WORDS = frozenset("""
+    able accelerate accelerated accelerating achieve achieved achievement achievements achieving advance advanced
+    advancement advances advancing advantage advantageous advantages attractive beneficial benefit benefited
+    benefiting benefits best better boost boosted breakthrough breakthroughs confident constructive creative
+    delighted delivered diligent distinction efficiencies efficiency efficient efficiently empower enable
+    enabled enables enabling encouraged encouraging enhance enhanced enhancement enhances enhancing enjoy enjoyed
+    enthusiasm enthusiastic excellent exceptional excited exciting expand expanded expanding expansion favorable
+    favorably gain gained gaining gains good great greater greatest grew growing growth highest ideal impressive
+    improve improved improvement improvements improves improving incredible innovate innovation innovations
+    innovative leadership leading momentum opportunities opportunity optimistic outpace outpaced outperform
+    outperformed outperforming outstanding perfect pleased pleasure popular positive positively profitability
+    profitable progress progressing prosper prosperity rebound rebounded record records resilience resilient
+    rewarding robust satisfied smooth solid stabilize stabilized strength strengthen strengthened strengths strong
+    stronger strongest succeed succeeded success successes successful successfully superior surpass surpassed
+    tailwind tailwinds transformative tremendous unmatched unparalleled upside upturn valuable win winning wins
+""".split())
+
+NEGATIVE_WORDS = frozenset("""
+    abandon abandoned adverse adversely against bankruptcy breach burden cancel canceled cancellation cancelled
+    caution cautious cease challenge challenged challenges challenging claim claims closure closures collapse
+    concern concerned concerns constrained constraint constraints contraction crisis critical damage damaged damages
+    decline declined declines declining decrease decreased decreases decreasing default deficit deficits delay
+    delayed delaying delays deteriorate deteriorated deteriorating deterioration difficult difficulties difficulty
+    disappoint disappointed disappointing disappointment disrupt disrupted disruption disruptions disruptive
+    downgrade downgraded downturn drag dropped erode eroded erosion fail failed failing failure failures fell
+    fraud halt halted hamper hampered harm harmful headwind headwinds hurt impair impaired impairment impairments
+    inability inadequate ineffective inflationary instability interruption investigation lawsuit lawsuits layoff
+    layoffs limitation limitations litigation lose losing loss losses lost negative negatively obstacle obstacles
+    penalties penalty pressure pressured pressures problem problematic problems recall recession recessionary
+    restructure restructuring severe severely shortage shortages shortfall shrink slowdown slower slowing slowed
+    slump soft softer softness struggle struggled struggling suffer suffered suspend suspended terminate terminated
+    termination threat threaten threats tough turmoil uncollectible underperform underperformed unfavorable
+    unfortunately unprofitable unsuccessful volatile weak weaken weakened weakening weaker weakness worse worsen
+    worsened worsening worst writedown writedowns writeoff
+""".split())
+
+UNCERTAINTY_WORDS = frozenset("""
+    almost ambiguity anticipate apparent apparently appear appeared appears approximate approximately assume
+    assumed assumes assuming assumption assumptions believe believed believes could depend depended dependent
+    depending depends doubt doubtful estimate estimated estimates exposure fluctuate fluctuated fluctuates
+    fluctuating fluctuation fluctuations hidden imprecise indefinite likelihood may maybe might nearly pending
+    perhaps possibility possible possibly predict predicted predicting prediction predictions preliminary presume
+    probable probably random reassess risk risks risky roughly seems sometimes speculate speculative suggest
+    suggests tentative tentatively uncertain uncertainties uncertainty unclear unknown unknowns unpredictable
+    unproven unusual variability variable variation vary varying volatility
+""".split())
+
+DEFAULT_LEXICON = {'positive': POSITIVE_WORDS, 'negative': NEGATIVE_WORDS, 'uncertainty': UNCERTAINTY_WORDS}
+
+# Loughran-McDonald negation rule: a positive word within three words after one of these counts as negative
+NEGATION_WORDS = frozenset("not no never none neither nor without cannot isn't aren't wasn't weren't don't doesn't "
+                           "didn't won't haven't hasn't".split())
+NEGATION_WINDOW = 3
+
+WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+def load_lexicon(path):
+    """
+    Reads the Loughran-McDonald Master Dictionary (CSV) into a lexicon.
+
+    Parameters:
+        path (str): The dictionary CSV, with a Word column and Positive / Negative / Uncertainty columns (non-zero
+            = the word belongs to the category).
+
+    Returns:
+        dict of 'positive', 'negative', 'uncertainty' -> frozenset of lower-case words.
+    """
+    table = pd.read_csv(path, keep_default_na=False)
+    words = table['Word'].astype(str).str.lower()
+    return {category: frozenset(words[table[category.title()] != 0]) for category in ('positive', 'negative', 'uncertainty')}
+
+
+def lexicon_counts(text, lexicon=DEFAULT_LEXICON):
+    """
+    Counts the lexicon words of a text.
+
+    Returns:
+        (positive, negative, uncertainty, words) counts; a negated positive word counts as negative.
+    """
+    words = WORD_PATTERN.findall(str(text).lower())
+    positive = negative = uncertainty = 0
+    last_negation = -NEGATION_WINDOW - 1
+    for i, word in enumerate(words):
+        if word in NEGATION_WORDS:
+            last_negation = i
+        elif word in lexicon['positive']:
+            if i - last_negation <= NEGATION_WINDOW:
+                negative += 1
+            else:
+                positive += 1
+        elif word in lexicon['negative']:
+            negative += 1
+        if word in lexicon['uncertainty']:
+            uncertainty += 1
+    return positive, negative, uncertainty, len(words)
+
+
+def lexicon_features(texts, lexicon=DEFAULT_LEXICON):
+    """
+    Dense lexicon features, one row per text: log counts of positive, negative and uncertainty words, the net tone
+    (positive - negative) / (positive + negative + 1), and a flag for texts without any sentiment word.
+    """
+    counts = np.array([lexicon_counts(text, lexicon)[:3] for text in texts], dtype=float).reshape(-1, 3)
+    positive, negative = counts[:, 0], counts[:, 1]
+    tone = (positive - negative) / (positive + negative + 1)
+    no_sentiment = (positive + negative == 0).astype(float)
+    return np.column_stack([np.log1p(counts), tone, no_sentiment])
+
+
+def threshold_for_agreement(agrees, confidence, target_agreement, min_local=20):
+    """
+    Lowest confidence at which the predictions at or above it agree with the LLM at least target_agreement of the
+    time (inf if no threshold reaches it with at least min_local predictions).
+
+    Parameters:
+        agrees (array of bool): Whether each held-out prediction matches the LLM label.
+        confidence (array of float): Probability of each held-out prediction.
+    """
+    order = np.argsort(-confidence, kind='stable')
+    running_agreement = np.cumsum(agrees[order]) / np.arange(1, len(order) + 1)
+    reached = np.flatnonzero(running_agreement >= target_agreement)
+    reached = reached[reached >= min_local - 1]
+    if len(reached) == 0:
+        return np.inf
+    return float(confidence[order][reached.max()])
+
+
+def sentiment_score(label):
+    """The score of a numeric sentiment (0.6, "+0.5", "-1"); None for classes, errors and scores outside +1 to -1."""
+    if isinstance(label, bool):
+        return None
+    try:
+        score = float(label)
+    except (TypeError, ValueError):
+        return None
+    return score if -1.0 <= score <= 1.0 else None
+
+
+def sentiment_class(label):
+    """
+    The class of an LLM sentiment, categorical or numeric.
+
+    Returns:
+        "Positive", "Neutral" or "Negative"; scores above NEUTRAL_BAND are Positive, below -NEUTRAL_BAND Negative.
+        None for errors, empty answers and anything else.
+    """
+    score = sentiment_score(label)
+    if score is not None:
+        return "Positive" if score > NEUTRAL_BAND else "Negative" if score < -NEUTRAL_BAND else "Neutral"
+    if isinstance(label, str) and label.strip().title() in SENTIMENTS:
+        return label.strip().title()
+    return None
+
+
+def agreement(local_sentiments, llm_sentiments):
+    """
+    Share of local sentiments in the same class as the LLM's (ignoring LLM errors); NaN if there is nothing to
+    compare. Scores are compared by class, so 0.5 and 0.7 agree.
+    """
+    pairs = [(sentiment_class(local), sentiment_class(llm)) for local, llm in zip(local_sentiments, llm_sentiments)]
+    pairs = [(local, llm) for local, llm in pairs if llm is not None]
+    return float(np.mean([local == llm for local, llm in pairs])) if pairs else np.nan
+
+
+def describe_agreement(local_sentiments, llm_sentiments):
+    """One-line agreement of the audited local answers with the LLM."""
+    compared = sum(sentiment_class(llm) is not None for llm in llm_sentiments)
+    if not compared:
+        return "no audited excerpts to compare with the LLM"
+    return (f"local sentiment agrees with the LLM on {agreement(local_sentiments, llm_sentiments):.1%} of "
+            f"{compared:,} audited excerpts")
+
+
+class SentimentCascade:
+    """
+    Local sentiment pre-classifier: a finance lexicon and a linear model, trained on the LLM's own labels.
+
+    Parameters:
+        target_agreement (float): Agreement with the LLM required of the locally answered excerpts (estimated on
+            held-out labels); sets the confidence threshold.
+        min_training_examples (int): LLM labels needed to train; with fewer, every excerpt goes to the LLM.
+        lexicon (dict or None): {'positive', 'negative', 'uncertainty': word sets}; None uses the built-in lists.
+        validation_share (float): Share of the labels held out to set the threshold.
+        n_features (int): Size of the hashed word / bigram feature space.
+        seed (int): Seed of the held-out split and of the audit sample.
+    """
+
+    def __init__(self, target_agreement=0.9, min_training_examples=300, lexicon=None, validation_share=0.25,
+                 n_features=2 ** 16, seed=0):
+        self.target_agreement = target_agreement
+        self.min_training_examples = min_training_examples
+        self.lexicon = lexicon or DEFAULT_LEXICON
+        self.validation_share = validation_share
+        self.seed = seed
+        self.vectorizer = HashingVectorizer(ngram_range=(1, 2), n_features=n_features, alternate_sign=False,
+                                            norm='l2')
+        self.contexts = {}
+        self.numeric = False
+        self.class_scores = dict(DEFAULT_CLASS_SCORES)
+        self.model = None
+        self.threshold = np.inf
+        self.validation = None
+        self.training_examples = 0
+
+    @property
+    def trained(self):
+        return self.model is not None
+
+    def features(self, texts, contexts=None):
+        """
+        Sparse feature matrix: hashed words and bigrams, lexicon features and, with contexts (e.g. the theme each
+        excerpt is judged for), a one-hot context column plus the context's net tone column.
+        """
+        texts = [str(text) for text in texts]
+        lexicon = lexicon_features(texts, self.lexicon)
+        blocks = [self.vectorizer.transform(texts), sparse.csr_matrix(lexicon)]
+        if self.contexts:
+            columns = np.array([self.contexts.get(context, -1) for context in (contexts or [None] * len(texts))])
+            rows = np.flatnonzero(columns >= 0)
+            tone = lexicon[rows, 3]
+            context_block = sparse.csr_matrix(
+                (np.concatenate([np.ones(len(rows)), tone]),
+                 (np.concatenate([rows, rows]), np.concatenate([2 * columns[rows], 2 * columns[rows] + 1]))),
+                shape=(len(texts), 2 * len(self.contexts)))
+            blocks.append(context_block)
+        return sparse.hstack(blocks, format='csr')
+
+    def _new_model(self):
+        return LogisticRegression(C=4.0, max_iter=2000)
+
+    def fit(self, texts, labels, contexts=None):
+        """
+        Trains on LLM-labelled excerpts and sets the confidence threshold from a held-out share of them. Labels are
+        classes (Positive / Neutral / Negative) or scores on a +1 to -1 scale, bucketed with sentiment_class; other
+        labels, e.g. errors, are ignored. If most labels are scores, predict answers with scores as well.
+
+        Returns:
+            self (untrained if there are fewer than min_training_examples labels or only one sentiment).
+        """
+        contexts = list(contexts) if contexts is not None else [None] * len(texts)
+        rows = [(str(text), label, context) for text, label, context in zip(texts, labels, contexts)
+                if sentiment_class(label) is not None]
+        self.training_examples = len(rows)
+        self.model, self.threshold, self.validation = None, np.inf, None
+
+        # Scores: answer with the mean LLM score of each predicted class
+        scores = [(sentiment_class(label), sentiment_score(label)) for _, label, _ in rows]
+        scores = [(sentiment, score) for sentiment, score in scores if score is not None]
+        self.numeric = bool(rows) and len(scores) * 2 >= len(rows)
+        self.class_scores = dict(DEFAULT_CLASS_SCORES)
+        for sentiment in SENTIMENTS:
+            class_scores = [score for label, score in scores if label == sentiment]
+            if class_scores:
+                self.class_scores[sentiment] = round(float(np.mean(class_scores)), 2)
+        rows = [(text, sentiment_class(label), context) for text, label, context in rows]
+        if len(rows) < self.min_training_examples or len({label for _, label, _ in rows}) < 2:
+            return self
+
+        texts, labels, contexts = (list(column) for column in zip(*rows))
+        self.contexts = {context: i for i, context in enumerate(sorted({c for c in contexts if c is not None}))}
+        features = self.features(texts, contexts)
+        labels = np.array(labels)
+
+        # Hold out part of the labels to see how often each confidence level agrees with the LLM
+        stratify = labels if min(np.unique(labels, return_counts=True)[1]) >= 2 else None
+        train, held_out = train_test_split(np.arange(len(labels)), test_size=self.validation_share,
+                                           random_state=self.seed, stratify=stratify)
+        model = self._new_model().fit(features[train], labels[train])
+        probabilities = model.predict_proba(features[held_out])
+        predicted, confidence = model.classes_[probabilities.argmax(axis=1)], probabilities.max(axis=1)
+        agrees = predicted == labels[held_out]
+        self.threshold = threshold_for_agreement(agrees, confidence, self.target_agreement)
+        local = confidence >= self.threshold
+        self.validation = {'held_out': len(held_out), 'accuracy': float(agrees.mean()),
+                           'coverage': float(local.mean()),
+                           'agreement': float(agrees[local].mean()) if local.any() else np.nan}
+
+        # The final model learns from every label
+        self.model = self._new_model().fit(features, labels)
+        return self
+
+    def predict(self, texts, contexts=None):
+        """
+        Scores excerpts.
+
+        Returns:
+            (sentiments, confidence) arrays; sentiments are classes, or scores if the model was trained on scores.
+            Without a trained model every sentiment is None with confidence 0.
+        """
+        if not self.trained:
+            return np.array([None] * len(texts), dtype=object), np.zeros(len(texts))
+        probabilities = self.model.predict_proba(self.features(texts, contexts))
+        sentiments = self.model.classes_[probabilities.argmax(axis=1)].astype(object)
+        if self.numeric:
+            sentiments = np.array([self.class_scores[sentiment] for sentiment in sentiments], dtype=object)
+        return sentiments, probabilities.max(axis=1)
+
+    def route(self, confidence, audit_rate=0.0):
+        """
+        Splits excerpts between the local model and the LLM.
+
+        Parameters:
+            confidence (array of float): Confidence of each excerpt (for several labels per excerpt, their minimum).
+            audit_rate (float): Share of the confident excerpts still sent to the LLM to measure agreement.
+
+        Returns:
+            (local, audit) boolean arrays: local = confident enough to answer locally; audit = confident but sent to
+            the LLM as well. Send ~local | audit to the LLM.
+        """
+        confidence = np.asarray(confidence, dtype=float)
+        local = confidence >= self.threshold
+        audit = local & (np.random.default_rng(self.seed).random(len(confidence)) < audit_rate)
+        return local, audit
+
+    def describe_validation(self):
+        """One-line description of the trained model and its held-out agreement with the LLM."""
+        if not self.trained:
+            return (f"not trained ({self.training_examples:,} LLM labels, {self.min_training_examples:,} needed); "
+                    f"every excerpt goes to the LLM")
+        validation = self.validation
+        scale = " (+1 to -1 scores)" if self.numeric else ""
+        line = (f"trained on {self.training_examples:,} LLM labels{scale}; held-out agreement {validation['accuracy']:.1%} "
+                f"on {validation['held_out']:,} excerpts")
+        if not np.isfinite(self.threshold):
+            return line + f"; no confidence level reaches {self.target_agreement:.0%} agreement, every excerpt goes to the LLM"
+        return (line + f"; at confidence >= {self.threshold:.2f} it answers {validation['coverage']:.0%} locally with "
+                f"{validation['agreement']:.1%} agreement")
+
+
+def read_llm_labels(paths, text_column='transcript_text', sentiment_column='sentiment'):
+    """
+    Reads the sentiments the LLM gave in earlier processed outputs, as extra training labels.
+
+    Parameters:
+        paths (list): Processed output files (.xlsx, .csv or .parquet); missing files are skipped.
+        text_column (str): Column holding the excerpt text.
+        sentiment_column (str): Column holding the sentiment.
+
+    Returns:
+        (texts, sentiments) lists; rows answered locally (sentiment_source = 'local') and errors are left out.
+    """
+    texts, sentiments = [], []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠️ Training file not found, skipped: {path}")
+            continue
+        if path.endswith('.csv'):
+            table = pd.read_csv(path)
+        elif path.endswith('.parquet'):
+            table = pd.read_parquet(path)
+        else:
+            table = pd.read_excel(path)
+        if 'sentiment_source' in table.columns:
+            table = table[table['sentiment_source'] != 'local']
+        table = table[table[sentiment_column].map(sentiment_class).notna()]
+        texts += table[text_column].astype(str).tolist()
+        sentiments += table[sentiment_column].tolist()
+    return texts, sentiments
@@ -5,12 +5,24 @@ Created on Thu Feb 27 12:49:45 2025
 @author: Steven.Fandozzi
 """
 
-import openai  # OpenAI API for keyword generation
 import pandas as pd  # Pandas for exporting results to Excel
 import os  # OS module for handling file paths
+import sys
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Make the helper modules in this folder importable when run from Spyder or another working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# The LLM backend is shared with the Topic Sentiment Detectors (Thematic Analysis/llm_backend.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Thematic Analysis'))
+from vocab_tuning import clean_keyword_lines, tune_vocabulary
+from transcript_index import TranscriptIndex
+from llm_backend import OpenAIBackend, FakeBackend
 
 # Replace this with your OpenAI API key
-openai.api_key = "YOUR_OPENAI_API_KEY"
+API_KEY = "YOUR_OPENAI_API_KEY"
 
 # Define the path where the generated Excel files will be saved
 SAVE_PATH = "C:/Users/YourUsername/Documents/KeywordExports/"  # Change this to your desired path
@@ -19,16 +31,63 @@ SAVE_PATH = "C:/Users/YourUsername/Documents/KeywordExports/"  # Change this to
 if not os.path.exists(SAVE_PATH):
     os.makedirs(SAVE_PATH)
 
-def generate_thematic_keywords(theme, num_keywords=None):
-    """
-    Generates a list of descriptive keywords related to a given theme using OpenAI's API.
+# Optional vocabulary tuning against the local corpus (see vocab_tuning.py); built by 02_Transcript_Index.py.
+# If the index file does not exist, the cleaned keywords are exported without tuning.
+INDEX_FILE_PATH = r'S:\Strategy Research\Transcripts\Data\Index\Transcript Index.pkl'
 
-    Parameters:
-        theme (str): The theme for which keywords should be generated.
-        num_keywords (int or None): Number of keywords to generate. If None, OpenAI determines the length.
+# Model settings. USE_FAKE_LLM = True swaps the API for a local deterministic stand-in (offline runs and tests).
+USE_FAKE_LLM = False
+MODEL = "gpt-4"
+MAX_TOKENS = 800  # Increased token limit to allow more keywords
+
+if USE_FAKE_LLM:
+    backend = FakeBackend(latency=0.5)
+else:
+    backend = OpenAIBackend(API_KEY, model=MODEL, temperature=1.0)
+
+# Raw responses are cached on disk, one JSON file per (theme, model, num_keywords, prompt version), so rebuilding
+# a vocabulary never pays twice for the same request. Bump PROMPT_VERSION whenever the prompt text changes.
+PROMPT_VERSION = 1
+CACHE_PATH = os.path.join(SAVE_PATH, "Response Cache")
+
+# Batch mode: generate every theme in BATCH_THEMES concurrently (at most MAX_CONCURRENT_REQUESTS at a time) and
+# merge the results into one Thematic Vocab.xlsx-shaped table (one column per theme). Leave BATCH_THEMES empty
+# for the interactive single-theme prompt.
+BATCH_THEMES = []  # e.g. ["AI", "Tariffs", "Supply Chains", "Consumer Weakness"]
+BATCH_NUM_KEYWORDS = None
+MAX_CONCURRENT_REQUESTS = 4
+VOCAB_BASE_FILE_PATH = None  # e.g. r'S:\Strategy Research\Transcripts\Additional\Themes\Thematic Vocab.xlsx'
+VOCAB_OUTPUT_FILE_PATH = os.path.join(SAVE_PATH, "Thematic Vocab.xlsx")
+
+def cache_key(theme, model=backend.model, num_keywords=None, prompt_version=PROMPT_VERSION):
+    """Stable hash of everything that determines the response (the theme is matched case-insensitively)."""
+    key = json.dumps([theme.strip().lower(), model, num_keywords, prompt_version])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def load_cached_response(theme, num_keywords=None, model=backend.model, cache_path=CACHE_PATH):
+    """Returns the cached raw response text of a request, or None."""
+    path = os.path.join(cache_path, cache_key(theme, model, num_keywords) + ".json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["response"]
+
+def save_cached_response(theme, num_keywords, response, model=backend.model, cache_path=CACHE_PATH):
+    """Stores a raw response text (written to a temporary file first, so a crash never leaves a broken entry)."""
+    os.makedirs(cache_path, exist_ok=True)
+    path = os.path.join(cache_path, cache_key(theme, model, num_keywords) + ".json")
+    entry = {"theme": theme, "model": model, "num_keywords": num_keywords, "prompt_version": PROMPT_VERSION,
+             "created": time.strftime("%Y-%m-%d %H:%M:%S"), "response": response}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(entry, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def request_keywords(theme, num_keywords=None):
+    """
+    Sends one keyword generation request through the LLM backend.
 
     Returns:
-        List of keywords.
+        The raw response text (one keyword per line). Raises on API errors (llm_backend.RateLimitError / BackendError).
     """
 
     # Define the system's role for better control over responses
@@ -53,25 +112,41 @@ def generate_thematic_keywords(theme, num_keywords=None):
     Each keyword should be written on a new line.
     """
 
+    # Making a request to the model (MODEL, or the fake stand-in)
+    response = backend.complete(
+        [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=MAX_TOKENS
+    )
+
+    # Extracting the generated text from the response
+    return response['content']
+
+def generate_thematic_keywords(theme, num_keywords=None, use_cache=True):
+    """
+    Generates a list of descriptive keywords related to a given theme using OpenAI's API.
+
+    Parameters:
+        theme (str): The theme for which keywords should be generated.
+        num_keywords (int or None): Number of keywords to generate. If None, OpenAI determines the length.
+        use_cache (bool): Reuse a cached response for the same request instead of calling the API.
+
+    Returns:
+        List of keywords.
+    """
     try:
-        # Making a request to OpenAI's GPT-4 model
-        response = openai.ChatCompletion.create(
-            model="gpt-4",  # Using the latest GPT model for accuracy
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=800  # Increased token limit to allow more keywords
-        )
-
-        # Extracting the generated text from the API response
-        keywords = response['choices'][0]['message']['content']
+        keywords = load_cached_response(theme, num_keywords) if use_cache else None
+        if keywords is None:
+            keywords = request_keywords(theme, num_keywords)
+            save_cached_response(theme, num_keywords, keywords)
 
         # Splitting the response into a list, assuming each keyword is on a new line
         keyword_list = keywords.split("\n")
 
-        # Cleaning up any empty or whitespace-only keywords
-        cleaned_keywords = [kw.strip() for kw in keyword_list if kw.strip()]
+        # Cleaning up numbering ("1. "), bullets, quotes, explanations, empty lines and duplicates
+        cleaned_keywords = clean_keyword_lines(keyword_list)
 
         return cleaned_keywords
 
@@ -79,13 +154,110 @@ def generate_thematic_keywords(theme, num_keywords=None):
         print(f"Error occurred: {e}")
         return []
 
-def export_to_excel(theme, keywords):
+def generate_keywords_batch(themes, num_keywords=None, max_concurrent_requests=MAX_CONCURRENT_REQUESTS, use_cache=True):
+    """
+    Generates the keywords of several themes, sending the uncached requests concurrently.
+
+    The LLM backend is synchronous and the requests wait on the network, so a thread pool of
+    max_concurrent_requests threads is enough to overlap them. Cache hits never reach the API.
+
+    Parameters:
+        themes (list): Themes to generate (duplicates are generated once).
+        num_keywords (int or None): Number of keywords per theme.
+        max_concurrent_requests (int): Maximum number of requests in flight.
+        use_cache (bool): Reuse cached responses.
+
+    Returns:
+        dict of theme -> list of keywords, in the order of themes (failed themes get an empty list).
+    """
+    themes = list(dict.fromkeys(themes))
+    cached = {theme: load_cached_response(theme, num_keywords) if use_cache else None for theme in themes}
+    to_request = [theme for theme in themes if cached[theme] is None]
+    print(f"Keyword generation: {len(themes) - len(to_request)} of {len(themes)} themes cached, "
+          f"{len(to_request)} to request.")
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrent_requests)) as executor:
+        futures = {executor.submit(request_keywords, theme, num_keywords): theme for theme in to_request}
+        for future in as_completed(futures):
+            theme = futures[future]
+            try:
+                cached[theme] = future.result()
+                save_cached_response(theme, num_keywords, cached[theme])
+                print(f"✅ {theme}: generated")
+            except Exception as e:
+                print(f"❌ {theme}: {e}")
+    print(f"Keyword generation finished in {time.time() - start_time:.1f} seconds.")
+
+    return {theme: clean_keyword_lines(cached[theme].split("\n")) if cached[theme] is not None else []
+            for theme in themes}
+
+def build_vocab_table(theme_keywords, base_vocab_df=None):
+    """
+    Arranges keyword lists in the Thematic Vocab.xlsx layout: one column per theme (the column name is the
+    theme), keywords below it, shorter columns padded with blanks. 01_Keyword_Filter.py adds the column name
+    itself as a keyword, so a keyword equal to the theme is not repeated.
+
+    Parameters:
+        theme_keywords (dict): Theme -> list of keywords.
+        base_vocab_df (pd.DataFrame or None): An existing vocabulary; its themes are kept and themes with the
+                                              same name are replaced.
+
+    Returns:
+        pd.DataFrame
+    """
+    columns = {} if base_vocab_df is None else {col: base_vocab_df[col].dropna().to_list() for col in base_vocab_df.columns}
+    for theme, keywords in theme_keywords.items():
+        if keywords:
+            columns[theme] = [keyword for keyword in keywords if keyword.lower() != theme.lower()]
+    return pd.DataFrame({col: pd.Series(keywords, dtype=object) for col, keywords in columns.items()})
+
+def load_index(index_file_path=INDEX_FILE_PATH):
+    """Loads the transcript index used for vocabulary tuning, or returns None if there is no index file."""
+    if not index_file_path or not os.path.exists(index_file_path):
+        print(f"No transcript index at {index_file_path}; skipping vocabulary tuning.")
+        return None
+    return TranscriptIndex.load(index_file_path)
+
+def tune_keywords(theme, keywords, index=None, n_expansions=25):
+    """
+    Scores the generated keywords against the transcript index and drops zero-hit, stopword-like and
+    unrelated (low PMI) terms, with the theme name as the seed term.
+
+    Parameters:
+        index (TranscriptIndex or None): The loaded index; None loads INDEX_FILE_PATH (pass it in when tuning
+                                         several themes, so the index is only loaded once).
+        n_expansions (int): Number of suggested expansions to mine (0 skips the mining).
+
+    Returns:
+        lean_keywords (list), scores (pd.DataFrame or None), expansions (pd.DataFrame or None).
+        Without an index file, the keywords are returned unchanged.
+    """
+    if index is None:
+        index = load_index()
+        if index is None:
+            return keywords, None, None
+
+    lean_keywords, scores, expansions = tune_vocabulary(index, keywords, seed_keywords=[theme],
+                                                        n_expansions=n_expansions)
+    lean_keywords = [keyword for keyword in lean_keywords if keyword.lower() != theme.lower()]
+
+    print(f"\nVocabulary tuning: kept {len(lean_keywords)} of {len(keywords)} keywords.")
+    print(scores.to_string(index=False))
+    if len(expansions):
+        print("\nSuggested expansions (terms that co-occur with the theme far more often than chance):")
+        print(expansions.to_string(index=False))
+    return lean_keywords, scores, expansions
+
+def export_to_excel(theme, keywords, scores=None, expansions=None):
     """
     Saves the generated keywords to an Excel file at a specified path.
 
     Parameters:
         theme (str): The theme used for keyword generation.
         keywords (list): List of generated keywords.
+        scores (pd.DataFrame or None): Vocabulary tuning statistics, exported as a second sheet.
+        expansions (pd.DataFrame or None): Suggested expansions, exported as a third sheet.
     """
 
     # Create a Pandas DataFrame from the keyword list
@@ -95,12 +267,37 @@ def export_to_excel(theme, keywords):
     filename = f"{theme.replace(' ', '_')}_keywords.xlsx"
     filepath = os.path.join(SAVE_PATH, filename)
 
-    # Export the DataFrame to an Excel file
-    df.to_excel(filepath, index=False)
+    # Export the DataFrame to an Excel file (plus the tuning report, if any)
+    with pd.ExcelWriter(filepath) as writer:
+        df.to_excel(writer, sheet_name="Keywords", index=False)
+        if scores is not None:
+            scores.to_excel(writer, sheet_name="Keyword Statistics", index=False)
+        if expansions is not None:
+            expansions.to_excel(writer, sheet_name="Suggested Expansions", index=False)
 
     print(f"\n✅ Keywords successfully saved to {filepath}!")
 
-if __name__ == "__main__":
+def run_batch(themes=BATCH_THEMES, num_keywords=BATCH_NUM_KEYWORDS, tune=True):
+    """
+    Generates every theme, optionally tunes each list against the corpus, and writes one vocabulary workbook.
+    The index is loaded once for all themes, and no expansions are mined (the workbook only holds keywords).
+    """
+    theme_keywords = generate_keywords_batch(themes, num_keywords)
+    index = load_index() if tune else None
+    if index is not None:
+        theme_keywords = {theme: tune_keywords(theme, keywords, index, n_expansions=0)[0] if keywords else keywords
+                          for theme, keywords in theme_keywords.items()}
+
+    base_vocab_df = pd.read_excel(VOCAB_BASE_FILE_PATH) if VOCAB_BASE_FILE_PATH else None
+    vocab_df = build_vocab_table(theme_keywords, base_vocab_df)
+    vocab_df.to_excel(VOCAB_OUTPUT_FILE_PATH, index=False)
+    print(f"\n✅ Vocabulary with {vocab_df.shape[1]} themes saved to {VOCAB_OUTPUT_FILE_PATH}!")
+    return vocab_df
+
+if __name__ == "__main__" and BATCH_THEMES:
+    run_batch()
+
+elif __name__ == "__main__":
     # Prompting user for theme input
     theme_input = input("Enter a theme: ")
 
@@ -118,6 +315,9 @@ if __name__ == "__main__":
     for i, kw in enumerate(keywords, 1):
         print(f"{i}. {kw}")
 
+    # Pruning the keywords against the local corpus and mining expansions
+    keywords, scores, expansions = tune_keywords(theme_input, keywords)
+
     # Exporting the keywords to the specified save path
-    export_to_excel(theme_input, keywords)
+    export_to_excel(theme_input, keywords, scores, expansions)
 
@@ -12,50 +12,140 @@ Created on Thu Jan 18 10:46:59 2024
 # - Ensure the transcript and keyword files are located in the specified file paths.
 # - Run the script to process transcripts, extract thematic mentions, and export results to an Excel file.
 # - The final output includes filtered transcripts with keyword counts, structured for further analysis.
+# - With use_filter_cache, repeat runs only re-process new/edited transcripts and themes whose keywords changed;
+#   the exported mentions are then rebuilt from the refreshed cache. After a theme edit, only that theme is
+#   re-matched (sentence splits and the other themes' counts are cached), but context selection and excerpt
+#   building rerun over every transcript, because excerpt windows merge the hits of all themes.
 
-# Output: Raw Thematic Mentions.xlsx (exported in parts if it exceeds Excel's row limit)
-# Input: Thematic Vocab.xlsx (list of thematic keywords) and multiple transcript files (RAW 2021-2024)
+# Output: RAW Thematic Mentions dataset (Parquet, partitioned by theme and quarter, see mentions_dataset.py)
+#         and optionally Raw Thematic Mentions.xlsx (exported in parts if it exceeds Excel's row limit)
+# Input: Thematic Vocab.xlsx (list of thematic keywords) and every yearly transcript file (RAW 20xx-Cal TRANSCRIPT.xlsx)
 
 
 #Import Libraries
+import os
+import sys
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, date
 import datetime
-import re
 from tqdm import tqdm
 import time
 from tqdm import tqdm
 tqdm.pandas()  # Enable the tqdm progress bar for pandas
 
+# Make the helper modules in this folder importable when run from Spyder or another working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from transcript_index import TranscriptIndex, text_hash
+from theme_query import keywords_to_query, count_theme_queries
+from mention_filter import (GROUP_COLUMNS, MAX_SENT_LENGTH, split_transcripts, sentence_boundaries,
+                            compile_keyword_patterns, match_theme, match_keywords, combine_theme_hits,
+                            build_keyword_table, compact_counts,
+                            QA_START_COLUMN, section_counts, section_count_columns, transcript_stats, add_intensity,
+                            intensity_column,
+                            select_context_sentences, build_excerpts, log_memory, print_memory_report)
+from filter_cache import (definition_hash, theme_set_signature, document_cache_keys, cached_sentence_boundaries,
+                          cached_keyword_counts, prune_theme_counts, load_cached_excerpts, save_cached_excerpts)
+from sharded_filter import run_sharded_filter
+from token_matcher import NORMALIZED_MODE, NormalizedMatcher
+from near_duplicates import drop_near_duplicates
+from transcript_loader import load_transcript_workbooks
+from mentions_dataset import write_mentions_dataset
+from false_positive_filter import (RELEVANCE_PROMPT_VERSION, hit_table, sample_hits, llm_relevance_labels,
+                                   FalsePositiveClassifier, drop_hits, subtract_counts)
+# The LLM client is shared with the Topic Sentiment Detectors (Thematic Analysis folder)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Thematic Analysis'))
+from llm_annotation import AnnotationEngine
+from llm_backend import OpenAIBackend, FakeBackend
+from response_cache import ResponseCache
+from cost_governor import CostGovernor
+
+# Matching Settings
+# - use_index_matching: count themes as queries over the transcript index instead of regex scans
+# - theme_query_file_path: optional workbook with 'Theme' and 'Query' columns (see theme_query.py for the syntax);
+#   its themes are added to, or override, the keyword-list themes from Thematic Vocab.xlsx
+# - use_normalized_matching: match keywords on normalized tokens (lowercased, hyphen-split, lightly stemmed), so
+#   "tariff" also finds "tariffs" and "automation" finds "automating" without listing every variant (see token_matcher.py)
+use_index_matching = False
+use_normalized_matching = False
+theme_query_file_path = None  # e.g. r'S:\Strategy Research\Transcripts\Additional\Themes\Thematic Queries.xlsx'
+
+# Deduplication Settings
+# - use_near_duplicate_detection: group corrected/re-issued copies and the same call under two tickers with
+#   MinHash/LSH and keep the best copy (see near_duplicates.py); False uses the old 'Event Type Length' rule
+use_near_duplicate_detection = True
+
+# Cache Settings
+# - use_filter_cache: only re-process new/edited transcripts and changed themes (see filter_cache.py)
+use_filter_cache = True
+
+# Execution Settings
+# - use_sharded_execution: split/match/combine transcripts on a process pool, sharded by ticker (see sharded_filter.py).
+#   Uses regex matching and the excerpt cache; the per-theme count cache is only used by the single-process run.
+# - n_shard_workers: number of worker processes (None = one per core)
+use_sharded_execution = False
+n_shard_workers = None
+
+# Output Settings
+# - export_excel_parts: also write the RAW Thematic Mentions_part{i}.xlsx files (slow; for manual review in Excel)
+export_excel_parts = False
+
+# Memory Settings
+# - use_compact_dtypes: categorical metadata, Arrow-backed sentence text and smallest unsigned int counts
+#   (a memory report of every stage is printed after the excerpts are built)
+use_compact_dtypes = True
+memory_log = []
+
+# False Positive Settings
+# - use_false_positive_filter: an LLM judges a sample of the keyword hits (does the hit refer to its theme?), a local
+#   classifier trained on those judgements scores every hit, and the likely false positives (unrelated senses of a
+#   keyword, disclaimer boilerplate, ...) are dropped from the excerpts and counts (see false_positive_filter.py).
+#   Needs keyword-level hits, i.e. regex or normalized matching.
+# - fp_sample_size: hits judged by the LLM (cached, so a rerun only pays for hits it has not judged yet)
+# - fp_target_precision: share of the dropped hits that must be false positives according to held-out judgements
+# - fp_use_fake_llm: judge with the offline stand-in (Thematic Analysis/llm_backend.py) for a dry run
+use_false_positive_filter = False
+fp_sample_size = 1000
+fp_target_precision = 0.9
+fp_use_fake_llm = False
+fp_api_key = "YOUR_OPENAI_API_KEY"
+fp_model = "gpt-4"
+fp_max_cost = 10.0  # Budget cap of the judgements in USD (GPT-4 prices below)
+fp_cost_input_per_1k = 0.03
+fp_cost_output_per_1k = 0.06
+
 # Define file paths for various datasets involved in the analysis.
-transcript_file_path_21 = r'S:\Strategy Research\Transcripts\Data\Excel\RAW 2021-Cal TRANSCRIPT.xlsx'
-transcript_file_path_22 = r'S:\Strategy Research\Transcripts\Data\Excel\RAW 2022-Cal TRANSCRIPT.xlsx'
-transcript_file_path_23 = r'S:\Strategy Research\Transcripts\Data\Excel\RAW 2023-Cal TRANSCRIPT.xlsx'
-transcript_file_path_24 = r'S:\Strategy Research\Transcripts\Data\Excel\RAW 2024-Cal TRANSCRIPT.xlsx'
-#transcript_file_path_25 = r'S:\Strategy Research\AI Productivity Estimate\AI Monitor\Dataset\Excel\RAW 2025-Cal TRANSCRIPT.xlsx'
+# Every 'RAW <year>-Cal TRANSCRIPT.xlsx' workbook in transcript_folder is loaded (new years are picked up automatically);
+# each workbook is converted once to a Parquet sidecar in transcript_sidecar_dir and re-read only when it changes
+transcript_folder = r'S:\Strategy Research\Transcripts\Data\Excel'
+transcript_sidecar_dir = r'S:\Strategy Research\Transcripts\Data\Parquet'
+first_transcript_year = 2021
 keyword_file_path = r'S:\Strategy Research\Transcripts\Additional\Themes\Thematic Vocab.xlsx'
 sector_file_path = r'S:\Strategy Research\Transcripts\Additional\Tickers_ALL.xlsx'
+index_file_path = r'S:\Strategy Research\Transcripts\Data\Index\Transcript Index.pkl'
 
 
 export_mentions_file_path = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\RAW Thematic Mentions'
+export_mentions_dataset_dir = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\RAW Thematic Mentions Dataset'
+filter_cache_dir = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\Filter Cache'
+shard_work_dir = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\Shards'
+fp_label_cache_path = r'S:\Strategy Research\Transcripts\Data\Thematic Mentions\False Positive Judgements.sqlite'
+
+
+if use_sharded_execution and use_index_matching:
+    raise ValueError("Sharded execution matches keywords with regex; set use_index_matching = False.")
+if use_index_matching and use_normalized_matching:
+    raise ValueError("Choose one matching mode: use_index_matching or use_normalized_matching.")
 
 
 #%% Source Data - Load Transcripts and Thematic Vocabulary
 
 #Import Data
-transcript_df_21 = pd.read_excel(transcript_file_path_21)
-transcript_df_22 = pd.read_excel(transcript_file_path_22)
-transcript_df_23 = pd.read_excel(transcript_file_path_23)
-transcript_df_24 = pd.read_excel(transcript_file_path_24)
-#transcript_df_25 = pd.read_excel(transcript_file_path_25)
+# Load every yearly transcript workbook into a single DataFrame (parallel conversion, cached as Parquet)
+transcript_df = load_transcript_workbooks(transcript_folder, transcript_sidecar_dir, first_year=first_transcript_year)
 thematic_vocab_df = pd.read_excel(keyword_file_path)
 sectors_df = pd.read_excel(sector_file_path)
 
-# Concatenate the individual year transcript DataFrames into a single DataFrame for ease of analysis
-transcript_df = pd.concat([transcript_df_21, transcript_df_22, transcript_df_23, transcript_df_24], ignore_index=True)
-#transcript_df = pd.concat([transcript_df_21, transcript_df_22, transcript_df_23, transcript_df_24, transcript_df_25], ignore_index=True)
-
 #%% Transform Data - Cleaning and Structuring
 
 
@@ -67,8 +157,12 @@ transcript_df['Transcript - QA'] = transcript_df['Transcript - QA'].fillna('') +
 # Combine 'Transcript - Mgmt' and 'Transcript - QA' into one column called 'Transcript'
 transcript_df['Transcript'] = transcript_df['Transcript - Mgmt'].fillna('') + "\n" + transcript_df['Transcript - QA'].fillna('')
 
+# Remember where the Q&A section starts in the combined text, so every mention can be attributed to
+# Management (unprompted) or Q&A (analyst-prompted) without keeping the two sections apart
+transcript_df[QA_START_COLUMN] = transcript_df['Transcript - Mgmt'].str.len() + 1
+
 # Reorder DataFrame columns to prioritize important identifiers and the newly created 'Transcript' column, making the DataFrame more organized for analysis
-transcript_df = transcript_df[['Ticker', 'Company Name', 'Event Type', 'Date', 'Transcript']]
+transcript_df = transcript_df[['Ticker', 'Company Name', 'Event Type', 'Date', 'Transcript', QA_START_COLUMN]]
 
 #%% Extract and Organize Keywords
 
@@ -88,215 +182,353 @@ for col in column_names:
     # Store the keywords list in the dictionary
     keyword_dict[variable_name] = keywords
 
-#%% Remove Duplicates 
-
-# Copy DF
-filtered_transcript = transcript_df.copy()
+# Global keyword / theme ids used by the keyword-level hit records ('Hit Keyword IDs', 'Hit Theme IDs')
+keyword_table = build_keyword_table(keyword_dict)
 
-# Add 'Earnings' column based on the condition
-filtered_transcript['Earnings'] = (filtered_transcript['Event Type'].str.lower().str.contains('earnings')).astype(int)
+# Themes defined as boolean / proximity queries (only used with use_index_matching)
+theme_query_dict = {}
+if use_index_matching:
+    theme_query_dict = {variable_name: keywords_to_query(keywords) for variable_name, keywords in keyword_dict.items()}
+    if theme_query_file_path is not None:
+        theme_queries_df = pd.read_excel(theme_query_file_path).dropna(subset=['Theme', 'Query'])
+        for theme, query in zip(theme_queries_df['Theme'], theme_queries_df['Query']):
+            theme_query_dict[theme.replace(' ', '_').lower() + "_keywords"] = query
 
-# Split into earnings and non-earnings transcripts using boolean indexing
-earnings_transcripts = filtered_transcript[filtered_transcript['Earnings'] == 1]
-non_earnings_transcripts = filtered_transcript[filtered_transcript['Earnings'] == 0]
+#%% Remove Duplicates 
 
-# Drop exact duplicates for non-earnings transcripts
-non_earnings_transcripts = non_earnings_transcripts.drop_duplicates(subset=['Ticker', 'Date', 'Event Type'])
+if use_near_duplicate_detection:
+    # Drop exact re-entries of the same event first, then near-duplicate copies across dates, years and tickers
+    transcript_df = transcript_df.drop_duplicates(subset=['Ticker', 'Date', 'Event Type'])
+    transcript_df, duplicates_df = drop_near_duplicates(transcript_df)
+    transcript_df = transcript_df.sort_values(by=['Ticker', 'Date'])
+    print(f"Near-duplicates: {duplicates_df['Duplicate Group'].nunique():,} groups, "
+          f"{(~duplicates_df['Kept']).sum():,} copies dropped.")
+else:
+    # Copy DF
+    filtered_transcript = transcript_df.copy()
 
-# Calculate title length without apply()
-earnings_transcripts['Event Type Length'] = earnings_transcripts['Event Type'].str.len()
+    # Add 'Earnings' column based on the condition
+    filtered_transcript['Earnings'] = (filtered_transcript['Event Type'].str.lower().str.contains('earnings')).astype(int)
 
-# Sort and drop duplicates in one line to avoid multiple sorting
-earnings_transcripts = (earnings_transcripts.sort_values(by='Event Type Length', ascending=False)
-                        .drop_duplicates(subset=['Ticker', 'Date', 'Earnings']))
+    # Split into earnings and non-earnings transcripts using boolean indexing
+    earnings_transcripts = filtered_transcript[filtered_transcript['Earnings'] == 1]
+    non_earnings_transcripts = filtered_transcript[filtered_transcript['Earnings'] == 0]
 
-# Combine the processed DataFrames
-final_transcript = pd.concat([non_earnings_transcripts, earnings_transcripts], ignore_index=True)
+    # Drop exact duplicates for non-earnings transcripts
+    non_earnings_transcripts = non_earnings_transcripts.drop_duplicates(subset=['Ticker', 'Date', 'Event Type'])
 
-# Sort once at the end if necessary
-final_transcript = final_transcript.sort_values(by=['Ticker', 'Date'])
+    # Calculate title length without apply()
+    earnings_transcripts['Event Type Length'] = earnings_transcripts['Event Type'].str.len()
 
-final_transcript = final_transcript.drop(columns=['Earnings', 'Event Type Length'])
+    # Sort and drop duplicates in one line to avoid multiple sorting
+    earnings_transcripts = (earnings_transcripts.sort_values(by='Event Type Length', ascending=False)
+                            .drop_duplicates(subset=['Ticker', 'Date', 'Earnings']))
 
-transcript_df = final_transcript.copy()
+    # Combine the processed DataFrames
+    final_transcript = pd.concat([non_earnings_transcripts, earnings_transcripts], ignore_index=True)
 
-#%% Split Transcripts By Sentence
+    # Sort once at the end if necessary
+    final_transcript = final_transcript.sort_values(by=['Ticker', 'Date'])
 
-# Function to split transcript texts into individual sentences based on common end-of-sentence punctuation
-def split_text_optimized(text):
-    # Check for non-empty text and split using precompiled regex for better performance
-    if len(text) > 0:
-        return re.split(r'(?<=[.!?]) +', text)
-    return []
+    final_transcript = final_transcript.drop(columns=['Earnings', 'Event Type Length'])
 
-# Apply the optimized splitting function and explode the DataFrame
-print("Step 1: Splitting transcripts into sentences...")
-transcript_df['Transcript'] = transcript_df['Transcript'].apply(split_text_optimized)
-transcript_df = transcript_df.explode('Transcript').reset_index(drop=True)
+    transcript_df = final_transcript.copy()
 
-print("Step 1 Complete: Transcripts split into sentences.")
+log_memory(memory_log, 'Transcripts (deduplicated)', transcript_df)
 
-#%% Keyword Counting
+#%% Incremental Cache - Reuse Results for Unchanged Transcripts and Themes
 
-# Precompile regex patterns for all keywords
-print("Step 2: Precompiling keyword patterns...")
-compiled_keyword_dict = {
-    variable_name: re.compile(r'\b(?:' + '|'.join(map(re.escape, keywords)) + r')\b', flags=re.IGNORECASE)
-    for variable_name, keywords in keyword_dict.items()
+# Each theme is identified by a hash of its definition (keyword list, or query in index mode)
+matching_mode = 'index' if use_index_matching else NORMALIZED_MODE if use_normalized_matching else 'regex'
+theme_definitions = theme_query_dict if use_index_matching else keyword_dict
+theme_hashes = {
+    variable_name.replace('_keywords', '_keyword_count'): definition_hash(definition, matching_mode)
+    for variable_name, definition in theme_definitions.items()
 }
+excerpt_signature = theme_set_signature(theme_hashes, MAX_SENT_LENGTH)
+
+# Each transcript is identified by its metadata and a hash of its text (plus the section boundary for its excerpts)
+transcript_df['Text Hash'] = transcript_df['Transcript'].map(text_hash)
+transcript_df['Cache Key'] = document_cache_keys(transcript_df, transcript_df['Text Hash'] + '|'
+                                                 + transcript_df[QA_START_COLUMN].astype(str), GROUP_COLUMNS)
+
+if use_filter_cache:
+    cached_excerpts, cached_stats, cached_keys = load_cached_excerpts(filter_cache_dir, excerpt_signature)
+    current_keys = set(transcript_df['Cache Key'])
+    reused_keys = cached_keys & current_keys
+    reused_excerpts = cached_excerpts[cached_excerpts['Cache Key'].isin(reused_keys)]
+    reused_stats = cached_stats[cached_stats['Cache Key'].isin(reused_keys)]
+    new_transcript_df = transcript_df[~transcript_df['Cache Key'].isin(reused_keys)]
+    print(f"Filter cache: {len(reused_keys):,} transcripts reused, {len(new_transcript_df):,} to process.")
+else:
+    reused_excerpts = pd.DataFrame(columns=['Cache Key'])
+    reused_stats = pd.DataFrame(columns=['Cache Key'])
+    new_transcript_df = transcript_df
+
+#%% Sharded Execution (optional)
+
+# Split, count, filter and combine on a process pool; each batch of tickers is written to its own file
+if use_sharded_execution:
+    print("Steps 1-5: Running the keyword filter on a process pool, sharded by ticker...")
+    start_time = time.time()
+    shard_files, stats_files = run_sharded_filter(new_transcript_df, keyword_dict, shard_work_dir, n_shard_workers, MAX_SENT_LENGTH,
+                                     compact=use_compact_dtypes, normalized=use_normalized_matching)
+    keyword_count_columns = list(theme_hashes.keys())
+    if shard_files:
+        grouped = pd.concat([pd.read_parquet(path) for path in shard_files], ignore_index=True)
+        new_stats = pd.concat([pd.read_parquet(path) for path in stats_files], ignore_index=True)
+    else:
+        new_stats = new_transcript_df[GROUP_COLUMNS].iloc[:0]
+        grouped = build_excerpts(new_transcript_df.iloc[:0], keyword_count_columns, hits=combine_theme_hits([], keyword_dict, []),
+                                 extra_count_columns=section_count_columns(keyword_count_columns))
+    print(f"Steps 1-5 Complete: {len(grouped):,} excerpts from {len(shard_files):,} shard files "
+          f"in {time.time() - start_time:.2f} seconds.")
 
-print("Step 2 Complete: Keyword patterns precompiled.")
-
-# Function to count keywords using precompiled regex
-def count_keywords_optimized(s, compiled_patterns):
-    if isinstance(s, str):
-        return {name: len(pattern.findall(s)) for name, pattern in compiled_patterns.items()}
-    return {name: 0 for name in compiled_patterns.keys()}
-
-# Step 3: Apply keyword counting to the DataFrame
-print("Step 3: Counting keywords in sentences...")
-start_time = time.time()
-
-keyword_counts = transcript_df['Transcript'].progress_apply(
-    lambda x: count_keywords_optimized(x, compiled_keyword_dict)
-)
+#%% Split Transcripts By Sentence
 
-# Convert the resulting list of dictionaries into a DataFrame
-keyword_counts_df = pd.DataFrame(keyword_counts.tolist())
-keyword_counts_df.columns = [name.replace('_keywords', '_keyword_count') for name in compiled_keyword_dict.keys()]
+if not use_sharded_execution:
+    # Apply the optimized splitting function and explode the DataFrame
+    print("Step 1: Splitting transcripts into sentences...")
+
+    # Bring the transcript index up to date before splitting (only new or edited transcripts are tokenized)
+    if use_index_matching:
+        transcript_index = TranscriptIndex.load(index_file_path)
+        index_changes = transcript_index.update(transcript_df.drop(columns=['Text Hash', 'Cache Key']))
+        if any(index_changes[key] for key in ('added', 'replaced', 'removed')):
+            transcript_index.save(index_file_path)
+        print(f"Transcript index: {index_changes} | {transcript_index.summary()}")
+
+    # One row per sentence; 'Sentence' is the position of the sentence within its transcript.
+    # The boundaries of already split transcripts come from the cache, so a theme edit does not re-split them.
+    boundaries = None
+    if use_filter_cache:
+        boundaries = cached_sentence_boundaries(new_transcript_df['Transcript'], new_transcript_df['Text Hash'],
+                                                sentence_boundaries, filter_cache_dir,
+                                                keep_hashes=transcript_df['Text Hash'])
+    sentence_df = split_transcripts(new_transcript_df.drop(columns=['Cache Key']), compact=use_compact_dtypes,
+                                    boundaries=boundaries)
+    log_memory(memory_log, 'Sentences (exploded)', sentence_df)
+
+    print("Step 1 Complete: Transcripts split into sentences.")
 
-# Merge the keyword counts back to the original DataFrame
-transcript_df = pd.concat([transcript_df, keyword_counts_df], axis=1)
+#%% Keyword Counting
 
-print("Step 3 Complete: Keyword Counts Calculated.")
+if not use_sharded_execution:
+    # Precompile regex patterns for all keywords
+    print("Step 2: Precompiling keyword patterns...")
+    compiled_keyword_dict = compile_keyword_patterns(keyword_dict)
+
+    print("Step 2 Complete: Keyword patterns precompiled.")
+
+    # Step 3: Apply keyword counting to the DataFrame
+    print("Step 3: Counting keywords in sentences...")
+    start_time = time.time()
+
+    sentence_key = ['Ticker', 'Company Name', 'Event Type', 'Date', 'Sentence']
+    query_counts = {}
+
+    def count_theme(column, rows):
+        """
+        Counts one theme in a subset of sentence rows (used for whatever the cache does not cover).
+        Returns the counts and the keyword-level hits (None in index mode, which only yields counts).
+        """
+        if use_index_matching:
+            # Evaluate the theme query over the index postings and line the counts up with the sentence rows
+            if column not in query_counts:
+                query_counts[column] = count_theme_queries(
+                    transcript_index, {column: theme_query_dict[column.replace('_keyword_count', '_keywords')]}
+                )
+            return (rows[sentence_key]
+                    .merge(query_counts[column], on=sentence_key, how='left')[column]
+                    .fillna(0)
+                    .to_numpy(dtype=np.int64)), None
+
+        variable_name = column.replace('_keyword_count', '_keywords')
+        if use_normalized_matching:
+            return count_normalized_themes([column], rows)[column]
+
+        # One finditer pass per sentence yields both the count and the keyword/offset of every hit
+        return match_theme(rows['Transcript'].to_numpy(dtype=object), compiled_keyword_dict[variable_name],
+                           keyword_dict[variable_name], show_progress=True, description=column)
+
+    def count_normalized_themes(columns, rows):
+        """
+        Counts several themes in the same sentence rows with one NormalizedMatcher, so each sentence is tokenized
+        once for all of them. Returns {column: (counts, hits)}.
+        """
+        variable_names = [column.replace('_keyword_count', '_keywords') for column in columns]
+        counts, hits = NormalizedMatcher({name: keyword_dict[name] for name in variable_names}).match_texts(
+            rows['Transcript'].to_numpy(dtype=object), show_progress=True)
+        theme_ids = hits['Theme ID'].to_numpy()
+        return {column: (counts[:, theme_id], hits[theme_ids == theme_id].drop(columns=['Theme ID']))
+                for theme_id, column in enumerate(columns)}
+
+    if use_filter_cache:
+        keyword_counts_df, hit_parts, count_stats = cached_keyword_counts(
+            sentence_df, theme_hashes, count_theme, filter_cache_dir,
+            count_themes=count_normalized_themes if use_normalized_matching else None)
+        hits_df = combine_theme_hits(hit_parts, keyword_dict, sentence_df.index)
+        prune_theme_counts(filter_cache_dir, theme_hashes)
+        print(f"Filter cache: {count_stats['reused']:,} transcript/theme counts reused, {count_stats['matched']:,} matched.")
+    elif use_index_matching:
+        keyword_counts_df = pd.DataFrame({column: count_theme(column, sentence_df)[0] for column in theme_hashes},
+                                         index=sentence_df.index)
+        hits_df = combine_theme_hits([], keyword_dict, sentence_df.index)
+    else:
+        keyword_counts_df, hits_df = match_keywords(sentence_df, keyword_dict, normalized=use_normalized_matching)
+    log_memory(memory_log, 'Keyword hits', hits_df)
+
+    keyword_count_columns = list(theme_hashes.keys())
+
+    # Split every count into Management and Q&A mentions (each hit is placed by its offset; index mode has no
+    # hits and attributes whole sentences)
+    section_df = section_counts(sentence_df, keyword_counts_df, None if use_index_matching else hits_df)
+
+    # Store counts in the smallest unsigned int type that fits (uint8 for almost every theme)
+    log_memory(memory_log, 'Keyword counts (int64)', keyword_counts_df)
+    if use_compact_dtypes:
+        keyword_counts_df = compact_counts(keyword_counts_df)
+        section_df = compact_counts(section_df)
+        log_memory(memory_log, 'Keyword counts (compact)', keyword_counts_df)
+
+    # Words, sentences and theme counts of every transcript (overall and per section), from the same sentence rows
+    new_stats = transcript_stats(sentence_df, keyword_counts_df, section_df)
+
+    # Merge the keyword counts back to the original DataFrame
+    sentence_df = pd.concat([sentence_df, keyword_counts_df, section_df], axis=1)
+    log_memory(memory_log, 'Sentences + counts', sentence_df)
+
+    print("Step 3 Complete: Keyword Counts Calculated.")
 
 #%% Summing Keyword Counts
 
-print("Step 4: Calculating 'Thematic Term Count'...")
-transcript_df['Thematic Term Count'] = keyword_counts_df.sum(axis=1)
-print("Step 4 Complete: 'Thematic Term Count' Calculated.")
+if not use_sharded_execution:
+    print("Step 4: Calculating 'Thematic Term Count'...")
+    sentence_df['Thematic Term Count'] = keyword_counts_df.sum(axis=1)
+    print("Step 4 Complete: 'Thematic Term Count' Calculated.")
 
 #%% Final Output and Timing
 
-end_time = time.time()
-print(f"Processing completed in {end_time - start_time:.2f} seconds.")
-
-# Optional: Display a sample of the DataFrame to verify results
-print(transcript_df.head())
+if not use_sharded_execution:
+    end_time = time.time()
+    print(f"Processing completed in {end_time - start_time:.2f} seconds.")
 
+    # Optional: Display a sample of the DataFrame to verify results
+    print(sentence_df.head())
 
 #%% Filter DF for Keyword Hits
 
-# Identify rows where 'Thematic Term Count' > 0
-condition = transcript_df['Thematic Term Count'] > 0
+if not use_sharded_execution:
+    # Keep sentences with a hit plus their neighbours within the same transcript
+    transcripts_chunks = select_context_sentences(sentence_df, keyword_count_columns)
+    log_memory(memory_log, 'Context sentences', transcripts_chunks)
 
-# Create a boolean mask to include rows where the condition is True or adjacent rows
-mask = condition | condition.shift(1, fill_value=False) | condition.shift(-1, fill_value=False)
+    # Optional: Display the result for verification
+    print(transcripts_chunks.head())
 
-# Filter the DataFrame using the mask
-filtered_df = transcript_df[mask]
+#%% Combine Sentences
 
-# Assign the filtered DataFrame to a variable for further use or analysis
-transcripts_chunks = filtered_df
+if not use_sharded_execution:
+    # Apply grouping and aggregation
+    print("Step 5: Combining transcripts and summing keyword counts")
+    # Each excerpt also carries its keyword-level hits (keyword id, theme id, offsets into the excerpt text)
+    grouped = build_excerpts(transcripts_chunks, keyword_count_columns, GROUP_COLUMNS, MAX_SENT_LENGTH, hits=hits_df,
+                             extra_count_columns=section_df.columns.to_list())
 
-# Optional: Display the result for verification
-print(transcripts_chunks.head())
+    print("Processing complete. Final DataFrame created.")
 
-#%% Combine Sentences
+log_memory(memory_log, 'Excerpts', grouped)
 
-def simple_sent_tokenize(text):
-    # Define end-of-sentence markers
-    markers = ('.', '?', '!')
-    sentences = []
-    start = 0
-
-    # Iterate over each character in the text
-    for i, char in enumerate(text):
-        if char in markers:
-            # Add the sentence to the list if an end marker is found
-            sentences.append(text[start:i+1].strip())
-            start = i+1
-
-    # Check for any remaining text after the last marker
-    if start < len(text):
-        sentences.append(text[start:].strip())
-
-    return sentences
-
-
-# Define the columns to group by
-group_columns = ['Ticker', 'Company Name', 'Date', 'Event Type']
-keyword_count_columns = [variable_name.replace('_keywords', '_keyword_count') for variable_name in keyword_dict.keys()]
-
-# Define the maximum sentence length for combining transcripts
-max_sent_length = 10
-
-# Function to combine transcripts within the sentence limit
-def combine_transcripts(group):
-    combined = []
-    current_transcript = ""
-    current_sent_count = 0
-    batch_keyword_counts = {col: 0 for col in keyword_count_columns}
-
-    # Iterate through each row in the group
-    for _, row in group.iterrows():
-        transcript = row['Transcript']
-        sentences = simple_sent_tokenize(transcript)
-
-        # If adding this transcript exceeds the limit, finalize the current batch
-        if current_sent_count + len(sentences) > max_sent_length:
-            combined.append({
-                **{col: row[col] for col in group_columns},  # Include metadata
-                'Combined Transcript': current_transcript.strip(),
-                **batch_keyword_counts,  # Add keyword counts
-            })
-            # Reset for the next batch
-            current_transcript = ""
-            current_sent_count = 0
-            batch_keyword_counts = {col: 0 for col in keyword_count_columns}
-
-        # Add the current transcript and update keyword counts
-        current_transcript += " " + transcript
-        current_sent_count += len(sentences)
-
-        for col in keyword_count_columns:
-            batch_keyword_counts[col] += row[col]
-
-    # Add the last batch
-    if current_transcript:
-        combined.append({
-            **{col: row[col] for col in group_columns},  # Include metadata
-            'Combined Transcript': current_transcript.strip(),
-            **batch_keyword_counts,  # Add keyword counts
-        })
-
-    return pd.DataFrame(combined)
-
-# Apply grouping and aggregation
-print("Step 5: Combining transcripts and summing keyword counts")
-grouped = transcripts_chunks.groupby(group_columns).apply(combine_transcripts).reset_index(drop=True)
-
-# No need to explode here since the grouping logic already creates rows for each combined transcript
-print("Step 6: Finalizing DataFrame structure")
-grouped['Thematic Term Count'] = grouped[keyword_count_columns].sum(axis=1)
-
-print("Processing complete. Final DataFrame created.")
+# Memory footprint of each stage (compare runs with use_compact_dtypes True / False)
+print_memory_report(memory_log)
 
-# Assign the result to transcripts_chunks
-transcripts_chunks = grouped
+#%% Refresh Cached Excerpts
 
-#%% Export to CSV
+# Tag the new excerpts with their transcript's cache key, then merge them with the excerpts reused from cache
+print("Step 6: Finalizing DataFrame structure")
+if len(grouped):
+    new_excerpts = grouped.merge(new_transcript_df[GROUP_COLUMNS + ['Cache Key']], on=GROUP_COLUMNS, how='left')
+else:
+    new_excerpts = grouped.reindex(columns=grouped.columns.to_list() + ['Cache Key'])
+excerpt_parts = [df for df in (reused_excerpts, new_excerpts) if len(df)]
+all_excerpts = pd.concat(excerpt_parts, ignore_index=True) if excerpt_parts else new_excerpts
+
+# Same for the per-transcript statistics (every transcript has a row, with or without hits)
+new_stats = new_stats.merge(new_transcript_df[GROUP_COLUMNS + ['Cache Key']], on=GROUP_COLUMNS, how='left')
+stats_parts = [df for df in (reused_stats, new_stats) if len(df)]
+all_stats = pd.concat(stats_parts, ignore_index=True) if stats_parts else new_stats
+
+if use_filter_cache:
+    save_cached_excerpts(filter_cache_dir, excerpt_signature, all_excerpts, all_stats, transcript_df['Cache Key'])
+
+#%% Remove False Positives (optional)
+
+# Applied after the cache is saved: the cache keeps every raw hit, so a new sample or target precision never
+# requires re-matching the transcripts
+if use_false_positive_filter:
+    hits = hit_table(all_excerpts, keyword_table, keyword_count_columns)
+    if len(hits) == 0:
+        print("⚠️ No keyword-level hits to judge (index matching?); skipping the false-positive filter.")
+    else:
+        if fp_use_fake_llm:
+            fp_backend = FakeBackend(latency=0.05)
+        else:
+            fp_backend = OpenAIBackend(fp_api_key, model=fp_model, temperature=0.0)
+        fp_cache = ResponseCache(fp_label_cache_path, model=fp_backend.model, temperature=0.0,
+                                 prompt_version=RELEVANCE_PROMPT_VERSION)
+        fp_engine = AnnotationEngine(backend=fp_backend, cache=fp_cache,
+                                     governor=CostGovernor(fp_max_cost, fp_cost_input_per_1k, fp_cost_output_per_1k))
+
+        # The LLM judges a sample spread across the keywords; the local classifier learns from it and scores every hit
+        sample = sample_hits(hits, fp_sample_size)
+        relevant = llm_relevance_labels(fp_engine, sample, fp_cache)
+        print(f"🤖 LLM judgements: {fp_engine.summary()}")
+        classifier = FalsePositiveClassifier(target_precision=fp_target_precision).fit(sample, relevant)
+        print(f"🧮 False-positive classifier {classifier.describe_validation()}")
+
+        drop = classifier.predict_false_positives(hits)
+        all_excerpts, dropped_counts = drop_hits(all_excerpts, hits, drop, keyword_count_columns)
+        all_stats = subtract_counts(all_stats, dropped_counts)
+        print(f"🧹 Dropped {drop.sum():,} of {len(hits):,} keyword hits as false positives ({drop.mean():.1%})")
+        if drop.any():
+            print(hits[drop].groupby('Keyword').size().sort_values(ascending=False).head(10).to_string())
+
+# Theme intensity: mentions per 10k words of the whole transcript (and of each section), copied onto its excerpts
+all_stats = add_intensity(all_stats, keyword_count_columns)
+intensity_columns = [col for col in all_stats.columns if col in
+                     {intensity_column(count, section) for count in keyword_count_columns for section in (None, 'mgmt', 'qa')}]
+all_excerpts = all_excerpts.merge(all_stats[['Cache Key', 'Words'] + intensity_columns]
+                                  .rename(columns={'Words': 'Transcript Words'}), on='Cache Key', how='left')
+
+# Same order as a single groupby over the whole corpus
+transcripts_chunks = (all_excerpts.sort_values(GROUP_COLUMNS, kind='stable')
+                      .drop(columns=['Cache Key'])
+                      .reset_index(drop=True))
+transcript_stats_df = (all_stats.sort_values(GROUP_COLUMNS, kind='stable')
+                       .drop(columns=['Cache Key'])
+                       .reset_index(drop=True))
+
+#%% Export Mentions Dataset
 
 # Export All Hits
 transcripts_chunks = transcripts_chunks[transcripts_chunks['Thematic Term Count']>0]
 
-# Define the chunk size (Excel limit)
-chunk_size = 1048576
-num_chunks = len(transcripts_chunks) // chunk_size + 1
+# Partitioned by theme and quarter, so consumers only read the themes and quarters they need
+manifest = write_mentions_dataset(transcripts_chunks, export_mentions_dataset_dir, keyword_count_columns, keyword_table,
+                                  transcript_stats_df)
+print(f"Mentions dataset: {manifest['excerpts']:,} excerpts in {len(manifest['partitions']):,} partitions "
+      f"({len(manifest['themes'])} themes x {len(manifest['quarters'])} quarters).")
+
+#%% Export to Excel (optional)
+
+if export_excel_parts:
+    # Define the chunk size (Excel limit)
+    chunk_size = 1048576
+    num_chunks = len(transcripts_chunks) // chunk_size + 1
 
-for i in range(num_chunks):
-    start = i * chunk_size
-    end = (i + 1) * chunk_size
-    chunk = transcripts_chunks[start:end]
-    chunk.to_excel(f'{export_mentions_file_path}_part{i + 1}.xlsx', index=False)
+    for i in range(num_chunks):
+        start = i * chunk_size
+        end = (i + 1) * chunk_size
+        chunk = transcripts_chunks[start:end]
+        chunk.to_excel(f'{export_mentions_file_path}_part{i + 1}.xlsx', index=False)
 
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Builds or updates the transcript index and runs theme queries against it.
+"""
+
+# Background: Prototyping a new theme vocabulary used to mean rerunning 01_Keyword_Filter.py over every
+# yearly transcript workbook. This script keeps a persisted inverted index over the corpus instead, so a
+# keyword set can be counted and excerpted across every transcript in seconds.
+
+# How to Use:
+# - Run the "Build / Update Index" cells once; later runs only tokenize new or edited transcripts.
+# - Edit `prototype_keywords` (or pick a theme from Thematic Vocab.xlsx) and rerun the "Query" cell.
+# - Optionally export the matching sentences for review.
+# - The "Tune Vocabulary" cell drops zero-hit, stopword-like and unrelated keywords from the prototype list and
+#   suggests expansions mined from the corpus (see vocab_tuning.py).
+
+# Output: Transcript Index.pkl (the index) and, optionally, Index Query Results.xlsx
+# Input: Every yearly transcript file (RAW 20xx-Cal TRANSCRIPT.xlsx) and, optionally, Thematic Vocab.xlsx
+
+
+#Import Libraries
+import os
+import sys
+import time
+import pandas as pd
+
+# Make the helper modules in this folder importable when run from Spyder or another working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from transcript_index import TranscriptIndex
+from vocab_tuning import tune_vocabulary
+from transcript_loader import load_transcript_workbooks
+
+# Define file paths for various datasets involved in the analysis.
+transcript_folder = r'S:\Strategy Research\Transcripts\Data\Excel'
+transcript_sidecar_dir = r'S:\Strategy Research\Transcripts\Data\Parquet'
+keyword_file_path = r'S:\Strategy Research\Transcripts\Additional\Themes\Thematic Vocab.xlsx'
+
+index_file_path = r'S:\Strategy Research\Transcripts\Data\Index\Transcript Index.pkl'
+export_query_file_path = r'S:\Strategy Research\Transcripts\Data\Index\Index Query Results.xlsx'
+
+#%% Build / Update Index - Load Transcripts
+
+# Every 'RAW <year>-Cal TRANSCRIPT.xlsx' workbook, read from its Parquet sidecar when unchanged (see transcript_loader.py)
+transcript_df = load_transcript_workbooks(transcript_folder, transcript_sidecar_dir)
+
+# Merge the overflow columns and combine Management and Q&A, exactly as in 01_Keyword_Filter.py
+transcript_df['Transcript - Mgmt'] = transcript_df['Transcript - Mgmt'].fillna('') + transcript_df['Transcript - Mgmt p2'].fillna('')
+transcript_df['Transcript - QA'] = transcript_df['Transcript - QA'].fillna('') + transcript_df['Transcript - QA p2'].fillna('')
+transcript_df['Transcript'] = transcript_df['Transcript - Mgmt'] + "\n" + transcript_df['Transcript - QA']
+transcript_df = transcript_df[['Ticker', 'Company Name', 'Event Type', 'Date', 'Transcript']]
+
+#%% Build / Update Index - Tokenize New Transcripts and Save
+
+start_time = time.time()
+index = TranscriptIndex.load(index_file_path)
+changes = index.update(transcript_df)
+print(f"Index update: {changes} in {time.time() - start_time:.2f} seconds.")
+print(index.summary())
+
+if any(changes[key] for key in ('added', 'replaced', 'removed')):
+    os.makedirs(os.path.dirname(index_file_path), exist_ok=True)
+    index.save(index_file_path)
+    print(f"Index saved to {index_file_path}")
+
+#%% Query - Count and Excerpt Every Sentence Matching a Keyword Set
+
+# Prototype a vocabulary here, or start from an existing theme column in Thematic Vocab.xlsx
+prototype_theme = None  # e.g. 'AI'
+prototype_keywords = ['machine learning', 'generative AI', 'large language model']
+
+if prototype_theme is not None:
+    thematic_vocab_df = pd.read_excel(keyword_file_path)
+    prototype_keywords = [prototype_theme] + [
+        ele for ele in thematic_vocab_df[prototype_theme].dropna() if isinstance(ele, str)
+    ]
+
+start_time = time.time()
+query_hits = index.search(prototype_keywords, context=1)
+print(f"Query answered in {time.time() - start_time:.2f} seconds.")
+
+print(f"{query_hits['keyword_count'].sum():,} mentions in {len(query_hits):,} sentences "
+      f"across {query_hits['Ticker'].nunique():,} companies.")
+
+# Mentions per quarter, to sanity-check the vocabulary before committing it to Thematic Vocab.xlsx
+query_hits['Quarter'] = pd.to_datetime(query_hits['Date'], errors='coerce').dt.to_period('Q').astype(str)
+print(query_hits.groupby('Quarter')['keyword_count'].sum())
+
+# Sample excerpts to review false positives
+print(query_hits.sample(min(10, len(query_hits)), random_state=0)[['Ticker', 'Date', 'Excerpt']].to_string())
+
+#%% Tune Vocabulary - Prune Keywords and Suggest Expansions
+
+# Seed terms define the theme (the theme name or a few core keywords); every other keyword is scored by how
+# often it occurs, in how many calls, and how strongly it co-occurs with the seeds (PMI)
+seed_keywords = [prototype_theme] if prototype_theme is not None else prototype_keywords[:1]
+
+lean_keywords, keyword_scores, keyword_expansions = tune_vocabulary(index, prototype_keywords, seed_keywords)
+print(f"Kept {len(lean_keywords)} of {len(keyword_scores)} keywords:")
+print(keyword_scores.sort_values('Hits', ascending=False).to_string(index=False))
+print("Suggested expansions:")
+print(keyword_expansions.to_string(index=False))
+
+#%% Optional - Export Query Results
+
+export_query_results = False
+
+if export_query_results:
+    query_hits.to_excel(export_query_file_path, index=False)
+    print(f"Query results saved to {export_query_file_path}")
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark and equivalence check of the keyword filter on synthetic corpora.
+"""
+
+# Background: Every speed-up of 01_Keyword_Filter.py so far was checked on the real transcript files, which are
+# slow to load and only come in one size. This script generates a synthetic corpus (synthetic_corpus.py) at
+# 10x, 100x and 1000x a base size and times the four filter stages on it - sentence splitting, keyword counting,
+# context windowing and excerpt building - reporting throughput and peak memory per stage. It also rebuilds the
+# excerpts with a plain row-by-row reference implementation (one regex findall per sentence and theme, a Python
+# loop over each transcript's sentences) that splits sentences like the original filter did,
+# re.split(r'(?<=[.!?]) +', text). The current splitter differs on purpose (abbreviations, initials, line breaks,
+# leading whitespace); these changes are applied to the original splits one by one and reported as expected deltas,
+# and any other difference counts as unexpected. With the expected deltas applied, the optimized stages must give
+# the same counts and excerpts as the reference, and every recorded hit offset must point at one of its theme's
+# keywords. The counts of the transcript index mode (keyword lists run as OR queries) are checked against the regex
+# counts too; the sample vocabulary nests keywords ("AI" in "generative AI", "Inflation" in "wage inflation"), which
+# must count once per hit. Known text rule cases are checked first: the stem cases and a Q&A-only call that must not
+# credit Management, from text_rule_checks.py (also runnable on their own).
+
+# How to Use:
+# - Adjust the Benchmark Settings below and run the script (or its cells) from this folder.
+# - Scale n generates n x base_companies companies, each with base_quarters transcripts of words_per_transcript words.
+# - The reference implementation is slow; it only runs up to reference_max_scale.
+# - Peak memory is measured in a second, separate run of each stage under tracemalloc (which slows code down), so
+#   the timings are not distorted; set measure_memory = False to skip it. tracemalloc sees Python and NumPy
+#   allocations but not the Arrow buffers of compact string columns, so compact runs under-report a little.
+
+# Output: a table of seconds, throughput (transcripts/s, words/s, MB/s) and peak memory per scale and stage,
+#         plus the equivalence check results; optionally exported to benchmark_results_file_path (.csv)
+
+
+#Import Libraries
+import os
+import sys
+import re
+import gc
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Make the helper modules in this folder importable when run from Spyder or another working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_corpus import SAMPLE_KEYWORD_DICT, TRICKY_WORDS, generate_corpus, combine_sections
+from transcript_text import sentence_offsets, normalized_tokens
+from text_rule_checks import check_text_rules
+from mention_filter import (GROUP_COLUMNS, MAX_SENT_LENGTH, split_transcripts, compile_keyword_patterns,
+                            count_keywords, match_keywords, build_keyword_table, section_counts,
+                            select_context_sentences, build_excerpts, frame_memory_mb)
+from transcript_index import TranscriptIndex, METADATA_COLUMNS
+from theme_query import keywords_to_query, count_theme_queries
+
+# Benchmark Settings
+# - scales: corpus sizes as multiples of the base corpus
+# - keyword_density: share of word slots holding a keyword (0.002 = about one hit every 500 words)
+# - compact: run the stages with compact dtypes, as 01_Keyword_Filter.py does
+# - normalized: benchmark normalized-token matching instead of the regex mode (skips the count equivalence check)
+scales = [10, 100, 1000]
+base_companies = 1
+base_quarters = 4
+words_per_transcript = 3000
+keyword_density = 0.002
+keyword_dict = SAMPLE_KEYWORD_DICT
+compact = True
+normalized = False
+seed = 0
+
+reference_max_scale = 100
+measure_memory = True
+
+benchmark_results_file_path = None  # e.g. r'S:\Strategy Research\Transcripts\Data\Benchmarks\Filter Benchmark.csv'
+
+
+#%% Reference Implementation
+
+# The original filter's sentence splitter: a break at every run of spaces after '.', '!' or '?'
+BASELINE_BREAK_PATTERN = re.compile(r'(?<=[.!?]) +')
+
+# Intended changes of the current splitter: no break after the synthetic corpus's abbreviations ("Inc.", "Dr.") or
+# after initials and dotted acronyms ("U.S.", "e.g.", "a."), none before a lowercase word, and breaks at any
+# whitespace after the punctuation (the newline between the Management and Q&A sections)
+EXPECTED_ABBREVIATIONS = frozenset(word[:-1].lower() for phrase in TRICKY_WORDS for word in phrase.split()
+                                   if word.endswith('.') and '.' not in word[:-1])
+EXPECTED_INITIALS_PATTERN = re.compile(r'(?:[A-Za-z]\.)+')
+EXPECTED_BREAK_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+# Texts the synthetic corpus does not produce: a call with an empty Management section (the combined text starts
+# with the section newline) and one ending in whitespace
+SPLIT_EDGE_CASES = ["\nOur AI roadmap is on track. Tariffs remain a risk? We think so.", "Demand held up in the U.S. Costs did not. "]
+
+
+def baseline_sentence_offsets(text):
+    """[start, end) offsets of the sentences of the original filter, re.split(r'(?<=[.!?]) +', text)."""
+    if not isinstance(text, str) or len(text) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    breaks = list(BASELINE_BREAK_PATTERN.finditer(text))
+    starts = [0] + [match.end() for match in breaks]
+    ends = [match.start() for match in breaks] + [len(text)]
+    return np.column_stack([starts, ends]).astype(np.int64)
+
+
+def expected_sentence_offsets(text, deltas=None):
+    """
+    The original sentence splits with the intended changes applied, one rule at a time. Each changed boundary is
+    counted in deltas (a dict of delta name -> count):
+        'Line Breaks'             a break at whitespace other than spaces ("U.S. growth.\nNext")
+        'Abbreviations'           no break after EXPECTED_ABBREVIATIONS ("Acme Inc. reported")
+        'Initials'                no break after initials and dotted acronyms ("the U.S. market", "e.g. the")
+        'Lowercase Continuation'  no break before a lowercase word
+        'Leading Whitespace'      leading whitespace belongs to no sentence
+        'Trailing Whitespace'     no empty sentence after a final break
+    """
+    deltas = {} if deltas is None else deltas
+
+    def count(delta):
+        deltas[delta] = deltas.get(delta, 0) + 1
+
+    if not isinstance(text, str) or len(text) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    baseline_breaks = {match.start() for match in BASELINE_BREAK_PATTERN.finditer(text)}
+    starts, ends = [0], []
+    for match in EXPECTED_BREAK_PATTERN.finditer(text):
+        # The whitespace-delimited word in front of the break
+        word = text[max(text.rfind(' ', 0, match.start()), text.rfind('\n', 0, match.start())) + 1:match.start()]
+        if word[:-1].lower() in EXPECTED_ABBREVIATIONS:
+            delta = 'Abbreviations'
+        elif EXPECTED_INITIALS_PATTERN.fullmatch(word):
+            delta = 'Initials'
+        elif match.end() < len(text) and text[match.end()].islower():
+            delta = 'Lowercase Continuation'
+        else:
+            ends.append(match.start())
+            starts.append(match.end())
+            if match.start() not in baseline_breaks:
+                count('Line Breaks')
+            continue
+        # Only original breaks that are dropped differ from the original splitter
+        if match.start() in baseline_breaks:
+            count(delta)
+    ends.append(len(text))
+
+    if starts[0] < len(text) and text[0].isspace():
+        count('Leading Whitespace')
+        starts[0] = len(text) - len(text.lstrip())
+    if starts[-1] == ends[-1] and len(starts) > 1:
+        count('Trailing Whitespace')
+        starts.pop()
+        ends.pop()
+    return np.column_stack([starts, ends]).astype(np.int64)
+
+
+def split_deltas(texts):
+    """
+    Compares the current splitter (transcript_text.sentence_offsets) with the original one plus the expected deltas.
+
+    Returns:
+        (expected deltas: dict of delta name -> changed boundaries, number of texts split differently anyway)
+    """
+    deltas = {}
+    unexpected = 0
+    for text in texts:
+        expected = expected_sentence_offsets(text, deltas)
+        current = sentence_offsets(text)
+        unexpected += expected.shape != current.shape or not (expected == current).all()
+    return {delta: value for delta, value in deltas.items() if value}, int(unexpected)
+
+
+def reference_excerpts(transcript_df, keyword_dict, max_sent_length=MAX_SENT_LENGTH, split=baseline_sentence_offsets):
+    """
+    Builds the excerpts one transcript at a time with plain Python loops: split (by default with the original
+    filter's splitter), count every theme with findall, keep hit sentences and their neighbours, and join them in
+    groups of max_sent_length.
+    """
+    compiled_patterns = compile_keyword_patterns(keyword_dict)
+    columns = [name.replace('_keywords', '_keyword_count') for name in keyword_dict]
+
+    rows = []
+    for _, transcript in transcript_df.iterrows():
+        text = transcript['Transcript']
+        sentences = [text[start:end] for start, end in split(text)]
+        counts = [[len(pattern.findall(sentence)) for pattern in compiled_patterns.values()] for sentence in sentences]
+        has_hit = [sum(sentence_counts) > 0 for sentence_counts in counts]
+        selected = [i for i in range(len(sentences))
+                    if has_hit[i] or (i > 0 and has_hit[i - 1]) or (i + 1 < len(sentences) and has_hit[i + 1])]
+
+        for first in range(0, len(selected), max_sent_length):
+            chunk = selected[first:first + max_sent_length]
+            row = {col: transcript[col] for col in GROUP_COLUMNS}
+            row['Combined Transcript'] = ' '.join(sentences[i] for i in chunk).strip()
+            for theme, col in enumerate(columns):
+                row[col] = sum(counts[i][theme] for i in chunk)
+            rows.append(row)
+
+    excerpts = pd.DataFrame(rows, columns=GROUP_COLUMNS + ['Combined Transcript'] + columns)
+    excerpts['Thematic Term Count'] = excerpts[columns].sum(axis=1)
+    return excerpts
+
+
+#%% Benchmark Functions
+
+def run_stage(function, *args, measure_memory=False, **kwargs):
+    """
+    Runs one stage and times it; with measure_memory, runs it again under tracemalloc for the peak.
+
+    Returns:
+        (result, seconds, peak MB or NaN)
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    peak_mb = np.nan
+    if measure_memory:
+        gc.collect()
+        tracemalloc.start()
+        function(*args, **kwargs)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+
+def run_pipeline(transcript_df, keyword_dict, compact=True, normalized=False, measure_memory=False):
+    """
+    Runs the four optimized filter stages as 01_Keyword_Filter.py does.
+
+    Returns:
+        sentence_df, keyword_counts_df, hits_df, excerpts, and a list of {'Stage', 'Seconds', 'Peak Memory (MB)',
+        'Output Rows', 'Output (MB)'} records.
+    """
+    keyword_count_columns = [name.replace('_keywords', '_keyword_count') for name in keyword_dict]
+    timings = []
+
+    def record(stage, output, seconds, peak_mb):
+        timings.append({'Stage': stage, 'Seconds': seconds, 'Peak Memory (MB)': peak_mb,
+                        'Output Rows': len(output), 'Output (MB)': frame_memory_mb(output)})
+
+    sentence_df, seconds, peak_mb = run_stage(split_transcripts, transcript_df, compact=compact,
+                                              measure_memory=measure_memory)
+    record('Sentence Splitting', sentence_df, seconds, peak_mb)
+
+    (keyword_counts_df, hits_df), seconds, peak_mb = run_stage(match_keywords, sentence_df, keyword_dict,
+                                                               show_progress=False, normalized=normalized,
+                                                               measure_memory=measure_memory)
+    record('Keyword Counting', keyword_counts_df, seconds, peak_mb)
+
+    section_df = section_counts(sentence_df, keyword_counts_df, hits_df)
+    sentence_df = pd.concat([sentence_df, keyword_counts_df, section_df], axis=1)
+    transcripts_chunks, seconds, peak_mb = run_stage(select_context_sentences, sentence_df, keyword_count_columns,
+                                                     measure_memory=measure_memory)
+    record('Context Windowing', transcripts_chunks, seconds, peak_mb)
+
+    excerpts, seconds, peak_mb = run_stage(build_excerpts, transcripts_chunks, keyword_count_columns,
+                                           hits=hits_df, extra_count_columns=section_df.columns,
+                                           measure_memory=measure_memory)
+    record('Excerpt Building', excerpts, seconds, peak_mb)
+
+    return sentence_df, keyword_counts_df, hits_df, excerpts, timings
+
+
+def check_hit_offsets(excerpts, keyword_table, normalized=False):
+    """
+    Number of hits whose [start, end) slice of 'Combined Transcript' is not the recorded keyword (case-insensitive,
+    or with the same normalized tokens in normalized mode).
+    """
+    keywords = keyword_table['Keyword'].to_numpy()
+    if normalized:
+        keyword_tokens = [normalized_tokens(keyword)[0] for keyword in keywords]
+    bad = 0
+    for text, keyword_ids, starts, ends in excerpts[['Combined Transcript', 'Hit Keyword IDs', 'Hit Starts', 'Hit Ends']].itertuples(index=False):
+        for keyword_id, start, end in zip(keyword_ids, starts, ends):
+            if normalized:
+                bad += normalized_tokens(text[start:end])[0] != keyword_tokens[keyword_id]
+            elif not re.fullmatch(re.escape(keywords[keyword_id]), text[start:end], flags=re.IGNORECASE):
+                bad += 1
+    return int(bad)
+
+
+def index_counts(transcript_df, sentence_df, keyword_dict):
+    """
+    Per-sentence counts of the transcript index mode (01_Keyword_Filter.py with use_index_matching), in the row
+    order of sentence_df.
+    """
+    index = TranscriptIndex()
+    index.update(transcript_df)
+    theme_queries = {name.replace('_keywords', '_keyword_count'): keywords_to_query(keywords)
+                     for name, keywords in keyword_dict.items()}
+    counts = count_theme_queries(index, theme_queries).set_index(METADATA_COLUMNS + ['Sentence'])
+    sentence_keys = pd.MultiIndex.from_frame(
+        sentence_df[METADATA_COLUMNS + ['Sentence']].astype({col: object for col in METADATA_COLUMNS + ['Sentence']}))
+    return counts.reindex(sentence_keys, columns=list(theme_queries)).fillna(0).astype(np.int64)
+
+
+def check_equivalence(transcript_df, sentence_df, keyword_counts_df, excerpts, keyword_dict, normalized=False):
+    """
+    Compares the optimized outputs with the reference implementation.
+
+    Returns:
+        checks: dict of check name -> result (True / False, or the number of mismatches).
+        deltas: dict of expected delta name -> number of sentence boundaries it changes (see expected_sentence_offsets).
+    """
+    keyword_count_columns = list(keyword_counts_df.columns)
+    checks = {}
+    deltas, checks['Unexpected Split Deltas'] = split_deltas(list(transcript_df['Transcript']) + SPLIT_EDGE_CASES)
+
+    if not normalized:
+        reference_counts = count_keywords(sentence_df, compile_keyword_patterns(keyword_dict), show_progress=False)
+        checks['Counts Match'] = bool((reference_counts.to_numpy(dtype=np.int64)
+                                       == keyword_counts_df.to_numpy(dtype=np.int64)).all())
+
+        count_columns = keyword_count_columns + ['Thematic Term Count']
+        optimized = excerpts[GROUP_COLUMNS + ['Combined Transcript'] + count_columns].astype({col: np.int64 for col in count_columns})
+        optimized = optimized.reset_index(drop=True)
+
+        def reference(split):
+            # build_excerpts orders the transcripts by their group columns; excerpts within a transcript keep their order
+            reference = reference_excerpts(transcript_df, keyword_dict, split=split)[optimized.columns]
+            reference = reference.astype({col: np.int64 for col in count_columns})
+            return reference.sort_values(GROUP_COLUMNS, kind='stable').reset_index(drop=True)
+
+        # The original splitting moves sentences between excerpts but finds the same hits in each transcript
+        baseline = reference(baseline_sentence_offsets)
+        checks['Baseline Counts Match'] = (baseline.groupby(GROUP_COLUMNS)[count_columns].sum()
+                                           .equals(optimized.groupby(GROUP_COLUMNS)[count_columns].sum()))
+        checks['Excerpts Match'] = optimized.equals(reference(expected_sentence_offsets))
+        checks['Index Counts Match'] = bool((index_counts(transcript_df, sentence_df, keyword_dict).to_numpy()
+                                             == keyword_counts_df.to_numpy(dtype=np.int64)).all())
+
+    checks['Hit Count Matches Counts'] = bool(
+        (excerpts['Hit Keyword IDs'].str.len().to_numpy() == excerpts['Thematic Term Count'].to_numpy()).all())
+    checks['Bad Hit Offsets'] = check_hit_offsets(excerpts, build_keyword_table(keyword_dict), normalized)
+    return checks, deltas
+
+
+#%% Text Rule Checks
+
+text_rule_failures = check_text_rules(keyword_dict)
+print(f"{'❌' if text_rule_failures else '✅'} Text rules: {text_rule_failures or 'all cases pass'}")
+
+#%% Run Benchmark
+
+results = []
+keyword_count_columns = [name.replace('_keywords', '_keyword_count') for name in keyword_dict]
+print(f"Benchmarking the keyword filter on synthetic corpora at scales {scales} "
+      f"(base: {base_companies} companies x {base_quarters} quarters x {words_per_transcript:,} words)")
+
+for scale in scales:
+    transcript_df = combine_sections(generate_corpus(n_companies=base_companies * scale, n_quarters=base_quarters,
+                                                     words_per_transcript=words_per_transcript,
+                                                     keyword_density=keyword_density, keyword_dict=keyword_dict,
+                                                     seed=seed))
+    n_transcripts = len(transcript_df)
+    n_words = n_transcripts * words_per_transcript
+    text_mb = transcript_df['Transcript'].str.len().sum() / 1024 ** 2
+    print(f"\n⏱️ Scale {scale}x: {n_transcripts:,} transcripts, {n_words:,} words, {text_mb:,.1f} MB of text")
+
+    sentence_df, keyword_counts_df, hits_df, excerpts, timings = run_pipeline(
+        transcript_df, keyword_dict, compact=compact, normalized=normalized, measure_memory=measure_memory)
+
+    checks, deltas = {}, {}
+    if scale <= reference_max_scale:
+        checks, deltas = check_equivalence(transcript_df, sentence_df, keyword_counts_df, excerpts, keyword_dict,
+                                           normalized)
+        passed = all(value is True or (value is not False and value == 0) for value in checks.values())
+        print(f"{'✅' if passed else '❌'} Equivalence: {checks}")
+        print(f"   Expected deltas from the original sentence splitting (boundaries changed): {deltas}")
+
+    for timing in timings + [{'Stage': 'Total', 'Seconds': sum(t['Seconds'] for t in timings),
+                              'Peak Memory (MB)': pd.Series([t['Peak Memory (MB)'] for t in timings]).max(),
+                              'Output Rows': len(excerpts), 'Output (MB)': frame_memory_mb(excerpts)}]:
+        results.append({
+            'Scale': scale, 'Transcripts': n_transcripts, 'Words': n_words, **timing,
+            'Transcripts / s': n_transcripts / timing['Seconds'],
+            'Words / s': n_words / timing['Seconds'],
+            'MB / s': text_mb / timing['Seconds'],
+            **checks,
+            **{f'Expected Delta: {delta}': value for delta, value in deltas.items()},
+        })
+
+    del transcript_df, sentence_df, keyword_counts_df, hits_df, excerpts
+
+#%% Report
+
+results_df = pd.DataFrame(results)
+report_columns = ['Scale', 'Stage', 'Seconds', 'Transcripts / s', 'Words / s', 'MB / s', 'Peak Memory (MB)',
+                  'Output Rows', 'Output (MB)']
+print('\n' + results_df[report_columns].round(2).to_string(index=False))
+
+if benchmark_results_file_path:
+    results_df.to_csv(benchmark_results_file_path, index=False)
+    print(f"Results exported to {benchmark_results_file_path}")
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Learned filter for false-positive keyword hits (unrelated uses, boilerplate).
+"""
+
+# Background: A keyword hit is not always a mention of its theme: "AI" can be a name or an unrelated abbreviation,
+# and a theme word inside the legal disclaimer or forward-looking-statements boilerplate says nothing about the
+# company. Asking an LLM about every hit would cost too much, so this module learns from a small sample instead:
+#   - hit_table: one row per keyword hit of the excerpts, with the keyword, theme, section (Management / Q&A)
+#     and a window of text around the hit (the hit marked [[like this]])
+#   - sample_hits + llm_relevance_labels: the LLM judges a sample of hits, spread evenly across the keywords
+#     (answers are cached, so reruns only pay for new samples)
+#   - FalsePositiveClassifier: a logistic regression over words and bigrams of the window, the keyword, the
+#     exact matched text, the theme and the section, trained on those judgements. It scores every hit in bulk;
+#     part of the labels is held out to find the score above which the dropped hits are false positives at least
+#     target_precision of the time
+#   - drop_hits: removes the dropped hits from the excerpts' hit arrays and counts (theme, section and total), and
+#     returns the counts removed per transcript so the transcript statistics can be corrected too
+# Only excerpts with keyword-level hits can be filtered (regex and normalized matching, not index matching).
+
+# How to Use:
+# - hits = hit_table(excerpts, keyword_table, keyword_count_columns)
+# - sample = sample_hits(hits, 1000); relevant = llm_relevance_labels(engine, sample, cache)
+# - classifier = FalsePositiveClassifier(target_precision=0.9).fit(sample, relevant)
+# - drop = classifier.predict_false_positives(hits)
+# - excerpts, dropped_counts = drop_hits(excerpts, hits, drop, keyword_count_columns)
+# - stats = subtract_counts(stats, dropped_counts)   (dropped_counts is indexed by key_column, e.g. 'Cache Key')
+
+
+#Import Libraries
+import re
+import json
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+
+from mention_filter import HIT_COLUMNS, SECTIONS, section_count_column, section_count_columns
+
+# Characters of text kept on each side of a hit
+CONTEXT_CHARS = 200
+
+# Bump when build_relevance_prompt changes (part of the response cache key)
+RELEVANCE_PROMPT_VERSION = 1
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+(?:['-][A-Za-z0-9]+)*")
+
+
+def _hit_context(text, start, end, context_chars=CONTEXT_CHARS):
+    """Text around a hit, cut at word boundaries, with the hit marked [[ ]]."""
+    left = text[max(0, start - context_chars):start]
+    right = text[end:end + context_chars]
+    if start > context_chars and ' ' in left:
+        left = '... ' + left[left.index(' ') + 1:]
+    if end + context_chars < len(text) and ' ' in right:
+        right = right[:right.rindex(' ')] + ' ...'
+    return f"{left}[[{text[start:end]}]]{right}"
+
+
+def hit_table(excerpts, keyword_table, keyword_count_columns, context_chars=CONTEXT_CHARS):
+    """
+    Lists every keyword hit of the excerpts.
+
+    The hits of an excerpt are ordered by offset and Management comes before Q&A, so the first (sum of the
+    excerpt's Management counts) hits are Management hits and the rest Q&A hits.
+
+    Parameters:
+        excerpts (pd.DataFrame): build_excerpts output with the HIT_COLUMNS and the section count columns.
+        keyword_table (pd.DataFrame): build_keyword_table output.
+        keyword_count_columns (list): The theme count columns, in theme id order.
+
+    Returns:
+        pd.DataFrame with one row per hit: 'Excerpt' (row position in excerpts), 'Hit' (position in the excerpt's
+        hit arrays), 'Keyword ID', 'Theme ID', 'Keyword', 'Theme', 'Matched' (the text), 'Section' and 'Context'.
+    """
+    hits_per_excerpt = excerpts['Hit Keyword IDs'].map(len).to_numpy()
+    excerpt = np.repeat(np.arange(len(excerpts)), hits_per_excerpt)
+    hit = np.arange(len(excerpt)) - np.repeat(np.cumsum(hits_per_excerpt) - hits_per_excerpt, hits_per_excerpt)
+    flat = {col: np.concatenate([np.asarray(values, dtype=np.int64) for values in excerpts[col]] or [np.array([], np.int64)])
+            for col in HIT_COLUMNS}
+
+    # Management hits come first within each excerpt
+    mgmt_columns = [section_count_column(column, 'mgmt') for column in keyword_count_columns]
+    mgmt_hits = excerpts[mgmt_columns].to_numpy(dtype=np.int64).sum(axis=1)
+    section = np.where(hit < mgmt_hits[excerpt], 'mgmt', 'qa')
+
+    # Theme names as in Thematic Vocab.xlsx (each theme's first keyword is its column name)
+    keywords = keyword_table.set_index('Keyword ID')['Keyword']
+    theme_names = keyword_table[keyword_table['Local ID'] == 0].set_index('Theme ID')['Keyword']
+
+    texts = excerpts['Combined Transcript'].to_numpy(dtype=object)
+    starts, ends = flat['Hit Starts'], flat['Hit Ends']
+    return pd.DataFrame({
+        'Excerpt': excerpt,
+        'Hit': hit,
+        'Keyword ID': flat['Hit Keyword IDs'],
+        'Theme ID': flat['Hit Theme IDs'],
+        'Keyword': keywords.reindex(flat['Hit Keyword IDs']).to_numpy(),
+        'Theme': theme_names.reindex(flat['Hit Theme IDs']).to_numpy(),
+        'Matched': [texts[e][s:t] for e, s, t in zip(excerpt, starts, ends)],
+        'Section': section,
+        'Context': [_hit_context(texts[e], s, t, context_chars) for e, s, t in zip(excerpt, starts, ends)],
+    })
+
+
+def sample_hits(hits, n, seed=0):
+    """
+    Picks n hits for the LLM to judge, spread evenly across the keywords (round-robin over a random order), so
+    rare keywords are represented next to the frequent ones.
+    """
+    shuffled = hits.sample(frac=1.0, random_state=seed)
+    turn = shuffled.groupby('Keyword ID', sort=False).cumcount()
+    return shuffled.assign(_turn=turn.to_numpy()).sort_values('_turn', kind='stable').head(n).drop(columns='_turn')
+
+
+# -------------------------------
+# LLM judgements
+# -------------------------------
+
+def build_relevance_prompt(hit):
+    """Prompt asking whether one hit (a hit_table row) refers to its theme."""
+    return f"""
+You are reviewing keyword hits found in earnings call transcripts for thematic equity research.
+
+Theme: {hit['Theme']}
+Keyword: "{hit['Matched']}" (vocabulary entry: "{hit['Keyword']}")
+
+In the passage below, does the keyword marked [[ ]] refer to the theme? Answer false if the word is used in an
+unrelated sense (e.g. "AI" as a name or as the abbreviation of something else), if it sits in boilerplate such as a
+legal disclaimer or the forward-looking statements, or if it is only operator or housekeeping language.
+
+Passage:
+\"\"\"{hit['Context']}\"\"\"
+
+Respond only with a valid JSON object: {{"relevant": true or false, "reasoning": "one sentence"}}
+"""
+
+
+def parse_relevance(content):
+    """The "relevant" answer of a relevance response as a bool; raises ValueError without one."""
+    json_start, json_end = content.find("{"), content.rfind("}")
+    if json_start < 0 or json_end < json_start:
+        raise ValueError(f"No JSON object in response: {content[:100]!r}")
+    relevant = json.loads(content[json_start:json_end + 1]).get("relevant")
+    if isinstance(relevant, str) and relevant.lower() in ("true", "false"):
+        relevant = relevant.lower() == "true"
+    if not isinstance(relevant, bool):
+        raise ValueError(f"No true/false 'relevant' in response: {content[:100]!r}")
+    return relevant
+
+
+def is_valid_relevance(content):
+    """True if a response holds a true/false judgement (only these are cached)."""
+    try:
+        parse_relevance(content)
+        return True
+    except ValueError:
+        return False
+
+
+def llm_relevance_labels(engine, sample, cache=None, show_progress=True):
+    """
+    Asks the LLM whether each sampled hit refers to its theme.
+
+    Parameters:
+        engine (AnnotationEngine): The LLM client (Thematic Analysis/llm_annotation.py).
+        sample (pd.DataFrame): hit_table rows, e.g. from sample_hits.
+        cache (ResponseCache or None): The engine's response cache; cached judgements are not paid for again.
+
+    Returns:
+        float array aligned with sample: 1.0 = relevant, 0.0 = false positive, NaN = no answer (error or budget).
+    """
+    prompts = [build_relevance_prompt(hit) for hit in sample.to_dict('records')]
+    keys = None
+    if cache is not None:
+        keys = [cache.key(context, f"relevance: {keyword} | {theme}")
+                for context, keyword, theme in zip(sample['Context'], sample['Keyword'], sample['Theme'])]
+    results = engine.annotate(prompts, keys, show_progress=show_progress, description='LLM hit judgements',
+                              validate=is_valid_relevance)
+    labels = np.full(len(results), np.nan)
+    for i, result in enumerate(results):
+        if result['error'] is None and result['content'] and is_valid_relevance(result['content']):
+            labels[i] = float(parse_relevance(result['content']))
+    return labels
+
+
+# -------------------------------
+# Local classifier
+# -------------------------------
+
+def _identity_tokens(hit):
+    """Categorical features of a hit: keyword, exact matched text, theme, section and their combinations."""
+    keyword = str(hit['Keyword']).lower()
+    return [f"keyword={keyword}", f"matched={hit['Matched']}", f"theme={hit['Theme']}", f"section={hit['Section']}",
+            f"keyword={keyword}|section={hit['Section']}", f"matched_case={'upper' if str(hit['Matched']).isupper() else 'other'}"]
+
+
+def _near_tokens(hit, n_words=4):
+    """The words right before and after a hit, tagged with their side."""
+    left, _, rest = str(hit['Context']).partition('[[')
+    _, _, right = rest.partition(']]')
+    return ([f"before={word.lower()}" for word in WORD_PATTERN.findall(left)[-n_words:]]
+            + [f"after={word.lower()}" for word in WORD_PATTERN.findall(right)[:n_words]])
+
+
+def _token_list(tokens):
+    """Analyzer of the identity features (already tokenized)."""
+    return tokens
+
+
+def threshold_for_precision(is_false_positive, probability, target_precision, min_dropped=10):
+    """
+    Lowest false-positive probability at which the hits at or above it are false positives at least
+    target_precision of the time (inf if none reaches it with at least min_dropped hits).
+    """
+    order = np.argsort(-probability, kind='stable')
+    running_precision = np.cumsum(is_false_positive[order]) / np.arange(1, len(order) + 1)
+    reached = np.flatnonzero(running_precision >= target_precision)
+    reached = reached[reached >= min_dropped - 1]
+    if len(reached) == 0:
+        return np.inf
+    return float(probability[order][reached.max()])
+
+
+class FalsePositiveClassifier:
+    """
+    Local false-positive classifier for keyword hits, trained on LLM judgements.
+
+    Parameters:
+        target_precision (float): Share of the dropped hits that must be real false positives (estimated on
+            held-out judgements); sets the drop threshold.
+        min_training_examples (int): Judgements needed to train; with fewer, no hit is dropped.
+        validation_share (float): Share of the judgements held out to set the threshold.
+        n_features (int): Size of each hashed feature space.
+        seed (int): Seed of the held-out split.
+    """
+
+    def __init__(self, target_precision=0.9, min_training_examples=200, validation_share=0.25, n_features=2 ** 16,
+                 seed=0):
+        self.target_precision = target_precision
+        self.min_training_examples = min_training_examples
+        self.validation_share = validation_share
+        self.seed = seed
+        self.text_vectorizer = HashingVectorizer(ngram_range=(1, 2), n_features=n_features, alternate_sign=False,
+                                                 norm='l2')
+        self.token_vectorizer = HashingVectorizer(analyzer=_token_list, n_features=n_features, alternate_sign=False,
+                                                  norm=None)
+        self.model = None
+        self.threshold = np.inf
+        self.validation = None
+        self.training_examples = 0
+
+    @property
+    def trained(self):
+        return self.model is not None
+
+    def features(self, hits):
+        """Sparse features of hit_table rows: window words and bigrams, neighbouring words and the hit's identity."""
+        records = hits[['Keyword', 'Matched', 'Theme', 'Section', 'Context']].to_dict('records')
+        tokens = [_identity_tokens(hit) + _near_tokens(hit) for hit in records]
+        return sparse.hstack([self.text_vectorizer.transform(hits['Context'].astype(str)),
+                              self.token_vectorizer.transform(tokens)], format='csr')
+
+    def _new_model(self):
+        return LogisticRegression(C=4.0, max_iter=2000)
+
+    def fit(self, hits, relevant):
+        """
+        Trains on judged hits (relevant: 1 / True = the hit refers to its theme; NaN = no judgement, ignored) and
+        sets the drop threshold from a held-out share of them.
+
+        Returns:
+            self (untrained with fewer than min_training_examples judgements or without both answers).
+        """
+        relevant = np.asarray(relevant, dtype=float)
+        judged = ~np.isnan(relevant)
+        self.training_examples = int(judged.sum())
+        self.model, self.threshold, self.validation = None, np.inf, None
+        is_false_positive = relevant[judged] == 0
+        if self.training_examples < self.min_training_examples or is_false_positive.all() or not is_false_positive.any():
+            return self
+
+        features = self.features(hits[judged])
+        stratify = is_false_positive if min(is_false_positive.sum(), (~is_false_positive).sum()) >= 2 else None
+        train, held_out = train_test_split(np.arange(len(is_false_positive)), test_size=self.validation_share,
+                                           random_state=self.seed, stratify=stratify)
+        model = self._new_model().fit(features[train], is_false_positive[train])
+        probability = model.predict_proba(features[held_out])[:, list(model.classes_).index(True)]
+        self.threshold = threshold_for_precision(is_false_positive[held_out], probability, self.target_precision)
+        dropped = probability >= self.threshold
+        self.validation = {
+            'held_out': len(held_out),
+            'false_positive_share': float(is_false_positive[held_out].mean()),
+            'dropped_share': float(dropped.mean()),
+            'precision': float(is_false_positive[held_out][dropped].mean()) if dropped.any() else np.nan,
+            'recall': float(dropped[is_false_positive[held_out]].mean()) if is_false_positive[held_out].any() else np.nan,
+        }
+
+        # The final model learns from every judgement
+        self.model = self._new_model().fit(features, is_false_positive)
+        return self
+
+    def false_positive_probability(self, hits):
+        """Probability that each hit is a false positive (0 for every hit without a trained model)."""
+        if not self.trained or len(hits) == 0:
+            return np.zeros(len(hits))
+        return self.model.predict_proba(self.features(hits))[:, list(self.model.classes_).index(True)]
+
+    def predict_false_positives(self, hits):
+        """Boolean array: True for the hits to drop."""
+        return self.false_positive_probability(hits) >= self.threshold
+
+    def describe_validation(self):
+        """One-line description of the trained model and its held-out precision and recall."""
+        if not self.trained:
+            return (f"not trained ({self.training_examples:,} LLM judgements with both answers, "
+                    f"{self.min_training_examples:,} needed); no hit is dropped")
+        validation = self.validation
+        line = (f"trained on {self.training_examples:,} LLM judgements ({validation['false_positive_share']:.1%} "
+                f"false positives held out)")
+        if not np.isfinite(self.threshold):
+            return line + f"; no score reaches {self.target_precision:.0%} precision, no hit is dropped"
+        return (line + f"; drops hits scored >= {self.threshold:.2f}: {validation['precision']:.1%} precision, "
+                f"{validation['recall']:.1%} of the false positives caught on {validation['held_out']:,} held-out hits")
+
+
+# -------------------------------
+# Applying the drops
+# -------------------------------
+
+def drop_hits(excerpts, hits, drop, keyword_count_columns, key_column='Cache Key'):
+    """
+    Removes hits from the excerpts.
+
+    Parameters:
+        excerpts (pd.DataFrame): The excerpts hit_table was built from (same row order).
+        hits (pd.DataFrame): hit_table output.
+        drop (array of bool): The hits to remove, aligned with hits.
+        keyword_count_columns (list): The theme count columns, in theme id order.
+        key_column (str): Column identifying each excerpt's transcript (for the transcript statistics).
+
+    Returns:
+        (excerpts with the hits removed from the HIT_COLUMNS and from the theme, section and 'Thematic Term Count'
+        counts, DataFrame of the counts removed per key_column value)
+    """
+    excerpts = excerpts.copy()
+    drop = np.asarray(drop, dtype=bool)
+    count_columns = list(keyword_count_columns) + section_count_columns(keyword_count_columns)
+    removed = np.zeros((len(excerpts), len(count_columns)), dtype=np.int64)
+    if drop.any():
+        dropped = hits[drop]
+        rows, themes = dropped['Excerpt'].to_numpy(), dropped['Theme ID'].to_numpy(dtype=np.int64)
+        sections = dropped['Section'].map(SECTIONS.index).to_numpy(dtype=np.int64)
+        # Theme count columns first, then each theme's Management and Q&A columns (section_count_columns order)
+        np.add.at(removed, (rows, themes), 1)
+        np.add.at(removed, (rows, len(keyword_count_columns) + len(SECTIONS) * themes + sections), 1)
+
+        # Keep the hits that are not dropped, excerpt by excerpt
+        keep_masks = {excerpt: np.ones(n, dtype=bool) for excerpt, n in
+                      zip(np.unique(rows), excerpts['Hit Keyword IDs'].iloc[np.unique(rows)].map(len))}
+        for excerpt, hit in zip(rows, dropped['Hit'].to_numpy()):
+            keep_masks[excerpt][hit] = False
+        for col in HIT_COLUMNS:
+            values = excerpts[col].to_list()
+            for excerpt, keep in keep_masks.items():
+                values[excerpt] = np.asarray(values[excerpt])[keep]
+            excerpts[col] = values
+
+    for i, column in enumerate(count_columns):
+        excerpts[column] = excerpts[column].to_numpy(dtype=np.int64) - removed[:, i]
+    excerpts['Thematic Term Count'] = excerpts[list(keyword_count_columns)].sum(axis=1)
+
+    dropped_counts = pd.DataFrame(removed, columns=count_columns).groupby(excerpts[key_column].to_numpy()).sum()
+    return excerpts, dropped_counts
+
+
+def subtract_counts(stats, dropped_counts, key_column='Cache Key'):
+    """Subtracts drop_hits' removed counts from per-transcript statistics (matched on key_column)."""
+    stats = stats.copy()
+    removed = dropped_counts.reindex(stats[key_column].to_numpy()).fillna(0).astype(np.int64)
+    for column in dropped_counts.columns:
+        if column in stats.columns:
+            stats[column] = stats[column].to_numpy(dtype=np.int64) - removed[column].to_numpy()
+    return stats
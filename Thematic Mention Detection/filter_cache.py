@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental on-disk cache of sentences and keyword counts for 01_Keyword_Filter.py.
+"""
+
+# Background: Incremental cache for 01_Keyword_Filter.py. Most runs only add a new quarter of transcripts or
+# edit one theme in Thematic Vocab.xlsx, yet every transcript used to be re-split and re-matched. The cache
+# stores three things on disk:
+#   1. Per-theme sentence counts, keyed on (hash of the transcript text, hash of the theme's keyword list or
+#      query). Only new transcripts and changed themes are matched again (in normalized mode, all of them in one
+#      NormalizedMatcher pass, so each uncached sentence is tokenized once).
+#   2. The sentence boundaries (offsets and word counts) of each transcript, keyed on the hash of its text and
+#      independent of the themes, so a theme edit never re-splits a transcript.
+#   3. The excerpt rows and the length / count statistics of each transcript, keyed on the transcript and on the
+#      signature of the whole theme set. Unchanged transcripts skip splitting, matching and excerpt building entirely.
+# Excerpt windows merge the hits of every theme, so after a theme edit the context selection and excerpt building
+# (both vectorized) still run over all transcripts; splitting and the unchanged themes' matching come from 1. and 2.
+
+# Cache layout (inside cache_dir):
+#   Sentence Boundaries.pkl          {'rule': SENTENCE_RULE_VERSION, 'boundaries': {text hash: (offsets, word counts)}}
+#   Theme Counts/<theme hash>.pkl   {text hash: (sentence positions, counts, hits)} for one theme definition, where
+#                                    hits = (sentence positions, keyword positions in the theme's list, starts, ends)
+#   Excerpts.pkl                     {'signature': ..., 'excerpts': DataFrame with a 'Cache Key' column,
+#                                     'transcript_stats': one row per transcript with a 'Cache Key' column,
+#                                     'processed_keys': keys of every transcript covered by the excerpts}
+
+
+#Import Libraries
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+
+from transcript_text import SENTENCE_RULE_VERSION
+
+# Bump when the counting or excerpt logic changes so old cache entries are ignored
+CACHE_VERSION = 5
+
+
+def definition_hash(definition, mode):
+    """
+    Hashes one theme definition (a keyword list or a query string) together with the matching mode
+    and the sentence rule, so any change that could alter the counts produces a new key.
+    """
+    payload = json.dumps([CACHE_VERSION, SENTENCE_RULE_VERSION, mode, definition], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def theme_set_signature(theme_hashes, max_sent_length):
+    """Hashes the ordered set of theme hashes and the excerpt settings (the excerpt cache key)."""
+    payload = json.dumps([CACHE_VERSION, list(theme_hashes.items()), max_sent_length])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def document_cache_keys(transcript_df, text_hashes, group_columns):
+    """Returns one key per transcript combining its identifying metadata with the hash of its text."""
+    metadata = transcript_df[group_columns].astype(str).agg('|'.join, axis=1)
+    return metadata + '|' + text_hashes
+
+
+def _load_pickle(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_pickle(path, obj):
+    # Write to a temporary file first so an interrupted run never leaves a truncated cache file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+
+# -------------------------------
+# Per-transcript sentence boundaries
+# -------------------------------
+
+def cached_sentence_boundaries(texts, text_hashes, split_text, cache_dir, keep_hashes=None):
+    """
+    Returns the sentence boundaries of every text, splitting only the texts that are not already cached.
+
+    Parameters:
+        texts (iterable): Transcript texts.
+        text_hashes (iterable): Hash of each text (aligned with texts).
+        split_text (callable): split_text(text) -> (offsets, word_counts), e.g. mention_filter.sentence_boundaries.
+        cache_dir (str): Root folder of the filter cache.
+        keep_hashes (iterable, optional): Hashes of the whole current corpus; cached entries of other texts are
+                                          dropped. None keeps every entry.
+
+    Returns:
+        list of (offsets, word_counts) aligned with texts, for split_transcripts(boundaries=...).
+    """
+    cache_path = os.path.join(cache_dir, 'Sentence Boundaries.pkl')
+    cached = _load_pickle(cache_path, None)
+    store = cached['boundaries'] if cached is not None and cached.get('rule') == SENTENCE_RULE_VERSION else {}
+
+    boundaries = []
+    changed = False
+    for text, doc_hash in zip(texts, text_hashes):
+        entry = store.get(doc_hash)
+        if entry is None:
+            offsets, word_counts = split_text(text)
+            # uint32 offsets and word counts keep the file at 12 bytes per sentence
+            entry = (offsets.astype(np.uint32), np.asarray(word_counts, dtype=np.uint32))
+            store[doc_hash] = entry
+            changed = True
+        boundaries.append((entry[0].astype(np.int64), entry[1].astype(np.int64)))
+
+    if keep_hashes is not None:
+        keep = set(keep_hashes)
+        stale = [doc_hash for doc_hash in store if doc_hash not in keep]
+        for doc_hash in stale:
+            del store[doc_hash]
+        changed = changed or bool(stale)
+    if changed:
+        _save_pickle(cache_path, {'rule': SENTENCE_RULE_VERSION, 'boundaries': store})
+    return boundaries
+
+
+# -------------------------------
+# Per-theme sentence counts
+# -------------------------------
+
+def cached_keyword_counts(sentence_df, theme_hashes, count_theme, cache_dir, text_hash_column='Text Hash',
+                          count_themes=None):
+    """
+    Builds the '*_keyword_count' columns for sentence_df, matching only what is not already cached.
+
+    Parameters:
+        sentence_df (pd.DataFrame): One row per sentence in transcript order, with 'Sentence' and text_hash_column.
+        theme_hashes (dict): Count column name -> definition_hash of that theme.
+        count_theme (callable): count_theme(column, rows) -> (array of counts for the given sentence rows,
+                                hits or None). hits is a DataFrame with 'Row' (position in rows), 'Local ID',
+                                'Start' and 'End', as returned by mention_filter.match_theme.
+        cache_dir (str): Root folder of the filter cache.
+        count_themes (callable, optional): count_themes(columns, rows) -> {column: (counts, hits)}, the same for
+                                several themes at once. If given, every uncached theme is matched in one call over
+                                the union of the uncached rows (e.g. one tokenization per sentence in normalized
+                                mode) instead of one count_theme call per theme.
+
+    Returns:
+        keyword_counts_df (pd.DataFrame): Counts aligned with sentence_df.
+        hit_parts (list): One hit DataFrame per theme with hits ('Row' = position in sentence_df, 'Local ID',
+                          'Start', 'End', 'Theme ID' = position of the theme in theme_hashes).
+        stats (dict): Number of (transcript, theme) pairs reused from cache and matched.
+    """
+    # Row ranges of each transcript (sentence 0 starts a new transcript)
+    starts = np.flatnonzero(sentence_df['Sentence'].to_numpy() == 0)
+    lengths = np.diff(np.append(starts, len(sentence_df)))
+    doc_hashes = sentence_df[text_hash_column].to_numpy()[starts]
+
+    # Fill counts and hits from cache; remember the transcripts that still need matching
+    themes = []
+    for column, theme_hash in theme_hashes.items():
+        cache_path = os.path.join(cache_dir, 'Theme Counts', f'{theme_hash}.pkl')
+        store = _load_pickle(cache_path, {})
+        counts = np.zeros(len(sentence_df), dtype=np.int64)
+        theme_hits = []
+        missing_docs = []
+        for start, length, doc_hash in zip(starts, lengths, doc_hashes):
+            entry = store.get(doc_hash)
+            if entry is None:
+                missing_docs.append((start, length, doc_hash))
+            else:
+                positions, values, (hit_sentences, local_ids, hit_starts, hit_ends) = entry
+                counts[start + positions] = values
+                if len(hit_sentences):
+                    theme_hits.append((start + hit_sentences.astype(np.int64), local_ids, hit_starts, hit_ends))
+        missing_rows = (np.concatenate([np.arange(start, start + length) for start, length, _ in missing_docs])
+                        if missing_docs else np.empty(0, dtype=np.int64))
+        themes.append((column, cache_path, store, counts, theme_hits, missing_docs, missing_rows))
+
+    # With count_themes, match every uncached theme in one call over the union of their uncached rows
+    matched = {}
+    missing_columns = [theme[0] for theme in themes if len(theme[6])]
+    if count_themes is not None and missing_columns:
+        union_rows = np.unique(np.concatenate([theme[6] for theme in themes if len(theme[6])]))
+        for column, (union_counts, union_hits) in count_themes(missing_columns, sentence_df.iloc[union_rows]).items():
+            matched[column] = (union_rows, union_counts, union_hits)
+
+    stats = {'reused': 0, 'matched': 0}
+    keyword_counts_df = pd.DataFrame(index=sentence_df.index)
+    hit_parts = []
+
+    for theme_id, (column, cache_path, store, counts, theme_hits, missing_docs, missing_rows) in enumerate(themes):
+        if missing_docs:
+            # Counts and hits of the matched rows, with the hits as positions in sentence_df (ascending)
+            if column in matched:
+                matched_rows, matched_counts, matched_hits = matched[column]
+                matched_counts = matched_counts[np.searchsorted(matched_rows, missing_rows)]
+            else:
+                matched_rows = missing_rows
+                matched_counts, matched_hits = count_theme(column, sentence_df.iloc[missing_rows])
+            counts[missing_rows] = matched_counts
+
+            if matched_hits is None:
+                matched_hits = pd.DataFrame({'Row': [], 'Local ID': [], 'Start': [], 'End': []}, dtype=np.uint32)
+            hit_rows = matched_rows[matched_hits['Row'].to_numpy(dtype=np.int64)]
+            in_missing = np.isin(hit_rows, missing_rows)
+            hit_rows = hit_rows[in_missing]
+            hit_values = [matched_hits[col].to_numpy(dtype=np.uint32)[in_missing] for col in ('Local ID', 'Start', 'End')]
+            if len(hit_rows):
+                theme_hits.append((hit_rows, *hit_values))
+
+            # Store only the sentences with hits, which keeps the cache small
+            for start, length, doc_hash in missing_docs:
+                doc_counts = counts[start:start + length]
+                positions = np.flatnonzero(doc_counts).astype(np.uint32)
+                first, last = np.searchsorted(hit_rows, [start, start + length])
+                doc_hits = ((hit_rows[first:last] - start).astype(np.uint32),
+                            *(values[first:last] for values in hit_values))
+                store[doc_hash] = (positions, doc_counts[positions].astype(np.uint32), doc_hits)
+            _save_pickle(cache_path, store)
+
+        if theme_hits:
+            rows, local_ids, hit_starts, hit_ends = (np.concatenate(arrays) for arrays in zip(*theme_hits))
+            hit_parts.append(pd.DataFrame({'Row': rows, 'Local ID': local_ids, 'Start': hit_starts,
+                                           'End': hit_ends, 'Theme ID': theme_id}))
+
+        stats['reused'] += len(starts) - len(missing_docs)
+        stats['matched'] += len(missing_docs)
+        keyword_counts_df[column] = counts
+
+    return keyword_counts_df, hit_parts, stats
+
+
+def prune_theme_counts(cache_dir, theme_hashes):
+    """Deletes cached counts of theme definitions that are no longer in use."""
+    counts_dir = os.path.join(cache_dir, 'Theme Counts')
+    if not os.path.isdir(counts_dir):
+        return
+    keep = {f'{theme_hash}.pkl' for theme_hash in theme_hashes.values()}
+    for file_name in os.listdir(counts_dir):
+        if file_name.endswith('.pkl') and file_name not in keep:
+            os.remove(os.path.join(counts_dir, file_name))
+
+
+# -------------------------------
+# Per-transcript excerpts
+# -------------------------------
+
+def load_cached_excerpts(cache_dir, signature):
+    """
+    Returns the cached excerpt rows and transcript statistics (both with a 'Cache Key' column) and the set of
+    transcript keys they cover, if they were built with the same theme set. Otherwise returns empty
+    DataFrames and an empty set.
+
+    Transcripts without any hit have no excerpt rows, so the covered keys are stored separately.
+    """
+    cached = _load_pickle(os.path.join(cache_dir, 'Excerpts.pkl'), None)
+    if cached is None or cached.get('signature') != signature:
+        return pd.DataFrame(columns=['Cache Key']), pd.DataFrame(columns=['Cache Key']), set()
+    return cached['excerpts'], cached['transcript_stats'], cached['processed_keys']
+
+
+def save_cached_excerpts(cache_dir, signature, excerpts, transcript_stats, processed_keys):
+    """Replaces the excerpt cache with the excerpts and transcript statistics of the current run."""
+    _save_pickle(os.path.join(cache_dir, 'Excerpts.pkl'), {
+        'signature': signature,
+        'excerpts': excerpts,
+        'transcript_stats': transcript_stats,
+        'processed_keys': set(processed_keys),
+    })
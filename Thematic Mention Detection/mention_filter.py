@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+"""
+Sentence splitting, keyword counting, context selection and excerpt building for the keyword filter.
+"""
+
+# Background: The sentence splitting, keyword counting, context selection and excerpt building steps of
+# 01_Keyword_Filter.py, as importable functions. Keeping them here lets the filter run them on any subset
+# of transcripts (e.g. only the transcripts that are not already cached) with identical results.
+
+# How to Use:
+# - sentence_df = split_transcripts(transcript_df)
+# - keyword_counts_df = count_keywords(sentence_df, compile_keyword_patterns(keyword_dict))
+#   or, with keyword-level hit records: keyword_counts_df, hits_df = match_keywords(sentence_df, keyword_dict)
+# - transcripts_chunks = select_context_sentences(pd.concat([sentence_df, keyword_counts_df], axis=1), keyword_count_columns)
+# - excerpts = build_excerpts(transcripts_chunks, keyword_count_columns, hits=hits_df)
+#   Each excerpt then carries the HIT_COLUMNS arrays: which keyword (id in build_keyword_table) of which theme
+#   matched, and where ([start, end) offsets into 'Combined Transcript').
+# - Sentences are split once (transcript_text.sentence_offsets); excerpt building reuses those sentence rows.
+#   split_transcripts(transcript_df, boundaries=...) takes the sentence boundaries kept by the filter cache.
+# - section_df = section_counts(sentence_df, keyword_counts_df, hits_df) splits every count into Management and Q&A
+#   ('ai_keyword_count_mgmt', 'ai_keyword_count_qa') using the 'QA Start' offset of each transcript; pass the
+#   columns to build_excerpts(extra_count_columns=...) to sum them per excerpt.
+# - stats_df = add_intensity(transcript_stats(sentence_df, keyword_counts_df, section_df), keyword_count_columns)
+#   gives one row per transcript with its word / sentence counts (overall and per section), theme counts and
+#   mentions per 10k words ('ai_mentions_per_10k_words', '..._mgmt', '..._qa').
+# - With compact=True, metadata is held as categoricals, sentences as Arrow strings and counts as the smallest
+#   unsigned ints that fit; log_memory() records the footprint of each stage for print_memory_report().
+
+
+#Import Libraries
+import re
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from transcript_text import WORD_PATTERN, sentence_offsets
+from token_matcher import NormalizedMatcher
+
+tqdm.pandas()  # Enable the tqdm progress bar for pandas
+
+# Define the columns to group by (one group per transcript)
+GROUP_COLUMNS = ['Ticker', 'Company Name', 'Date', 'Event Type']
+
+# Define the maximum sentence length for combining transcripts
+MAX_SENT_LENGTH = 10
+
+# Keyword-level hit records of each excerpt, one array per column (same length within an excerpt)
+HIT_COLUMNS = ['Hit Keyword IDs', 'Hit Theme IDs', 'Hit Starts', 'Hit Ends']
+
+# Transcript sections: prepared remarks (Management) and analyst questions and answers (Q&A).
+# 'QA Start' is the character offset where the Q&A section begins in the combined 'Transcript' text.
+SECTIONS = ['mgmt', 'qa']
+QA_START_COLUMN = 'QA Start'
+
+# Theme intensity is expressed as mentions per this many words
+INTENSITY_WORDS = 10000
+
+
+#%% Split Transcripts By Sentence
+
+def compact_metadata(transcript_df, text_column='Transcript'):
+    """
+    Converts the string metadata columns (every object column except the text) to categoricals.
+
+    Done once per transcript before exploding, so each sentence row only repeats small integer codes
+    instead of a Python string per column. Fixed-width columns such as 'Date' are left as they are.
+    """
+    transcript_df = transcript_df.copy()
+    for column in transcript_df.columns.drop(text_column):
+        if transcript_df[column].dtype == object:
+            transcript_df[column] = transcript_df[column].astype('category')
+    return transcript_df
+
+
+# Function to split transcript texts into individual sentences, using the shared sentence rule in transcript_text.py
+def sentence_boundaries(text):
+    """Returns the [start, end) offsets of the sentences of a text and the number of words in each."""
+    offsets = sentence_offsets(text)
+    word_counts = np.array([len(WORD_PATTERN.findall(text[start:end])) for start, end in offsets], dtype=np.int64)
+    return offsets, word_counts
+
+
+def split_text_with_offsets(text, boundaries=None):
+    """
+    Returns the sentences of a text, the character offset where each one starts and its number of words.
+    boundaries is an optional (offsets, word_counts) pair from sentence_boundaries, e.g. read from the filter cache.
+    """
+    offsets, word_counts = sentence_boundaries(text) if boundaries is None else boundaries
+    sentences = [text[start:end] for start, end in offsets]
+    return sentences, offsets[:, 0], word_counts
+
+
+def split_transcripts(transcript_df, text_column='Transcript', compact=False, boundaries=None):
+    """
+    Explodes a transcript DataFrame into one row per sentence.
+
+    Adds a 'Document' key (position of the transcript in transcript_df), a 'Sentence' column with the
+    position of each sentence within its transcript, which matches the sentence numbering of the
+    transcript index and of the filter cache, 'Sentence Start', the sentence's character offset in
+    the transcript, and 'Word Count' (word tokens as in transcript_text.word_tokens).
+
+    With compact=True, metadata columns become categoricals, the sentence text an Arrow-backed string
+    and 'Document' / 'Sentence' the smallest unsigned ints that fit.
+
+    boundaries (list, optional): One sentence_boundaries result per transcript (filter_cache.cached_sentence_boundaries),
+    so already split transcripts are only sliced.
+    """
+    sentence_df = compact_metadata(transcript_df, text_column) if compact else transcript_df.copy()
+    if boundaries is None:
+        boundaries = [None] * len(sentence_df)
+    splits = [split_text_with_offsets(text, bounds) for text, bounds in zip(sentence_df[text_column], boundaries)]
+    sentence_df[text_column] = [sentences for sentences, _, _ in splits]
+    sentence_df['Sentence Start'] = [starts for _, starts, _ in splits]
+    sentence_df['Word Count'] = [word_counts for _, _, word_counts in splits]
+    sentence_df['Document'] = np.arange(len(sentence_df))
+    sentence_df = sentence_df.explode([text_column, 'Sentence Start', 'Word Count'])
+    sentence_df['Sentence'] = sentence_df.groupby(level=0).cumcount()
+    sentence_df = sentence_df.reset_index(drop=True)
+    for column in ('Sentence Start', 'Word Count'):
+        sentence_df[column] = pd.to_numeric(sentence_df[column]).fillna(0).astype(np.int64)
+
+    if compact:
+        sentence_df[text_column] = sentence_df[text_column].astype('string[pyarrow]')
+        index_columns = ['Document', 'Sentence', 'Sentence Start', 'Word Count']
+        sentence_df[index_columns] = compact_counts(sentence_df[index_columns])
+    return sentence_df
+
+
+#%% Keyword Counting
+
+def compile_keyword_patterns(keyword_dict):
+    """Precompiles one case-insensitive, word-bounded alternation regex per theme."""
+    return {
+        variable_name: re.compile(r'\b(?:' + '|'.join(map(re.escape, keywords)) + r')\b', flags=re.IGNORECASE)
+        for variable_name, keywords in keyword_dict.items()
+    }
+
+
+# Function to count keywords using precompiled regex
+def count_keywords_optimized(s, compiled_patterns):
+    if isinstance(s, str):
+        return {name: len(pattern.findall(s)) for name, pattern in compiled_patterns.items()}
+    return {name: 0 for name in compiled_patterns.keys()}
+
+
+def count_keywords(sentence_df, compiled_patterns, text_column='Transcript', show_progress=True):
+    """
+    Counts keyword hits per sentence for every theme (show_progress=False hides the tqdm bar, e.g. in workers).
+
+    Returns:
+        pd.DataFrame aligned with sentence_df, one '*_keyword_count' column per theme.
+    """
+    columns = [name.replace('_keywords', '_keyword_count') for name in compiled_patterns.keys()]
+    if len(sentence_df) == 0:
+        return pd.DataFrame(0, index=sentence_df.index, columns=columns, dtype=np.int64)
+
+    apply = sentence_df[text_column].progress_apply if show_progress else sentence_df[text_column].apply
+    keyword_counts = apply(lambda x: count_keywords_optimized(x, compiled_patterns))
+
+    # Convert the resulting list of dictionaries into a DataFrame
+    keyword_counts_df = pd.DataFrame(keyword_counts.tolist(), index=sentence_df.index)
+    keyword_counts_df.columns = columns
+    return keyword_counts_df
+
+
+# -------------------------------
+# Keyword-level hits
+# -------------------------------
+
+def build_keyword_table(keyword_dict):
+    """
+    Numbers every keyword of every theme.
+
+    Returns:
+        pd.DataFrame with 'Keyword ID' (global), 'Theme ID', 'Theme' (count column), 'Local ID'
+        (position in the theme's keyword list) and 'Keyword'.
+    """
+    rows = []
+    for theme_id, (variable_name, keywords) in enumerate(keyword_dict.items()):
+        for local_id, keyword in enumerate(keywords):
+            rows.append({
+                'Keyword ID': len(rows),
+                'Theme ID': theme_id,
+                'Theme': variable_name.replace('_keywords', '_keyword_count'),
+                'Local ID': local_id,
+                'Keyword': keyword,
+            })
+    return pd.DataFrame(rows, columns=['Keyword ID', 'Theme ID', 'Theme', 'Local ID', 'Keyword'])
+
+
+def keyword_lookup(keywords):
+    """Lowercase keyword -> position in the keyword list (the first of case-variant duplicates wins)."""
+    return {keyword.lower(): local_id for local_id, keyword in reversed(list(enumerate(keywords)))}
+
+
+def _local_keyword_id(matched_text, keywords, lookup):
+    local_id = lookup.get(matched_text.lower())
+    if local_id is None:
+        # Case folding can differ from str.lower() for a few characters; fall back to a full-match search
+        local_id = next(i for i, keyword in enumerate(keywords)
+                        if re.fullmatch(re.escape(keyword), matched_text, flags=re.IGNORECASE))
+    return local_id
+
+
+def match_theme(texts, pattern, keywords, show_progress=False, description=None):
+    """
+    Counts one theme's keyword hits in each text and records every hit.
+
+    Parameters:
+        texts (sequence): Sentences (non-strings count as zero).
+        pattern (re.Pattern): The theme's pattern from compile_keyword_patterns.
+        keywords (list): The theme's keyword list (the pattern's alternatives, in order).
+
+    Returns:
+        counts (np.ndarray): Hits per text.
+        hits (pd.DataFrame): 'Row' (position in texts), 'Local ID', 'Start', 'End' (offsets within the text).
+    """
+    lookup = keyword_lookup(keywords)
+    rows, local_ids, starts, ends = [], [], [], []
+
+    for row, text in enumerate(tqdm(texts, desc=description, disable=not show_progress)):
+        if not isinstance(text, str):
+            continue
+        for match in pattern.finditer(text):
+            rows.append(row)
+            local_ids.append(_local_keyword_id(match.group(), keywords, lookup))
+            starts.append(match.start())
+            ends.append(match.end())
+
+    # The counts are derived from the same hits, so counts and provenance can never disagree
+    rows = np.asarray(rows, dtype=np.int64)
+    counts = np.bincount(rows, minlength=len(texts)).astype(np.int64)
+    hits = pd.DataFrame({
+        'Row': rows.astype(np.uint32),
+        'Local ID': np.asarray(local_ids, dtype=np.uint32),
+        'Start': np.asarray(starts, dtype=np.uint32),
+        'End': np.asarray(ends, dtype=np.uint32),
+    })
+    return counts, hits
+
+
+def match_keywords(sentence_df, keyword_dict, text_column='Transcript', show_progress=True, normalized=False):
+    """
+    Counts keyword hits per sentence for every theme and records every hit, in a single matching pass.
+
+    With normalized=True, keywords are matched on normalized tokens (plurals, hyphenation and inflections,
+    see token_matcher.py) instead of with one exact regex per theme.
+
+    Returns:
+        keyword_counts_df (pd.DataFrame): Aligned with sentence_df, one '*_keyword_count' column per theme.
+        hits_df (pd.DataFrame): One row per hit: 'Row' (sentence_df index label), 'Keyword ID', 'Theme ID',
+                                'Start', 'End' (offsets within the sentence).
+    """
+    texts = sentence_df[text_column].to_numpy(dtype=object)
+    columns = [variable_name.replace('_keywords', '_keyword_count') for variable_name in keyword_dict]
+
+    if normalized:
+        counts, hits = NormalizedMatcher(keyword_dict).match_texts(texts, show_progress)
+        keyword_counts_df = pd.DataFrame(counts, index=sentence_df.index, columns=columns)
+        return keyword_counts_df, combine_theme_hits([hits] if len(hits) else [], keyword_dict, sentence_df.index)
+
+    compiled_patterns = compile_keyword_patterns(keyword_dict)
+
+    keyword_counts_df = pd.DataFrame(index=sentence_df.index)
+    hit_parts = []
+    for theme_id, ((variable_name, keywords), column) in enumerate(zip(keyword_dict.items(), columns)):
+        counts, hits = match_theme(texts, compiled_patterns[variable_name], keywords, show_progress, column)
+        keyword_counts_df[column] = counts
+        if len(hits):
+            hit_parts.append(hits.assign(**{'Theme ID': theme_id}))
+
+    return keyword_counts_df, combine_theme_hits(hit_parts, keyword_dict, sentence_df.index)
+
+
+def combine_theme_hits(hit_parts, keyword_dict, row_labels):
+    """
+    Concatenates per-theme hit frames ('Row' positions, 'Local ID', 'Theme ID', 'Start', 'End') into one
+    frame with global 'Keyword ID's (see build_keyword_table) and 'Row' index labels.
+    """
+    if not hit_parts:
+        return pd.DataFrame({
+            'Row': pd.Series(np.asarray(row_labels)[:0]),
+            'Keyword ID': np.empty(0, dtype=np.uint32), 'Theme ID': np.empty(0, dtype=np.uint16),
+            'Start': np.empty(0, dtype=np.uint32), 'End': np.empty(0, dtype=np.uint32),
+        })
+
+    # Global id of a theme's first keyword = number of keywords in the themes before it
+    theme_offsets = np.cumsum([0] + [len(keywords) for keywords in keyword_dict.values()])[:-1]
+    hits = pd.concat(hit_parts, ignore_index=True)
+    theme_ids = hits['Theme ID'].to_numpy(dtype=np.int64)
+    return pd.DataFrame({
+        'Row': np.asarray(row_labels)[hits['Row'].to_numpy(dtype=np.int64)],
+        'Keyword ID': (theme_offsets[theme_ids] + hits['Local ID'].to_numpy(dtype=np.int64)).astype(np.uint32),
+        'Theme ID': theme_ids.astype(np.uint16),
+        'Start': hits['Start'].to_numpy(dtype=np.uint32),
+        'End': hits['End'].to_numpy(dtype=np.uint32),
+    })
+
+
+def compact_counts(counts_df):
+    """Downcasts each count column to the smallest unsigned integer type that holds its maximum."""
+    return counts_df.apply(pd.to_numeric, downcast='unsigned')
+
+
+# -------------------------------
+# Management vs Q&A counts
+# -------------------------------
+
+def section_count_column(count_column, section):
+    """Name of a theme's count within one section, e.g. 'ai_keyword_count_qa' (deliberately not ending in '_keyword_count')."""
+    return f'{count_column}_{section}'
+
+
+def section_count_columns(keyword_count_columns):
+    """The Management and Q&A count columns of every theme, in theme order."""
+    return [section_count_column(column, section) for column in keyword_count_columns for section in SECTIONS]
+
+
+def section_counts(sentence_df, keyword_counts_df, hits=None, qa_start_column=QA_START_COLUMN):
+    """
+    Splits every theme's sentence counts into Management and Q&A counts.
+
+    With keyword-level hits (regex and normalized matching), each hit is placed by its own offset in the
+    transcript, so a sentence running across the section boundary is split correctly. Without hits (index
+    matching) the whole sentence count goes to the section the sentence starts in.
+
+    Parameters:
+        sentence_df (pd.DataFrame): Output of split_transcripts, with qa_start_column carried over from the transcripts.
+        keyword_counts_df (pd.DataFrame): The '*_keyword_count' columns, aligned with sentence_df.
+        hits (pd.DataFrame or None): Hits from match_keywords ('Theme ID' = position of the column in keyword_counts_df).
+
+    Returns:
+        pd.DataFrame aligned with sentence_df with a '<count column>_mgmt' and '<count column>_qa' column per theme.
+    """
+    n_sentences = len(sentence_df)
+    sentence_start = sentence_df['Sentence Start'].to_numpy(dtype=np.int64)
+    qa_start = sentence_df[qa_start_column].to_numpy(dtype=np.int64)
+    section_df = pd.DataFrame(index=sentence_df.index)
+
+    if hits is not None:
+        positions = sentence_df.index.get_indexer(hits['Row'])
+        in_qa = hits['Start'].to_numpy(dtype=np.int64) + sentence_start[positions] >= qa_start[positions]
+        theme_ids = hits['Theme ID'].to_numpy()
+
+    for theme_id, column in enumerate(keyword_counts_df.columns):
+        if hits is not None:
+            theme_hits = theme_ids == theme_id
+            qa = np.bincount(positions[theme_hits & in_qa], minlength=n_sentences)
+        else:
+            qa = np.where(sentence_start >= qa_start, keyword_counts_df[column].to_numpy(dtype=np.int64), 0)
+        section_df[section_count_column(column, 'mgmt')] = keyword_counts_df[column].to_numpy(dtype=np.int64) - qa
+        section_df[section_count_column(column, 'qa')] = qa
+
+    return section_df
+
+
+# -------------------------------
+# Transcript length and theme intensity
+# -------------------------------
+
+def intensity_column(count_column, section=None):
+    """Name of a theme's intensity column, e.g. 'ai_mentions_per_10k_words' or 'ai_mentions_per_10k_words_qa'."""
+    theme = count_column[:-len('_keyword_count')] if count_column.endswith('_keyword_count') else count_column
+    return f'{theme}_mentions_per_10k_words' + (f'_{section}' if section else '')
+
+
+def transcript_stats(sentence_df, keyword_counts_df, section_df=None, group_columns=GROUP_COLUMNS,
+                     qa_start_column=QA_START_COLUMN, text_column='Transcript'):
+    """
+    Rolls the sentence rows up into one row per transcript: its length and its theme counts.
+
+    Lengths come from the 'Word Count' recorded while splitting, so no second pass over the text is needed.
+    A sentence counts toward the section it starts in.
+
+    Returns:
+        pd.DataFrame in transcript order ('Document') with the group columns, 'Sentences', 'Words',
+        'Mgmt Sentences', 'Mgmt Words', 'QA Sentences', 'QA Words', the keyword counts and the section counts.
+    """
+    is_sentence = sentence_df[text_column].notna().to_numpy()  # empty transcripts explode into one empty row
+    words = sentence_df['Word Count'].to_numpy(dtype=np.int64)
+    in_qa = sentence_df['Sentence Start'].to_numpy(dtype=np.int64) >= sentence_df[qa_start_column].to_numpy(dtype=np.int64)
+
+    lengths = pd.DataFrame({
+        'Sentences': is_sentence, 'Words': words,
+        'Mgmt Sentences': is_sentence & ~in_qa, 'Mgmt Words': np.where(in_qa, 0, words),
+        'QA Sentences': is_sentence & in_qa, 'QA Words': np.where(in_qa, words, 0),
+    }, index=sentence_df.index).astype(np.int64)
+    frames = [lengths, keyword_counts_df.astype(np.int64)]
+    if section_df is not None:
+        frames.append(section_df.astype(np.int64))
+
+    documents = sentence_df['Document'].to_numpy()
+    stats = pd.concat(frames, axis=1).groupby(documents).sum()
+    metadata = sentence_df.drop_duplicates('Document').set_index('Document')[group_columns]
+    stats = pd.concat([metadata.reset_index(drop=True), stats.reset_index(drop=True)], axis=1)
+
+    # Return plain metadata columns, like build_excerpts
+    for col in group_columns:
+        if isinstance(stats[col].dtype, pd.CategoricalDtype):
+            stats[col] = stats[col].astype(stats[col].cat.categories.dtype)
+    return stats
+
+
+def add_intensity(stats, keyword_count_columns):
+    """
+    Adds each theme's mentions per INTENSITY_WORDS words to transcript_stats output, overall and per section
+    (if the section counts are present). Transcripts without words get an intensity of 0.
+    """
+    stats = stats.copy()
+    for column in keyword_count_columns:
+        for section, words_column in ((None, 'Words'), ('mgmt', 'Mgmt Words'), ('qa', 'QA Words')):
+            count_column = column if section is None else section_count_column(column, section)
+            if count_column in stats.columns:
+                words = stats[words_column].where(stats[words_column] > 0)
+                stats[intensity_column(column, section)] = (stats[count_column] * INTENSITY_WORDS / words).fillna(0.0)
+    return stats
+
+
+#%% Memory Report
+
+def frame_memory_mb(df):
+    """Deep memory footprint of a DataFrame in MB (includes the Python strings of object columns)."""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def log_memory(memory_log, stage, df):
+    """Appends the footprint of one pipeline stage to memory_log (a list) and returns the frame unchanged."""
+    memory_log.append({'Stage': stage, 'Rows': len(df), 'Columns': df.shape[1], 'Memory (MB)': frame_memory_mb(df)})
+    return df
+
+
+def print_memory_report(memory_log):
+    """Prints the logged stages as a table."""
+    report = pd.DataFrame(memory_log)
+    if len(report):
+        report['Bytes / Row'] = (report['Memory (MB)'] * 1024 ** 2 / report['Rows'].where(report['Rows'] > 0)).round(1)
+        report['Memory (MB)'] = report['Memory (MB)'].round(1)
+    print(report.to_string(index=False))
+    return report
+
+
+#%% Filter DF for Keyword Hits
+
+def select_context_sentences(sentence_df, keyword_count_columns):
+    """
+    Keeps every sentence with a keyword hit plus the sentence before and after it.
+
+    Neighbours are only taken from the same transcript, so a hit in the first sentence of one call
+    never pulls in the last sentence of the previous call.
+    """
+    # Identify rows where any theme has a hit
+    condition = sentence_df[keyword_count_columns].sum(axis=1) > 0
+
+    # A row shares its transcript with the previous row unless it is the first sentence of a transcript
+    same_as_previous = sentence_df['Sentence'] > 0
+    same_as_next = sentence_df['Sentence'].shift(-1, fill_value=0) > 0
+
+    # Create a boolean mask to include rows where the condition is True or adjacent rows
+    mask = (condition
+            | (condition.shift(1, fill_value=False) & same_as_previous)
+            | (condition.shift(-1, fill_value=False) & same_as_next))
+
+    return sentence_df[mask]
+
+
+#%% Combine Sentences
+
+def build_excerpts(transcripts_chunks, keyword_count_columns, group_columns=GROUP_COLUMNS, max_sent_length=MAX_SENT_LENGTH,
+                   hits=None, extra_count_columns=()):
+    """
+    Combines the selected sentences of each transcript into excerpts of up to `max_sent_length` sentences.
+
+    Every row of transcripts_chunks is one sentence from split_transcripts, so the sentences are never
+    tokenized a second time: the n-th selected sentence of a transcript goes to excerpt n // max_sent_length.
+
+    Parameters:
+        hits (pd.DataFrame or None): Hit records from match_keywords ('Row' = transcripts_chunks index label).
+                                     If given, the HIT_COLUMNS are added with offsets into 'Combined Transcript'.
+        extra_count_columns (list): Further count columns summed per excerpt but not part of 'Thematic Term Count'
+                                    (e.g. the Management / Q&A counts from section_counts).
+
+    Returns:
+        pd.DataFrame with the group columns, 'Combined Transcript', the keyword counts, 'Thematic Term Count'
+        and the extra count columns (and the HIT_COLUMNS).
+    """
+    extra_count_columns = list(extra_count_columns)
+    output_columns = (group_columns + ['Combined Transcript'] + keyword_count_columns + ['Thematic Term Count']
+                      + extra_count_columns)
+    if hits is not None:
+        output_columns += HIT_COLUMNS
+    if len(transcripts_chunks) == 0:
+        return pd.DataFrame(columns=output_columns)
+
+    # observed=True: with categorical metadata, only combinations that actually occur form groups
+    excerpt_number = (transcripts_chunks.groupby(group_columns, observed=True, sort=False).cumcount()
+                      // max_sent_length).rename('Excerpt')
+
+    # Counts may be stored as small unsigned ints; sum them as int64 so excerpt totals cannot overflow
+    count_columns = keyword_count_columns + extra_count_columns
+    aggregations = {'Transcript': ' '.join, **{col: 'sum' for col in count_columns}}
+    chunks = transcripts_chunks[['Transcript'] + count_columns].astype(
+        {'Transcript': object, **{col: np.int64 for col in count_columns}}
+    )
+    group_keys = [transcripts_chunks[col] for col in group_columns] + [excerpt_number]
+    grouped = (chunks.groupby(group_keys, observed=True)
+               .agg(aggregations)
+               .reset_index()
+               .drop(columns=['Excerpt'])
+               .rename(columns={'Transcript': 'Combined Transcript'}))
+    if hits is not None:
+        hit_arrays = _excerpt_hits(chunks['Transcript'], group_keys, grouped['Combined Transcript'], hits)
+    grouped['Combined Transcript'] = grouped['Combined Transcript'].str.strip()
+
+    # Return plain metadata columns, so excerpts from different runs or shards concatenate cleanly
+    for col in group_columns:
+        if isinstance(grouped[col].dtype, pd.CategoricalDtype):
+            grouped[col] = grouped[col].astype(grouped[col].cat.categories.dtype)
+
+    grouped['Thematic Term Count'] = grouped[keyword_count_columns].sum(axis=1)
+    if hits is not None:
+        for col in HIT_COLUMNS:
+            grouped[col] = hit_arrays[col]
+    return grouped[output_columns]
+
+
+def _excerpt_hits(sentences, group_keys, joined_excerpts, hits):
+    """
+    Moves sentence-level hits onto the excerpts built by build_excerpts.
+
+    A sentence starts in its excerpt after the earlier sentences and their joining spaces; the leading
+    whitespace removed by .str.strip() shifts every offset of the excerpt to the left.
+
+    Returns:
+        dict of HIT_COLUMNS name -> list with one array per excerpt (in the excerpts' order).
+    """
+    # Excerpt number of every sentence, numbered in the same (sorted) order as the aggregated excerpts
+    excerpt_of_sentence = sentences.groupby(group_keys, observed=True).ngroup().to_numpy()
+    lengths = pd.Series(sentences.str.len().to_numpy(dtype=np.int64) + 1, index=sentences.index)
+    sentence_start = (lengths.groupby(excerpt_of_sentence).cumsum() - lengths).to_numpy()
+    leading_space = (joined_excerpts.str.len() - joined_excerpts.str.lstrip().str.len()).to_numpy()
+
+    # Keep the hits of selected sentences only (hits of sentences outside any excerpt are dropped)
+    positions = sentences.index.get_indexer(hits['Row'])
+    selected = positions >= 0
+    positions = positions[selected]
+    excerpt = excerpt_of_sentence[positions]
+    shift = sentence_start[positions] - leading_space[excerpt]
+    values = {
+        'Hit Keyword IDs': hits['Keyword ID'].to_numpy()[selected],
+        'Hit Theme IDs': hits['Theme ID'].to_numpy()[selected],
+        'Hit Starts': (hits['Start'].to_numpy(dtype=np.int64)[selected] + shift).astype(np.uint32),
+        'Hit Ends': (hits['End'].to_numpy(dtype=np.int64)[selected] + shift).astype(np.uint32),
+    }
+
+    # Sort by excerpt, then position, and cut the flat arrays into one slice per excerpt
+    order = np.lexsort((values['Hit Starts'], excerpt))
+    bounds = np.searchsorted(excerpt[order], np.arange(len(joined_excerpts) + 1))
+    sorted_values = {col: array[order] for col, array in values.items()}
+    return {
+        col: [array[bounds[i]:bounds[i + 1]] for i in range(len(joined_excerpts))]
+        for col, array in sorted_values.items()
+    }
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Writes and reads the thematic mentions as a partitioned Parquet dataset.
+"""
+
+# Background: The thematic mentions used to be exported only as 1,048,576-row Excel parts, which every
+# downstream script had to re-read in full (and some only read _part1). The mentions are now written as a
+# Parquet dataset partitioned by theme and calendar quarter, so a consumer reads only the themes and
+# quarters it needs. An excerpt with hits for several themes is stored once in each of those themes'
+# partitions; 'Excerpt ID' identifies it across partitions.
+# Every excerpt also carries its keyword-level hits as equal-length arrays ('Hit Keyword IDs', 'Hit Theme IDs',
+# 'Hit Starts', 'Hit Ends'); the manifest's 'keywords' table resolves the ids to keyword and theme names, and
+# Combined Transcript[start:end] is the matched text.
+# Theme intensity (mentions per 10k words) needs the length of every transcript, including those without any
+# hit, so the per-transcript statistics are written next to the partitions as _transcript_stats.parquet.
+
+# Dataset layout (inside dataset_dir):
+#   _manifest.json                           themes, quarters, columns, keywords and row counts of every partition
+#   _transcript_stats.parquet                words, sentences, theme counts and intensity of every transcript
+#   theme=ai/quarter=2024Q1/part-0.parquet   excerpts with ai_keyword_count > 0 dated in 2024 Q1
+#   theme=ai/quarter=2024Q2/part-0.parquet   ...
+
+# How to Use:
+# - From this folder:   read_mentions(dataset_dir, themes=['ai'], quarters=('2023Q1', '2024Q4'))
+# - From other folders (no import needed), pandas pushes the partition filters down to the file listing:
+#     df = pd.read_parquet(dataset_dir, filters=[('theme', 'in', ['ai']), ('quarter', '>=', '2023Q1')])
+#     df = df.drop_duplicates('Excerpt ID')   # only needed when reading several themes
+
+
+#Import Libraries
+import os
+import json
+import shutil
+from datetime import datetime
+import pandas as pd
+
+# Bump when the layout or the columns change
+DATASET_VERSION = 3
+
+# Leading underscore: pyarrow skips these files when reading the dataset directory
+MANIFEST_FILE = '_manifest.json'
+TRANSCRIPT_STATS_FILE = '_transcript_stats.parquet'
+
+
+def theme_name(count_column):
+    """Partition name of a theme: its count column without the '_keyword_count' suffix (e.g. 'ai')."""
+    return count_column[:-len('_keyword_count')] if count_column.endswith('_keyword_count') else count_column
+
+
+def quarter_labels(dates):
+    """Calendar quarter of each date as 'YYYYQn' (sorts correctly as text); missing dates become 'unknown'."""
+    return pd.to_datetime(dates, errors='coerce').dt.to_period('Q').astype(str).replace('NaT', 'unknown')
+
+
+def write_mentions_dataset(mentions_df, dataset_dir, keyword_count_columns, keyword_table=None, transcript_stats=None):
+    """
+    Writes the mentions as a Parquet dataset partitioned by theme and quarter, plus a manifest.
+
+    The new dataset is written next to the old one and swapped in at the end, so readers never see a
+    half-written dataset.
+
+    Parameters:
+        mentions_df (pd.DataFrame): Excerpts with 'Date' and the '*_keyword_count' columns.
+        dataset_dir (str): Target folder (replaced).
+        keyword_count_columns (list): Theme count columns; one 'theme=' partition is written per column.
+        keyword_table (pd.DataFrame or None): mention_filter.build_keyword_table, stored as the manifest's 'keywords'.
+        transcript_stats (pd.DataFrame or None): mention_filter.transcript_stats (with intensity), written to
+                                                 TRANSCRIPT_STATS_FILE.
+
+    Returns:
+        dict: The manifest.
+    """
+    mentions_df = mentions_df.reset_index(drop=True)
+    mentions_df.insert(0, 'Excerpt ID', range(len(mentions_df)))
+    quarters = quarter_labels(mentions_df['Date'])
+
+    staging_dir = dataset_dir + '.tmp'
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    partitions = []
+    for count_column in keyword_count_columns:
+        theme = theme_name(count_column)
+        hits = mentions_df[count_column] > 0
+        for quarter, part in mentions_df[hits].groupby(quarters[hits], sort=True):
+            relative_path = os.path.join(f'theme={theme}', f'quarter={quarter}', 'part-0.parquet')
+            os.makedirs(os.path.join(staging_dir, os.path.dirname(relative_path)))
+            part.to_parquet(os.path.join(staging_dir, relative_path), index=False)
+            partitions.append({'theme': theme, 'quarter': quarter, 'path': relative_path, 'rows': len(part)})
+
+    manifest = {
+        'version': DATASET_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'excerpts': len(mentions_df),
+        'columns': mentions_df.columns.to_list(),
+        'count_columns': list(keyword_count_columns),
+        # Management / Q&A split of each theme's count, e.g. {'ai': {'mgmt': 'ai_keyword_count_mgmt', 'qa': ...}}
+        'section_columns': {
+            theme_name(column): {section: f'{column}_{section}' for section in ('mgmt', 'qa')
+                                 if f'{column}_{section}' in mentions_df.columns}
+            for column in keyword_count_columns
+        },
+        'themes': {theme_name(column): column for column in keyword_count_columns},
+        'quarters': sorted({partition['quarter'] for partition in partitions}),
+        'partitions': partitions,
+        'keywords': [] if keyword_table is None else [
+            {'id': int(row['Keyword ID']), 'theme_id': int(row['Theme ID']), 'theme': theme_name(row['Theme']),
+             'keyword': row['Keyword']}
+            for _, row in keyword_table.iterrows()
+        ],
+    }
+    if transcript_stats is not None:
+        transcript_stats.to_parquet(os.path.join(staging_dir, TRANSCRIPT_STATS_FILE), index=False)
+        manifest['transcript_stats'] = TRANSCRIPT_STATS_FILE
+        manifest['transcripts'] = len(transcript_stats)
+
+    # Mentions per 10k words of each theme, overall and per section, e.g. {'ai': {'all': 'ai_mentions_per_10k_words', ...}}
+    manifest['intensity_columns'] = {
+        theme_name(column): {section: f'{theme_name(column)}_mentions_per_10k_words{suffix}'
+                             for section, suffix in (('all', ''), ('mgmt', '_mgmt'), ('qa', '_qa'))
+                             if f'{theme_name(column)}_mentions_per_10k_words{suffix}' in mentions_df.columns}
+        for column in keyword_count_columns
+    }
+    with open(os.path.join(staging_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    os.replace(staging_dir, dataset_dir)
+    return manifest
+
+
+def load_manifest(dataset_dir):
+    """Reads the manifest of a mentions dataset."""
+    with open(os.path.join(dataset_dir, MANIFEST_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def keyword_lookup_table(manifest):
+    """The manifest's keywords as a DataFrame indexed by keyword id (columns 'theme_id', 'theme', 'keyword')."""
+    return pd.DataFrame(manifest.get('keywords', []), columns=['id', 'theme_id', 'theme', 'keyword']).set_index('id')
+
+
+def read_transcript_stats(dataset_dir, columns=None):
+    """Reads the per-transcript statistics (words, sentences, theme counts and intensity) of a mentions dataset."""
+    return pd.read_parquet(os.path.join(dataset_dir, TRANSCRIPT_STATS_FILE), columns=columns)
+
+
+def read_mentions(dataset_dir, themes=None, quarters=None, columns=None):
+    """
+    Reads the excerpts of selected themes and quarters; only the matching partition files are opened.
+
+    Parameters:
+        themes (list or None): Theme partition names (e.g. ['ai', 'tariffs']); None reads every theme.
+        quarters (tuple, list or None): (first, last) 'YYYYQn' range, or a list of quarters; None reads all.
+        columns (list or None): Columns to read ('Excerpt ID' is always included).
+
+    Returns:
+        pd.DataFrame with one row per excerpt (excerpts matching several themes are not repeated), in export order.
+    """
+    manifest = load_manifest(dataset_dir)
+    selected = [
+        partition for partition in manifest['partitions']
+        if (themes is None or partition['theme'] in themes)
+        and (quarters is None
+             or (isinstance(quarters, tuple) and quarters[0] <= partition['quarter'] <= quarters[1])
+             or (not isinstance(quarters, tuple) and partition['quarter'] in quarters))
+    ]
+
+    read_columns = None if columns is None else ['Excerpt ID'] + [col for col in columns if col != 'Excerpt ID']
+    if not selected:
+        return pd.DataFrame(columns=read_columns or manifest['columns'])
+
+    parts = [pd.read_parquet(os.path.join(dataset_dir, partition['path']), columns=read_columns)
+             for partition in selected]
+    return (pd.concat(parts, ignore_index=True)
+            .drop_duplicates('Excerpt ID')
+            .sort_values('Excerpt ID')
+            .reset_index(drop=True))
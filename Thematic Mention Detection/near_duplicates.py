@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Near-duplicate transcript detection with MinHash signatures.
+"""
+
+# Background: Near-duplicate transcript detection. The same call often appears more than once in the raw data:
+# a corrected or re-issued transcript with a different date, a copy in the next year's workbook, or the same
+# call filed under two tickers (share classes, ADRs, renamed companies). Duplicated text inflates keyword counts
+# and LLM spend downstream. Sorting by `Event Type` length and dropping on (Ticker, Date) misses all of these.
+
+# Method: MinHash + locality-sensitive hashing (LSH).
+#   1. Each transcript becomes the set of its word 5-grams ("shingles").
+#   2. A MinHash signature of NUM_PERM values summarises that set; the share of equal values between two
+#      signatures estimates the Jaccard similarity of the two transcripts.
+#   3. Signatures are cut into BANDS bands; transcripts sharing any band bucket become candidate pairs, so only
+#      likely duplicates are compared (near-linear instead of comparing every pair).
+#   4. Candidates above SIMILARITY_THRESHOLD are joined into duplicate groups, and one best copy is kept per group.
+
+# How to Use:
+# - transcript_df, duplicates_df = drop_near_duplicates(transcript_df)
+# - duplicates_df lists every transcript that belongs to a duplicate group, with 'Duplicate Group' and 'Kept'.
+
+
+#Import Libraries
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from transcript_text import word_tokens
+
+# Words per shingle
+SHINGLE_SIZE = 5
+
+# MinHash signature length, split into BANDS bands of NUM_PERM // BANDS rows (16 x 8 flags pairs from ~0.7 Jaccard)
+NUM_PERM = 128
+BANDS = 16
+
+# Estimated Jaccard similarity at which two transcripts count as the same call
+SIMILARITY_THRESHOLD = 0.8
+
+# Transcripts with fewer shingles than this (empty or stub transcripts) are never grouped
+MIN_SHINGLES = 50
+
+# Shingles hashed per block, which caps the temporary (block x NUM_PERM) array
+HASH_BLOCK_SIZE = 4096
+
+
+def _hash_parameters(num_perm, seed):
+    """Random odd multipliers and offsets of the multiply-shift hash functions (one per permutation)."""
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    return multipliers, offsets
+
+
+def _shingle_hashes(token_ids, shingle_size):
+    """Combines every run of `shingle_size` token ids into one 64-bit shingle hash (unique values only)."""
+    n_shingles = len(token_ids) - shingle_size + 1
+    if n_shingles <= 0:
+        return np.empty(0, dtype=np.uint64)
+
+    # Polynomial hash of the window; uint64 arithmetic wraps around, which is what we want here
+    hashes = np.zeros(n_shingles, dtype=np.uint64)
+    for offset in range(shingle_size):
+        hashes = hashes * np.uint64(1000003) + token_ids[offset:offset + n_shingles]
+    return np.unique(hashes)
+
+
+def minhash_signatures(texts, shingle_size=SHINGLE_SIZE, num_perm=NUM_PERM, seed=7):
+    """
+    Computes one MinHash signature per text.
+
+    Parameters:
+        texts (iterable of str): Transcript texts.
+
+    Returns:
+        signatures (np.ndarray): (n_texts, num_perm) uint32 signatures.
+        n_shingles (np.ndarray): Number of distinct shingles of each text.
+    """
+    multipliers, offsets = _hash_parameters(num_perm, seed)
+    vocabulary = {}
+    signatures = []
+    n_shingles = []
+
+    for text in tqdm(texts, desc='MinHash signatures'):
+        tokens, _ = word_tokens(text)
+        token_ids = np.fromiter((vocabulary.setdefault(token, len(vocabulary)) for token in tokens),
+                                dtype=np.uint64, count=len(tokens))
+        shingles = _shingle_hashes(token_ids, shingle_size)
+
+        # Each permutation is h(x) = high 32 bits of (a * x + b); the signature keeps the minimum per permutation
+        signature = np.full(num_perm, np.iinfo(np.uint32).max, dtype=np.uint64)
+        for start in range(0, len(shingles), HASH_BLOCK_SIZE):
+            block = shingles[start:start + HASH_BLOCK_SIZE]
+            permuted = (block[:, None] * multipliers[None, :] + offsets[None, :]) >> np.uint64(32)
+            signature = np.minimum(signature, permuted.min(axis=0))
+
+        signatures.append(signature.astype(np.uint32))
+        n_shingles.append(len(shingles))
+
+    if not signatures:
+        return np.empty((0, num_perm), dtype=np.uint32), np.empty(0, dtype=np.int64)
+    return np.vstack(signatures), np.asarray(n_shingles, dtype=np.int64)
+
+
+def candidate_pairs(signatures, bands=BANDS, eligible=None):
+    """
+    Returns the (i, j) row pairs, i < j, that share at least one LSH band bucket.
+
+    Parameters:
+        signatures (np.ndarray): (n, num_perm) MinHash signatures.
+        eligible (np.ndarray or None): Boolean mask of rows that may be paired.
+    """
+    rows = np.flatnonzero(eligible) if eligible is not None else np.arange(len(signatures))
+    rows_per_band = signatures.shape[1] // bands
+    pairs = set()
+
+    for band in range(bands):
+        band_values = signatures[rows, band * rows_per_band:(band + 1) * rows_per_band]
+
+        # Rows with an identical band fall into the same bucket
+        _, bucket, bucket_sizes = np.unique(band_values, axis=0, return_inverse=True, return_counts=True)
+        bucket = bucket.ravel()
+        shared = bucket_sizes[bucket] > 1
+        for members in pd.Series(rows[shared]).groupby(bucket[shared]).agg(list):
+            for position, i in enumerate(members):
+                for j in members[position + 1:]:
+                    pairs.add((min(i, j), max(i, j)))
+
+    return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+
+def duplicate_groups(texts, threshold=SIMILARITY_THRESHOLD, min_shingles=MIN_SHINGLES, **signature_kwargs):
+    """
+    Groups near-duplicate texts.
+
+    Returns:
+        np.ndarray with one group id per text; texts without any duplicate get their own group.
+    """
+    signatures, n_shingles = minhash_signatures(texts, **signature_kwargs)
+    pairs = candidate_pairs(signatures, eligible=n_shingles >= min_shingles)
+
+    # Keep candidates whose estimated Jaccard similarity (share of equal signature values) passes the threshold
+    if len(pairs):
+        similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        pairs = pairs[similarity >= threshold]
+
+    # Union-find over the confirmed pairs
+    parent = np.arange(len(signatures))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return np.array([find(i) for i in range(len(signatures))])
+
+
+def drop_near_duplicates(transcript_df, text_column='Transcript', threshold=SIMILARITY_THRESHOLD):
+    """
+    Keeps one copy of every group of near-duplicate transcripts.
+
+    The kept copy is the corrected transcript if there is one, then the longest text, then the longest
+    'Event Type' (the old heuristic), then the latest date.
+
+    Returns:
+        deduped_df (pd.DataFrame): transcript_df without the dropped copies (original order).
+        duplicates_df (pd.DataFrame): Every transcript in a group of two or more, with 'Duplicate Group'
+                                      and 'Kept' columns, for review.
+    """
+    transcript_df = transcript_df.reset_index(drop=True)
+    groups = duplicate_groups(transcript_df[text_column].fillna('').to_list(), threshold)
+
+    ranking = pd.DataFrame({
+        'Duplicate Group': groups,
+        'Corrected': transcript_df['Event Type'].str.lower().str.contains('correct', na=False),
+        'Text Length': transcript_df[text_column].str.len().fillna(0),
+        'Event Type Length': transcript_df['Event Type'].str.len().fillna(0),
+        'Date': transcript_df['Date'],
+    })
+    best = (ranking.sort_values(['Corrected', 'Text Length', 'Event Type Length', 'Date'],
+                                ascending=False, kind='stable')
+            .drop_duplicates('Duplicate Group'))
+    kept = transcript_df.index.isin(best.index)
+
+    group_sizes = pd.Series(groups).map(pd.Series(groups).value_counts())
+    in_group = (group_sizes > 1).to_numpy()
+    duplicates_df = transcript_df.loc[in_group].drop(columns=[text_column]).assign(
+        **{'Duplicate Group': groups[in_group], 'Kept': kept[in_group]}
+    ).sort_values(['Duplicate Group', 'Kept'], ascending=[True, False])
+
+    return transcript_df.loc[kept], duplicates_df
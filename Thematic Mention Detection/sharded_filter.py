@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded, multi-process execution of the keyword filter.
+"""
+
+# Background: Sharded, multi-process execution of the keyword filter. Transcripts are partitioned by ticker
+# into shards, and every shard is cut into small batch files. A process pool then runs splitting, matching and
+# excerpt building batch by batch, writing each batch's excerpts straight to its own output file. A worker
+# only ever holds one batch in memory, and workers share nothing, so throughput scales with the core count.
+
+# How to Use:
+# - From 01_Keyword_Filter.py: set use_sharded_execution = True (calls run_sharded_filter below).
+# - Standalone, after the inputs were written:  python sharded_filter.py "<work dir>" --workers 8
+
+# Work directory layout:
+#   keywords.json                               keyword_dict and settings used for matching
+#   input/shard-000-batch-0000.parquet          transcripts of one batch of tickers
+#   output/shard-000-batch-0000.parquet         excerpts of that batch (same columns as the single-process run,
+#                                               including the keyword-level hit arrays)
+#   stats/shard-000-batch-0000.parquet          length and theme counts of each transcript of that batch
+
+# Note: the pool is started from this module's __main__ block in a separate Python process. On Windows,
+# worker processes re-import the launching script, and the filter script has no __main__ guard.
+
+
+#Import Libraries
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import argparse
+import subprocess
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mention_filter import (GROUP_COLUMNS, MAX_SENT_LENGTH, QA_START_COLUMN, split_transcripts, match_keywords,
+                            compact_counts, section_counts, transcript_stats, select_context_sentences,
+                            build_excerpts)
+
+# Upper bound on the number of transcripts in one batch file (the unit of work and of worker memory)
+MAX_TRANSCRIPTS_PER_BATCH = 500
+
+
+# -------------------------------
+# Partitioning
+# -------------------------------
+
+def assign_shards(transcript_df, n_shards):
+    """
+    Assigns every ticker to a shard, balancing shards by total transcript length.
+
+    Tickers are placed largest first onto the currently lightest shard, so one very talkative company
+    does not leave the other workers idle.
+
+    Returns:
+        dict of ticker -> shard number.
+    """
+    ticker_sizes = transcript_df['Transcript'].str.len().groupby(transcript_df['Ticker']).sum()
+    ticker_sizes = ticker_sizes.sort_values(ascending=False, kind='stable')
+
+    shard_load = [0] * n_shards
+    assignment = {}
+    for ticker, size in ticker_sizes.items():
+        shard = min(range(n_shards), key=lambda s: (shard_load[s], s))
+        assignment[ticker] = shard
+        shard_load[shard] += size
+    return assignment
+
+
+def write_shard_inputs(transcript_df, work_dir, n_shards, max_transcripts_per_batch=MAX_TRANSCRIPTS_PER_BATCH):
+    """
+    Partitions transcripts by ticker into shards and writes each shard as batch files.
+
+    A ticker's transcripts always land in the same batch, so excerpts never need merging across files.
+
+    Returns:
+        list of written input file paths.
+    """
+    input_dir = os.path.join(work_dir, 'input')
+    # Start from empty input/output folders so files of an earlier run are never picked up
+    for folder in ('input', 'output', 'stats'):
+        shutil.rmtree(os.path.join(work_dir, folder), ignore_errors=True)
+    os.makedirs(input_dir)
+
+    assignment = assign_shards(transcript_df, n_shards)
+    shard_of_row = transcript_df['Ticker'].map(assignment)
+
+    paths = []
+    for shard, shard_df in transcript_df.groupby(shard_of_row, sort=True):
+        batch, batch_rows = [], 0
+        batch_number = 0
+        for _, ticker_df in shard_df.groupby('Ticker', sort=True):
+            if batch and batch_rows + len(ticker_df) > max_transcripts_per_batch:
+                paths.append(_write_batch(batch, input_dir, shard, batch_number))
+                batch, batch_rows = [], 0
+                batch_number += 1
+            batch.append(ticker_df)
+            batch_rows += len(ticker_df)
+        if batch:
+            paths.append(_write_batch(batch, input_dir, shard, batch_number))
+
+    return paths
+
+
+def _write_batch(frames, input_dir, shard, batch_number):
+    path = os.path.join(input_dir, f'shard-{shard:03d}-batch-{batch_number:04d}.parquet')
+    pd.concat(frames).to_parquet(path, index=False)
+    return path
+
+
+# -------------------------------
+# Worker
+# -------------------------------
+
+def process_batch(input_path, output_path, stats_path, keyword_dict, max_sent_length=MAX_SENT_LENGTH, compact=True,
+                  normalized=False):
+    """
+    Runs splitting, keyword counting, context selection and excerpt building on one batch file.
+
+    The excerpts are written to output_path, the transcript statistics to stats_path, and only a small
+    summary is returned to the parent process.
+    """
+    start_time = time.time()
+    transcript_df = pd.read_parquet(input_path)
+
+    sentence_df = split_transcripts(transcript_df, compact=compact)
+    keyword_counts_df, hits_df = match_keywords(sentence_df, keyword_dict, show_progress=False,
+                                               normalized=normalized)
+    if compact:
+        keyword_counts_df = compact_counts(keyword_counts_df)
+    keyword_count_columns = keyword_counts_df.columns.to_list()
+    section_df = section_counts(sentence_df, keyword_counts_df, hits_df)
+    if compact:
+        section_df = compact_counts(section_df)
+    transcript_stats(sentence_df, keyword_counts_df, section_df).to_parquet(stats_path, index=False)
+    sentence_df = pd.concat([sentence_df, keyword_counts_df, section_df], axis=1)
+
+    transcripts_chunks = select_context_sentences(sentence_df, keyword_count_columns)
+    excerpts = build_excerpts(transcripts_chunks, keyword_count_columns, GROUP_COLUMNS, max_sent_length, hits=hits_df,
+                              extra_count_columns=section_df.columns.to_list())
+    excerpts.to_parquet(output_path, index=False)
+
+    return {
+        'input': os.path.basename(input_path),
+        'transcripts': len(transcript_df),
+        'sentences': len(sentence_df),
+        'excerpts': len(excerpts),
+        'seconds': time.time() - start_time,
+    }
+
+
+def run_shards(work_dir, n_workers):
+    """
+    Processes every input batch file of a work directory on a process pool.
+
+    Returns:
+        pd.DataFrame with one summary row per batch.
+    """
+    with open(os.path.join(work_dir, 'keywords.json'), encoding='utf-8') as f:
+        settings = json.load(f)
+
+    output_dir = os.path.join(work_dir, 'output')
+    stats_dir = os.path.join(work_dir, 'stats')
+    for folder in (output_dir, stats_dir):
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+    input_paths = sorted(glob.glob(os.path.join(work_dir, 'input', '*.parquet')))
+    summaries = []
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(process_batch, path, os.path.join(output_dir, os.path.basename(path)),
+                            os.path.join(stats_dir, os.path.basename(path)), settings['keyword_dict'], settings['max_sent_length'], settings['compact'],
+                            settings.get('normalized', False))
+            for path in input_paths
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc='Shard batches'):
+            summaries.append(future.result())
+
+    return pd.DataFrame(summaries).sort_values('input').reset_index(drop=True)
+
+
+# -------------------------------
+# Entry Point for 01_Keyword_Filter.py
+# -------------------------------
+
+def run_sharded_filter(transcript_df, keyword_dict, work_dir, n_workers=None, max_sent_length=MAX_SENT_LENGTH,
+                       max_transcripts_per_batch=MAX_TRANSCRIPTS_PER_BATCH, compact=True, normalized=False):
+    """
+    Runs the keyword filter over transcript_df in a sharded process pool.
+
+    Parameters:
+        transcript_df (pd.DataFrame): Deduplicated transcripts with GROUP_COLUMNS, 'Transcript' and 'QA Start'.
+        keyword_dict (dict): Theme variable name -> keyword list, as built in 01_Keyword_Filter.py.
+        work_dir (str): Folder for the shard input and output files.
+        n_workers (int or None): Worker processes (defaults to the number of cores).
+        compact (bool): Use compact dtypes inside the workers (see mention_filter.split_transcripts).
+        normalized (bool): Match on normalized tokens instead of exact regexes (see token_matcher.py).
+
+    Returns:
+        excerpt_paths (list): Output file paths, one per batch, each holding that batch's excerpts.
+        stats_paths (list): Matching files with the statistics of every transcript of the batch (see
+                            mention_filter.transcript_stats).
+    """
+    n_workers = n_workers or os.cpu_count()
+    os.makedirs(work_dir, exist_ok=True)
+
+    input_paths = write_shard_inputs(transcript_df[GROUP_COLUMNS + ['Transcript', QA_START_COLUMN]], work_dir, n_workers,
+                                     max_transcripts_per_batch)
+    if not input_paths:
+        return [], []
+    with open(os.path.join(work_dir, 'keywords.json'), 'w', encoding='utf-8') as f:
+        json.dump({'keyword_dict': keyword_dict, 'max_sent_length': max_sent_length, 'compact': compact,
+                   'normalized': normalized}, f)
+
+    print(f"Sharded filter: {len(transcript_df):,} transcripts in {len(input_paths):,} batches on {n_workers} workers.")
+    subprocess.run([sys.executable, os.path.abspath(__file__), work_dir, '--workers', str(n_workers)], check=True)
+
+    return (sorted(glob.glob(os.path.join(work_dir, 'output', '*.parquet'))),
+            sorted(glob.glob(os.path.join(work_dir, 'stats', '*.parquet'))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the sharded keyword filter over a prepared work directory.')
+    parser.add_argument('work_dir', help='Folder containing keywords.json and input/*.parquet')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    args = parser.parse_args()
+
+    batch_summary = run_shards(args.work_dir, args.workers)
+    total_seconds = batch_summary['seconds'].sum()
+    print(f"Processed {batch_summary['transcripts'].sum():,} transcripts and "
+          f"{batch_summary['sentences'].sum():,} sentences into {batch_summary['excerpts'].sum():,} excerpts "
+          f"({total_seconds:.1f} worker-seconds).")
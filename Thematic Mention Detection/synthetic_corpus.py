@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic transcript corpus for benchmarking and checking the keyword filter.
+"""
+
+# Background: A synthetic transcript corpus for benchmarking and regression-checking the keyword filter without
+# access to the S:\ share. Transcripts look like the scraped ones to the filter: a Management and a Q&A section
+# of sentences with '.', '?' and '!' endings, abbreviations and decimals that must not split sentences
+# ("Acme Inc.", "the U.S.", "3.5 percent"), and theme keywords sprinkled in at a chosen density.
+
+# How to Use:
+# - transcript_df = generate_corpus(n_companies=50, n_quarters=8, words_per_transcript=6000, keyword_dict=keyword_dict)
+# - transcript_df = combine_sections(transcript_df)   # adds 'Transcript' and 'QA Start' as in 01_Keyword_Filter.py
+# - The same arguments and seed always produce the same corpus.
+
+
+#Import Libraries
+import numpy as np
+import pandas as pd
+
+# Filler vocabulary of an earnings call (keywords are injected separately)
+FILLER_WORDS = (
+    'we our the a and of to in for on with this that quarter year revenue growth margin margins demand customers '
+    'customer pricing costs cost volume volumes guidance outlook segment segments operating cash flow capital '
+    'investment investments strong solid softer improved improvement expect expects expected continue continued '
+    'momentum performance results team teams market markets share product products services business businesses '
+    'basis points percent sequential sequentially organic backlog orders order pipeline inventory inventories '
+    'question thanks thank you great good morning everyone analyst call operator next line please comment color '
+    'think believe see seeing remain remains remained progress priorities execution balance sheet leverage'
+).split()
+
+# Tokens that end with a period without ending the sentence (exercise the abbreviation-aware splitter)
+TRICKY_WORDS = ['Acme Inc.', 'the U.S.', 'approx. 3.5', 'e.g. the', 'Dr. Smith', '12.4 percent', 'vs. last year']
+
+SENTENCE_ENDINGS = ['.', '.', '.', '.', '?', '!']
+
+# A few themes in the format of 01_Keyword_Filter.py's keyword_dict, for runs without Thematic Vocab.xlsx.
+# Overlapping keywords ('AI' / 'AI-driven', 'supply chain' / 'supply chains') exercise longest-match behaviour.
+SAMPLE_KEYWORD_DICT = {
+    'ai_keywords': ['AI', 'artificial intelligence', 'machine learning', 'generative AI', 'AI-driven', 'copilot'],
+    'tariffs_keywords': ['Tariffs', 'tariff', 'trade war', 'import duties', 'Section 301'],
+    'supply_chains_keywords': ['Supply Chains', 'supply chain', 'logistics', 'freight', 'port congestion'],
+    'inflation_keywords': ['Inflation', 'price increases', 'input costs', 'wage inflation', 'CPI'],
+}
+
+
+def _keyword_variants(keyword_dict):
+    """Every keyword of every theme, in the casings a transcript may use."""
+    keywords = [keyword for keywords in keyword_dict.values() for keyword in keywords]
+    return [variant for keyword in keywords for variant in (keyword, keyword.lower(), keyword.title())]
+
+
+def _section_text(rng, n_words, keywords, keyword_density, sentence_length):
+    """Builds one section of roughly n_words words."""
+    # Object arrays: a fixed-width string array would cut injected keywords to the longest filler word
+    words = rng.choice(np.array(FILLER_WORDS, dtype=object), size=n_words)
+    keyword_slots = rng.random(n_words) < keyword_density
+    if keywords and keyword_slots.any():
+        words[keyword_slots] = rng.choice(np.array(keywords, dtype=object), size=keyword_slots.sum())
+    tricky_slots = rng.random(n_words) < 0.01
+    words[tricky_slots] = rng.choice(np.array(TRICKY_WORDS, dtype=object), size=tricky_slots.sum())
+
+    sentences = []
+    position = 0
+    while position < n_words:
+        length = int(rng.integers(sentence_length[0], sentence_length[1] + 1))
+        sentence = ' '.join(words[position:position + length])
+        sentences.append(sentence[:1].upper() + sentence[1:] + rng.choice(SENTENCE_ENDINGS))
+        position += length
+    return ' '.join(sentences)
+
+
+def generate_corpus(n_companies=10, n_quarters=4, words_per_transcript=5000, keyword_density=0.002,
+                    keyword_dict=None, qa_share=0.5, sentence_length=(8, 25), seed=0):
+    """
+    Generates one earnings call transcript per company and quarter.
+
+    Parameters:
+        n_companies (int): Number of companies (tickers 'C00001', ...).
+        n_quarters (int): Number of consecutive quarters per company, starting in 2021.
+        words_per_transcript (int): Words per transcript (Management and Q&A together).
+        keyword_density (float): Share of word slots replaced by a keyword from keyword_dict.
+        keyword_dict (dict or None): Theme variable name -> keyword list (as built in 01_Keyword_Filter.py).
+        qa_share (float): Share of the words in the Q&A section.
+        sentence_length (tuple): Minimum and maximum words per sentence.
+        seed (int): Random seed.
+
+    Returns:
+        pd.DataFrame with the columns of the transcript workbooks: 'Ticker', 'Company Name', 'Event Type',
+        'Date', 'Transcript - Mgmt', 'Transcript - QA'.
+    """
+    rng = np.random.default_rng(seed)
+    keywords = _keyword_variants(keyword_dict or {})
+    qa_words = int(round(words_per_transcript * qa_share))
+
+    rows = []
+    for company in range(n_companies):
+        ticker = f'C{company + 1:05d}'
+        for quarter in range(n_quarters):
+            rows.append({
+                'Ticker': ticker,
+                'Company Name': f'Company {ticker} Inc',
+                'Event Type': f"Q{quarter % 4 + 1} {2021 + quarter // 4} Earnings Call",
+                'Date': pd.Timestamp(2021 + quarter // 4, 3 * (quarter % 4) + 2, 1) + pd.Timedelta(days=int(rng.integers(0, 28))),
+                'Transcript - Mgmt': _section_text(rng, words_per_transcript - qa_words, keywords, keyword_density,
+                                                   sentence_length),
+                'Transcript - QA': _section_text(rng, qa_words, keywords, keyword_density, sentence_length),
+            })
+    return pd.DataFrame(rows)
+
+
+def combine_sections(transcript_df):
+    """Adds the combined 'Transcript' text and the 'QA Start' offset exactly as 01_Keyword_Filter.py does."""
+    transcript_df = transcript_df.copy()
+    transcript_df['Transcript'] = transcript_df['Transcript - Mgmt'].fillna('') + "\n" + transcript_df['Transcript - QA'].fillna('')
+    transcript_df['QA Start'] = transcript_df['Transcript - Mgmt'].fillna('').str.len() + 1
+    return transcript_df[['Ticker', 'Company Name', 'Event Type', 'Date', 'Transcript', 'QA Start']]
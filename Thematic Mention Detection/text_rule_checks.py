@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Regression checks of the text rules in transcript_text.py and mention_filter.py.
+"""
+
+# Background: The light stemmer is tuned by hand, and every fix has a list of words it must join or keep apart.
+# The section split has a known edge case too: a call without prepared remarks must not credit Management with any
+# sentence, word or count. These cases used to run only at the start of 03_Filter_Benchmark.py, after the whole
+# benchmark was set up. This script checks them in a second, without generating or timing a corpus.
+
+# How to Use:
+# - Run the script from this folder (python text_rule_checks.py); it prints every failed case and exits with
+#   status 1 if there is one.
+# - From Python: failures = check_text_rules(keyword_dict)  (an empty list means every case passes; keyword_dict
+#   defaults to the sample vocabulary of synthetic_corpus.py)
+# - Add a case whenever a text rule is fixed.
+
+
+#Import Libraries
+import os
+import sys
+import pandas as pd
+
+# Make the helper modules in this folder importable when run from Spyder or another working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from transcript_text import light_stem
+from mention_filter import split_transcripts, match_keywords, section_counts, transcript_stats
+from synthetic_corpus import SAMPLE_KEYWORD_DICT, combine_sections
+
+# Word pairs light_stem must reduce to the same stem, and pairs it must keep apart (known collisions)
+STEM_MATCHES = [('tariffs', 'tariff'), ('tariffed', 'tariff'), ('automation', 'automating'), ('automated', 'automate'),
+                ('companies', 'company'), ('shipping', 'ship'), ('inflation', 'inflate'), ('supply chains', 'supply chain'),
+                ('pricing', 'price'), ('priced', 'price'), ('prices', 'price'), ('agreed', 'agree'), ('stated', 'state'),
+                ('hiring', 'hire'), ('hired', 'hire'), ('using', 'use'), ('used', 'use'), ('rating', 'rate')]
+STEM_COLLISIONS = [('news', 'new'), ('states', 'station'), ('stations', 'state'), ('station', 'stat'),
+                   ('rating', 'rat'), ('sales', 'sal'), ('series', 'sery'), ('united states', 'unit station')]
+
+# A call without prepared remarks: every sentence, word and hit belongs to the Q&A section
+QA_ONLY_TRANSCRIPT = {'Ticker': 'QAO', 'Company Name': 'Q&A Only Inc', 'Event Type': 'Q4 Earnings Call',
+                      'Date': pd.Timestamp('2024-01-31'), 'Transcript - Mgmt': '',
+                      'Transcript - QA': 'Our AI roadmap is on track. Tariffs remain a risk? We think so.'}
+
+
+def check_stem_rules():
+    """Returns a description of every STEM_MATCHES / STEM_COLLISIONS pair that light_stem gets wrong."""
+    def stems(text):
+        return [light_stem(token) for token in text.split()]
+
+    failures = [f"{a!r} and {b!r} should match" for a, b in STEM_MATCHES if stems(a) != stems(b)]
+    failures += [f"{a!r} and {b!r} should differ" for a, b in STEM_COLLISIONS if stems(a) == stems(b)]
+    return failures
+
+
+def check_qa_only(keyword_dict=SAMPLE_KEYWORD_DICT):
+    """
+    Returns a description of every Management sentence, word or count found in QA_ONLY_TRANSCRIPT, once for the
+    section split by hit offsets and once for the split by sentence counts.
+    """
+    failures = []
+    sentence_df = split_transcripts(combine_sections(pd.DataFrame([QA_ONLY_TRANSCRIPT])))
+    keyword_counts_df, hits_df = match_keywords(sentence_df, keyword_dict, show_progress=False)
+    for mode, hits in (('hits', hits_df), ('sentence counts', None)):
+        stats = transcript_stats(sentence_df, keyword_counts_df, section_counts(sentence_df, keyword_counts_df, hits))
+        mgmt_columns = ['Mgmt Sentences', 'Mgmt Words'] + [col for col in stats.columns if col.endswith('_mgmt')]
+        if stats[mgmt_columns].to_numpy().any() or not stats['QA Sentences'].iloc[0]:
+            failures.append(f"Q&A-only transcript credits Management ({mode}): "
+                            f"{stats[mgmt_columns].iloc[0][lambda row: row > 0].to_dict()}")
+    return failures
+
+
+def check_text_rules(keyword_dict=SAMPLE_KEYWORD_DICT):
+    """Runs every text rule check; returns the descriptions of the failed cases."""
+    return check_stem_rules() + check_qa_only(keyword_dict)
+
+
+if __name__ == '__main__':
+    text_rule_failures = check_text_rules()
+    for failure in text_rule_failures:
+        print(f"❌ {failure}")
+    print(f"❌ Text rules: {len(text_rule_failures)} failed cases" if text_rule_failures
+          else "✅ Text rules: all cases pass")
+    sys.exit(1 if text_rule_failures else 0)
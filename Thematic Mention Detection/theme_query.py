@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Theme query language (AND / OR / NOT / NEAR / phrases) evaluated over the transcript index.
+"""
+
+# Background: Flat keyword lists cannot express "tariffs within 5 words of China" or "AI but not
+# Adobe Illustrator", so they produce false positives for narrow themes. This module defines a small
+# query language for themes and evaluates it over the positional postings in transcript_index.py.
+
+# Query Syntax (operators are UPPERCASE, everything else is a search term):
+#   tariff                      single word (case and punctuation are ignored)
+#   "supply chain"              phrase, the words must appear consecutively
+#   A AND B   /   A B           both in the same sentence (adjacent terms are AND-ed)
+#   A OR B                      either in the sentence
+#   A AND NOT B                 A in a sentence that does not contain B
+#   A NEAR/5 B                  A within 5 words of B, in the same sentence
+#   ( ... )                     grouping
+# Precedence from loosest to tightest: OR, AND, NOT, NEAR/k.
+
+# Counting: every query is evaluated per sentence. The count of a sentence is the number of distinct
+# places where a positive term of the query matched (for NEAR, the occurrences of the left-hand term).
+# Overlapping OR alternatives are resolved like the regex alternation: the longest phrase at the leftmost start
+# wins, so "generative AI" OR AI counts "generative AI" once, not also as "AI".
+
+# Example:
+#   ("tariff" OR tariffs) NEAR/5 (China OR Chinese) AND NOT "trade show"
+
+
+#Import Libraries
+import re
+import numpy as np
+import pandas as pd
+
+from transcript_text import word_tokens
+from transcript_index import POSITION_BITS, METADATA_COLUMNS, leftmost_longest
+
+# Lexer: parentheses, quoted phrases, NEAR/k, and bare terms
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|(NEAR/\d+)|([^\s()"]+))')
+OPERATORS = {'AND', 'OR', 'NOT'}
+
+
+class QuerySyntaxError(ValueError):
+    """Raised when a theme query cannot be parsed."""
+
+
+# -------------------------------
+# Parsing
+# -------------------------------
+
+def tokenize_query(query):
+    """Splits a query string into ('LPAREN' | 'RPAREN' | 'PHRASE' | 'NEAR' | 'OP' | 'TERM', value) tokens."""
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = TOKEN_PATTERN.match(query, position)
+        if match is None or match.end() == position:
+            raise QuerySyntaxError(f"Unexpected character at position {position} in query: {query!r}")
+        lparen, rparen, phrase, near, term = match.groups()
+        if lparen:
+            tokens.append(('LPAREN', lparen))
+        elif rparen:
+            tokens.append(('RPAREN', rparen))
+        elif phrase is not None:
+            tokens.append(('PHRASE', phrase))
+        elif near:
+            tokens.append(('NEAR', int(near.split('/')[1])))
+        elif term in OPERATORS:
+            tokens.append(('OP', term))
+        else:
+            tokens.append(('TERM', term))
+        position = match.end()
+        while position < len(query) and query[position].isspace():
+            position += 1
+    return tokens
+
+
+def parse_query(query):
+    """
+    Parses a theme query into a nested tuple plan.
+
+    Plan nodes:
+        ('terms', (token, ...))           phrase of normalised word tokens
+        ('or', [child, ...])
+        ('and', [positive, ...], [negative, ...])
+        ('near', left, right, k)
+
+    Raises:
+        QuerySyntaxError: if the query is malformed or uses NOT without a positive term.
+    """
+    tokens = tokenize_query(query)
+    if not tokens:
+        raise QuerySyntaxError("Empty query.")
+
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def advance():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() == ('OP', 'OR'):
+            advance()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parse_and():
+        positives, negatives = [], []
+        while True:
+            kind, value = peek()
+            if kind == 'OP' and value == 'AND':
+                advance()
+                continue
+            if kind is None or kind == 'RPAREN' or (kind == 'OP' and value == 'OR'):
+                break
+            if kind == 'OP' and value == 'NOT':
+                advance()
+                negatives.append(parse_near())
+            else:
+                positives.append(parse_near())
+
+        if not positives and not negatives:
+            raise QuerySyntaxError(f"Expected a term, phrase or '(' in query: {query!r}")
+        if not positives:
+            raise QuerySyntaxError(f"NOT needs at least one positive term alongside it: {query!r}")
+        if len(positives) == 1 and not negatives:
+            return positives[0]
+        return ('and', positives, negatives)
+
+    def parse_near():
+        node = parse_primary()
+        while peek()[0] == 'NEAR':
+            _, distance = advance()
+            node = ('near', node, parse_primary(), distance)
+        return node
+
+    def parse_primary():
+        kind, value = advance() if position < len(tokens) else (None, None)
+        if kind == 'LPAREN':
+            node = parse_or()
+            if peek()[0] != 'RPAREN':
+                raise QuerySyntaxError(f"Missing closing parenthesis in query: {query!r}")
+            advance()
+            return node
+        if kind in ('TERM', 'PHRASE'):
+            words, _ = word_tokens(value)
+            if not words:
+                raise QuerySyntaxError(f"Search term {value!r} contains no words.")
+            return ('terms', tuple(words))
+        raise QuerySyntaxError(f"Expected a term, phrase or '(' but found {value!r} in query: {query!r}")
+
+    plan = parse_or()
+    if position != len(tokens):
+        raise QuerySyntaxError(f"Unexpected {tokens[position][1]!r} in query: {query!r}")
+    return plan
+
+
+def keywords_to_query(keywords):
+    """
+    Turns a flat keyword list (as in Thematic Vocab.xlsx) into an equivalent OR-of-phrases query (nested keywords
+    such as "generative AI" and "AI" count once per hit, as in the regex mode).
+    """
+    return ' OR '.join('"' + keyword.replace('"', ' ') + '"' for keyword in keywords)
+
+
+# -------------------------------
+# Evaluation
+# -------------------------------
+
+def _estimate(index, node):
+    """Cheap upper bound on the number of hits of a plan node, used to order AND / NEAR evaluation."""
+    kind = node[0]
+    if kind == 'terms':
+        return min(len(index.postings(token)) for token in node[1])
+    if kind == 'or':
+        return sum(_estimate(index, child) for child in node[1])
+    if kind == 'and':
+        return min(_estimate(index, child) for child in node[1])
+    if kind == 'near':
+        return min(_estimate(index, node[1]), _estimate(index, node[2]))
+    raise ValueError(f"Unknown plan node: {kind}")
+
+
+def _restrict(keys, sentences, lengths=None):
+    """
+    Keeps only the keys that fall in the given sorted array of sentence ids (with lengths: the
+    (keys, lengths) pair).
+    """
+    inside = slice(None) if sentences is None else np.isin(keys >> POSITION_BITS, sentences)
+    return keys[inside] if lengths is None else (keys[inside], lengths[inside])
+
+
+def _evaluate(index, node, sentences=None):
+    """evaluate_plan, also returning the length in tokens of each hit (used to resolve overlapping hits)."""
+    kind = node[0]
+
+    if kind == 'terms':
+        # Start from the rarest word of the phrase so the intersections stay small
+        words = node[1]
+        anchor = min(range(len(words)), key=lambda i: len(index.postings(words[i])))
+        keys = _restrict(index.postings(words[anchor]), sentences) - anchor
+        for i, word in enumerate(words):
+            if i != anchor and len(keys):
+                keys = keys[np.isin(keys + i, index.postings(word), assume_unique=True)]
+        return keys, np.full(len(keys), len(words), dtype=np.int64)
+
+    if kind == 'or':
+        parts = [_evaluate(index, child, sentences) for child in node[1]]
+        return leftmost_longest(np.concatenate([keys for keys, _ in parts]),
+                                np.concatenate([lengths for _, lengths in parts]))
+
+    if kind == 'and':
+        positives, negatives = node[1], node[2]
+
+        # Evaluate the most selective operand first and narrow the candidate sentences as we go
+        parts = []
+        for child in sorted(positives, key=lambda child: _estimate(index, child)):
+            keys, lengths = _evaluate(index, child, sentences)
+            sentences = np.unique(keys >> POSITION_BITS)
+            parts = [_restrict(part_keys, sentences, part_lengths) for part_keys, part_lengths in parts] + [(keys, lengths)]
+            if not len(sentences):
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        for child in negatives:
+            excluded = np.unique(_evaluate(index, child, sentences)[0] >> POSITION_BITS)
+            sentences = np.setdiff1d(sentences, excluded, assume_unique=True)
+
+        parts = [_restrict(keys, sentences, lengths) for keys, lengths in parts]
+        keys, first = np.unique(np.concatenate([keys for keys, _ in parts]), return_index=True)
+        return keys, np.concatenate([lengths for _, lengths in parts])[first]
+
+    if kind == 'near':
+        left_node, right_node, distance = node[1], node[2], node[3]
+        if _estimate(index, right_node) < _estimate(index, left_node):
+            right, _ = _evaluate(index, right_node, sentences)
+            left, left_lengths = _evaluate(index, left_node, np.unique(right >> POSITION_BITS))
+        else:
+            left, left_lengths = _evaluate(index, left_node, sentences)
+            right, _ = _evaluate(index, right_node, np.unique(left >> POSITION_BITS))
+
+        # Keys of the same sentence are contiguous, so a window of +/- distance stays inside the sentence
+        lower = np.searchsorted(right, left - distance, side='left')
+        upper = np.searchsorted(right, left + distance, side='right')
+        near = upper > lower
+        return left[near], left_lengths[near]
+
+    raise ValueError(f"Unknown plan node: {kind}")
+
+
+def evaluate_plan(index, node, sentences=None):
+    """
+    Evaluates a parsed plan against a TranscriptIndex.
+
+    Parameters:
+        index (TranscriptIndex): The corpus index.
+        node (tuple): Plan produced by parse_query.
+        sentences (np.ndarray or None): Optional candidate sentence ids; hits outside them are skipped early.
+
+    Returns:
+        np.ndarray of sorted, unique posting keys where the query matched.
+    """
+    return _evaluate(index, node, sentences)[0]
+
+
+def run_query(index, query, context=0):
+    """
+    Counts and excerpts every sentence matching a theme query.
+
+    Returns:
+        pd.DataFrame with one row per matching sentence (see TranscriptIndex.hits_to_frame).
+    """
+    return index.hits_to_frame(evaluate_plan(index, parse_query(query)), context=context)
+
+
+def count_theme_queries(index, theme_queries):
+    """
+    Produces per-sentence `*_keyword_count` columns for a set of theme queries.
+
+    Parameters:
+        index (TranscriptIndex): The corpus index.
+        theme_queries (dict): Count column name (e.g. 'ai_keyword_count') -> query string.
+
+    Returns:
+        pd.DataFrame keyed by Ticker, Company Name, Event Type, Date and Sentence (position within the
+        transcript), with one count column per theme. Sentences without any hit are omitted.
+    """
+    frames = []
+    for column, query in theme_queries.items():
+        hits = index.hits_to_frame(evaluate_plan(index, parse_query(query)), count_column=column)
+        frames.append(hits.drop(columns=['Excerpt']).set_index(METADATA_COLUMNS + ['Sentence']))
+
+    if not frames:
+        return pd.DataFrame(columns=METADATA_COLUMNS + ['Sentence'])
+
+    counts = pd.concat(frames, axis=1).fillna(0).astype(np.int64).sort_index()
+    return counts.reset_index()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Normalized-token keyword matching mode for the keyword filter.
+"""
+
+# Background: Normalized-token matching mode for 01_Keyword_Filter.py. The regex mode matches keywords exactly
+# (\bAI\b), so "AI-driven" is found but "tariffs" does not match "tariff" and "automating" does not match
+# "automation" unless every variant is listed in Thematic Vocab.xlsx, which bloats the alternation regex.
+# Here both the keywords and the sentences are turned into normalized tokens (lowercased, split at hyphens
+# and punctuation, lightly stemmed, see transcript_text.normalized_tokens), and keyword phrases are matched
+# token by token. Keyword lists can stay short, and recall goes up.
+
+# Method:
+#   1. Every keyword becomes a tuple of normalized tokens ("Supply Chains" -> ('supply', 'chain')).
+#   2. The phrases of all themes are filed under their first token.
+#   3. Each sentence is tokenized once; at every token only the phrases starting with that token are compared,
+#      so all themes are matched in one linear pass over the token stream.
+#   Like the regex alternation, hits of one theme never overlap and the longest phrase at a position wins.
+
+# How to Use:
+# - From 01_Keyword_Filter.py: set use_normalized_matching = True.
+# - matcher = NormalizedMatcher(keyword_dict); counts, hits = matcher.match_texts(sentence_texts)
+
+
+#Import Libraries
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from transcript_text import NORMALIZATION_VERSION, normalized_tokens
+
+# Matching mode name used in the filter cache keys (changes whenever the normalization rule changes)
+NORMALIZED_MODE = f'normalized-v{NORMALIZATION_VERSION}'
+
+
+class NormalizedMatcher:
+    """
+    Matches the keyword lists of several themes against normalized token streams.
+
+    Parameters:
+        keyword_dict (dict): Theme variable name -> keyword list (as built in 01_Keyword_Filter.py).
+    """
+
+    def __init__(self, keyword_dict):
+        self.n_themes = len(keyword_dict)
+        self.phrases = {}
+
+        for theme_id, keywords in enumerate(keyword_dict.values()):
+            seen = set()
+            for local_id, keyword in enumerate(keywords):
+                phrase = tuple(normalized_tokens(keyword)[0])
+                # Keywords without word characters match nothing; variants with the same normalized form
+                # ("tariff", "tariffs") are attributed to the first one in the list
+                if not phrase or phrase in seen:
+                    continue
+                seen.add(phrase)
+                self.phrases.setdefault(phrase[0], []).append((phrase, theme_id, local_id))
+
+        # Longest phrase first, so "machine learning" wins over "machine" at the same position
+        for candidates in self.phrases.values():
+            candidates.sort(key=lambda candidate: -len(candidate[0]))
+
+    def match_text(self, text):
+        """
+        Finds every keyword hit in one text.
+
+        Returns:
+            list of (theme id, keyword position in the theme's list, start, end) with character offsets into text.
+        """
+        tokens, starts, ends = normalized_tokens(text)
+        next_free = [0] * self.n_themes  # per theme, the first token not covered by an earlier hit
+        hits = []
+
+        for position, token in enumerate(tokens):
+            candidates = self.phrases.get(token)
+            if candidates is None:
+                continue
+            for phrase, theme_id, local_id in candidates:
+                if position < next_free[theme_id]:
+                    continue
+                last = position + len(phrase)
+                if len(phrase) == 1 or tuple(tokens[position:last]) == phrase:
+                    hits.append((theme_id, local_id, starts[position], ends[last - 1]))
+                    next_free[theme_id] = last
+
+        return hits
+
+    def match_texts(self, texts, show_progress=False, description='Normalized matching'):
+        """
+        Matches a sequence of texts (e.g. the sentences of sentence_df).
+
+        Returns:
+            counts (np.ndarray): (n_texts, n_themes) hit counts.
+            hits (pd.DataFrame): 'Row' (position in texts), 'Local ID', 'Start', 'End', 'Theme ID', the same
+                                 layout as mention_filter.match_theme plus the theme.
+        """
+        counts = np.zeros((len(texts), self.n_themes), dtype=np.int64)
+        rows, theme_ids, local_ids, starts, ends = [], [], [], [], []
+
+        for row, text in enumerate(tqdm(texts, desc=description, disable=not show_progress)):
+            if not isinstance(text, str):
+                continue
+            for theme_id, local_id, start, end in self.match_text(text):
+                counts[row, theme_id] += 1
+                rows.append(row)
+                theme_ids.append(theme_id)
+                local_ids.append(local_id)
+                starts.append(start)
+                ends.append(end)
+
+        hits = pd.DataFrame({
+            'Row': np.asarray(rows, dtype=np.uint32),
+            'Local ID': np.asarray(local_ids, dtype=np.uint32),
+            'Start': np.asarray(starts, dtype=np.uint32),
+            'End': np.asarray(ends, dtype=np.uint32),
+            'Theme ID': np.asarray(theme_ids, dtype=np.uint16),
+        })
+        return counts, hits
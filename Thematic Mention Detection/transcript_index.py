@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Persisted positional inverted index over the transcript corpus.
+"""
+
+# Background: A persisted positional inverted index over the transcript corpus.
+# Every sentence of every transcript gets a global sentence id, and every normalised word token
+# gets a posting list of (sentence id, token position) keys. Keyword sets and phrases are then
+# answered with array intersections instead of re-running regexes over the raw Excel files.
+
+# How to Use:
+# - index = TranscriptIndex.load(index_file_path)   (returns an empty index if the file is missing)
+# - index.update(transcript_df)                      (only new or changed transcripts are tokenized)
+# - index.save(index_file_path)
+# - hits = index.search(['machine learning', 'AI'], context=1)
+
+# Storage layout:
+# - documents: one row per transcript (metadata, text hash, sentence range, full text)
+# - sentence_doc / sentence_bounds: doc id and [start, end) character offsets of every sentence
+# - vocabulary / offsets / keys: postings in CSR form, keys[offsets[t]:offsets[t + 1]] are the
+#   sorted keys of token id t, where key = (sentence id << POSITION_BITS) | position in sentence
+
+
+#Import Libraries
+import os
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+
+from transcript_text import SENTENCE_RULE_VERSION, sentence_offsets, word_tokens
+
+# Bump when the tokenization or storage layout changes so stale index files are rebuilt
+INDEX_VERSION = 1
+
+# Token positions within a sentence are packed into the low bits of each posting key
+POSITION_BITS = 20
+
+# Columns identifying a transcript, and the metadata carried into every search result
+DOCUMENT_KEY = ['Ticker', 'Date', 'Event Type']
+METADATA_COLUMNS = ['Ticker', 'Company Name', 'Event Type', 'Date']
+
+
+def leftmost_longest(keys, lengths):
+    """
+    Resolves overlapping phrase hits the way the regex alternation does: scanning each sentence left to right,
+    the longest phrase at the leftmost start wins and hits starting inside it are dropped ("generative AI"
+    counts once, not also as "AI").
+
+    Parameters:
+        keys (np.ndarray): Start keys of the hits, in any order (duplicates allowed).
+        lengths (np.ndarray): Phrase length in tokens of each hit.
+
+    Returns:
+        (keys, lengths) of the kept hits, sorted by key.
+    """
+    keys, lengths = np.asarray(keys, dtype=np.int64), np.asarray(lengths, dtype=np.int64)
+    order = np.lexsort((-lengths, keys))
+    keys, lengths = keys[order], lengths[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    keys, lengths = keys[first], lengths[first]
+    if len(keys) < 2:
+        return keys, lengths
+
+    # Only runs of hits that overlap need the left-to-right scan; everything else is kept as is.
+    # A phrase never runs past its sentence, so runs never cross sentences.
+    ends = keys + lengths
+    starts_run = np.ones(len(keys), dtype=bool)
+    starts_run[1:] = keys[1:] >= np.maximum.accumulate(ends)[:-1]
+    run = np.cumsum(starts_run)
+    keep = np.ones(len(keys), dtype=bool)
+    next_free = -1
+    for i in np.flatnonzero(np.isin(run, run[~starts_run])):
+        if starts_run[i]:
+            next_free = ends[i]
+        elif keys[i] < next_free:
+            keep[i] = False
+        else:
+            next_free = ends[i]
+    return keys[keep], lengths[keep]
+
+
+def text_hash(text):
+    """Returns a stable hash of a transcript's text, used to detect edited transcripts."""
+    text = text if isinstance(text, str) else ''
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class TranscriptIndex:
+    """
+    Positional inverted index over transcript sentences.
+
+    Attributes:
+        documents (pd.DataFrame): One row per indexed transcript, indexed by doc id.
+        sentence_doc (np.ndarray): Doc id of every global sentence id.
+        sentence_bounds (np.ndarray): [start, end) character offsets of every sentence.
+        vocabulary (dict): Normalised token -> token id.
+        offsets (np.ndarray): CSR offsets into `keys` for each token id.
+        keys (np.ndarray): Posting keys, grouped by token id and sorted within each token.
+    """
+
+    def __init__(self):
+        self.version = INDEX_VERSION
+        self.sentence_rule = SENTENCE_RULE_VERSION
+        self.documents = pd.DataFrame(
+            columns=METADATA_COLUMNS + ['text_hash', 'first_sentence', 'n_sentences', 'active', 'Transcript']
+        )
+        self.sentence_doc = np.empty(0, dtype=np.int64)
+        self.sentence_bounds = np.empty((0, 2), dtype=np.int64)
+        self.vocabulary = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.keys = np.empty(0, dtype=np.int64)
+
+    # -------------------------------
+    # Persistence
+    # -------------------------------
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index from disk.
+
+        Returns an empty index if the file does not exist or was written by an older
+        index version or sentence rule, so the next `update` rebuilds it from scratch.
+        """
+        index = cls()
+        if not os.path.exists(path):
+            return index
+
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+
+        if state.get('version') != INDEX_VERSION or state.get('sentence_rule') != SENTENCE_RULE_VERSION:
+            print(f"Index at {path} was built with an older index version or sentence rule. Rebuilding.")
+            return index
+
+        index.__dict__.update(state)
+        return index
+
+    def save(self, path):
+        """Writes the index to disk in a single pickle file (via a temporary file, so a crash never corrupts it)."""
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    # -------------------------------
+    # Building
+    # -------------------------------
+
+    def update(self, transcript_df, text_column='Transcript', remove_missing=False):
+        """
+        Incrementally indexes a transcript DataFrame.
+
+        Transcripts are matched on (Ticker, Date, Event Type). Unchanged transcripts are skipped,
+        edited transcripts are re-indexed and new transcripts are added.
+
+        Parameters:
+            transcript_df (pd.DataFrame): Transcripts with metadata columns and one text column.
+            text_column (str): Name of the column holding the full transcript text.
+            remove_missing (bool): Drop indexed transcripts that are absent from transcript_df.
+
+        Returns:
+            dict with the number of added, replaced, removed and unchanged transcripts.
+        """
+        incoming = transcript_df.drop_duplicates(subset=DOCUMENT_KEY, keep='last')
+        active_docs = self.documents[self.documents['active'].astype(bool)]
+        existing = {
+            tuple(key): (doc_id, hash_value)
+            for doc_id, key, hash_value in zip(
+                active_docs.index, active_docs[DOCUMENT_KEY].itertuples(index=False), active_docs['text_hash']
+            )
+        }
+
+        new_rows = []
+        retired_doc_ids = []
+        seen_keys = set()
+        unchanged = 0
+
+        for row in incoming[METADATA_COLUMNS + [text_column]].itertuples(index=False):
+            record = dict(zip(METADATA_COLUMNS + [text_column], row))
+            key = tuple(record[col] for col in DOCUMENT_KEY)
+            seen_keys.add(key)
+            hash_value = text_hash(record[text_column])
+
+            if key in existing:
+                doc_id, old_hash = existing[key]
+                if old_hash == hash_value:
+                    unchanged += 1
+                    continue
+                retired_doc_ids.append(doc_id)
+
+            new_rows.append((record, hash_value))
+
+        replaced = len(retired_doc_ids)
+        if remove_missing:
+            retired_doc_ids += [doc_id for key, (doc_id, _) in existing.items() if key not in seen_keys]
+
+        if new_rows or retired_doc_ids:
+            self._apply_changes(new_rows, retired_doc_ids, text_column)
+
+        return {
+            'added': len(new_rows) - replaced,
+            'replaced': replaced,
+            'removed': len(retired_doc_ids) - replaced,
+            'unchanged': unchanged,
+        }
+
+    def _apply_changes(self, new_rows, retired_doc_ids, text_column):
+        """Retires old documents, tokenizes new ones and rebuilds the CSR postings."""
+        if retired_doc_ids:
+            self.documents.loc[retired_doc_ids, 'active'] = False
+            self.documents.loc[retired_doc_ids, 'Transcript'] = ''
+
+        next_doc_id = int(self.documents.index.max()) + 1 if len(self.documents) else 0
+        next_sentence_id = len(self.sentence_doc)
+
+        doc_records = []
+        sentence_doc_parts = [self.sentence_doc]
+        sentence_bound_parts = [self.sentence_bounds]
+        token_id_parts = []
+        key_parts = []
+
+        for offset, (record, hash_value) in enumerate(new_rows):
+            doc_id = next_doc_id + offset
+            text = record[text_column] if isinstance(record[text_column], str) else ''
+
+            # Sentence boundaries and tokens, both as character offsets into the transcript
+            bounds = sentence_offsets(text)
+            tokens, token_starts = word_tokens(text)
+
+            # Map every token to its sentence and to its position within that sentence
+            sentence_idx = np.searchsorted(bounds[:, 0], token_starts, side='right') - 1
+            first_token_in_sentence = np.searchsorted(token_starts, bounds[:, 0], side='left')
+            positions = np.arange(len(tokens)) - first_token_in_sentence[sentence_idx]
+
+            sentence_ids = next_sentence_id + sentence_idx
+            key_parts.append((sentence_ids << POSITION_BITS) | positions)
+            token_id_parts.append(np.fromiter(
+                (self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens),
+                dtype=np.int64, count=len(tokens)
+            ))
+
+            sentence_doc_parts.append(np.full(len(bounds), doc_id, dtype=np.int64))
+            sentence_bound_parts.append(bounds)
+
+            doc_records.append({
+                **{col: record[col] for col in METADATA_COLUMNS},
+                'text_hash': hash_value,
+                'first_sentence': next_sentence_id,
+                'n_sentences': len(bounds),
+                'active': True,
+                'Transcript': text,
+            })
+            next_sentence_id += len(bounds)
+
+        if doc_records:
+            new_documents = pd.DataFrame(doc_records, index=range(next_doc_id, next_doc_id + len(doc_records)))
+            frames = [df for df in (self.documents, new_documents) if len(df)]
+            self.documents = pd.concat(frames)
+
+        self.sentence_doc = np.concatenate(sentence_doc_parts)
+        self.sentence_bounds = np.concatenate(sentence_bound_parts).reshape(-1, 2)
+
+        # Expand the existing CSR postings back into (token id, key) pairs and drop retired sentences
+        old_token_ids = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        old_keys = self.keys
+        if retired_doc_ids:
+            alive = ~np.isin(self.sentence_doc[old_keys >> POSITION_BITS], retired_doc_ids)
+            old_token_ids, old_keys = old_token_ids[alive], old_keys[alive]
+
+        # New sentence ids are always larger than old ones, so a stable sort by token id keeps keys sorted
+        token_ids = np.concatenate([old_token_ids] + token_id_parts)
+        keys = np.concatenate([old_keys] + key_parts)
+        order = np.argsort(token_ids, kind='stable')
+
+        self.keys = keys[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(token_ids, minlength=len(self.vocabulary)))])
+
+    # -------------------------------
+    # Querying
+    # -------------------------------
+
+    def postings(self, token):
+        """Returns the sorted posting keys of one normalised token (empty if unseen)."""
+        token_id = self.vocabulary.get(token)
+        if token_id is None:
+            return np.empty(0, dtype=np.int64)
+        return self.keys[self.offsets[token_id]:self.offsets[token_id + 1]]
+
+    def phrase_keys(self, phrase):
+        """
+        Returns the posting keys where a keyword or multi-word phrase starts.
+
+        The phrase is tokenized exactly like the transcripts, so punctuation and case are ignored.
+        """
+        tokens, _ = word_tokens(phrase)
+        if not tokens:
+            return np.empty(0, dtype=np.int64)
+
+        keys = self.postings(tokens[0])
+        for i, token in enumerate(tokens[1:], start=1):
+            keys = keys[np.isin(keys + i, self.postings(token), assume_unique=True)]
+        return keys
+
+    def keyword_keys(self, keywords):
+        """
+        Returns the sorted start keys of every keyword in a keyword set; overlapping hits (a keyword nested in a
+        longer one) count once, as in the regex alternation.
+        """
+        parts = [self.phrase_keys(keyword) for keyword in keywords]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        lengths = [np.full(len(keys), len(word_tokens(keyword)[0])) for keys, keyword in zip(parts, keywords)]
+        return leftmost_longest(np.concatenate(parts), np.concatenate(lengths))[0]
+
+    def hits_to_frame(self, keys, context=0, count_column='keyword_count'):
+        """
+        Turns posting keys into one row per matching sentence with its count and excerpt.
+
+        Parameters:
+            keys (np.ndarray): Posting keys of the hits (one key per hit).
+            context (int): Number of neighbouring sentences (same transcript) to add to each excerpt.
+            count_column (str): Name of the hit count column.
+
+        Returns:
+            pd.DataFrame with metadata, 'Sentence' (position within the transcript), the count and 'Excerpt'.
+        """
+        sentence_ids, counts = np.unique(keys >> POSITION_BITS, return_counts=True)
+        doc_ids = self.sentence_doc[sentence_ids]
+        docs = self.documents.loc[doc_ids]
+        first_sentence = docs['first_sentence'].to_numpy(dtype=np.int64)
+        last_sentence = first_sentence + docs['n_sentences'].to_numpy(dtype=np.int64) - 1
+
+        # Clip the context window to the transcript the sentence belongs to
+        window_start = np.maximum(sentence_ids - context, first_sentence)
+        window_end = np.minimum(sentence_ids + context, last_sentence)
+        char_start = self.sentence_bounds[window_start, 0]
+        char_end = self.sentence_bounds[window_end, 1]
+
+        excerpts = [
+            text[start:end]
+            for text, start, end in zip(docs['Transcript'], char_start, char_end)
+        ]
+
+        result = docs[METADATA_COLUMNS].reset_index(drop=True)
+        result['Sentence'] = sentence_ids - first_sentence
+        result[count_column] = counts
+        result['Excerpt'] = excerpts
+        return result
+
+    def search(self, keywords, context=0):
+        """
+        Counts and excerpts every sentence in the corpus that matches a keyword set.
+
+        Parameters:
+            keywords (list of str): Keywords or phrases; a sentence matches if any of them occurs.
+            context (int): Number of neighbouring sentences to include in each excerpt.
+
+        Returns:
+            pd.DataFrame with one row per matching sentence.
+        """
+        return self.hits_to_frame(self.keyword_keys(keywords), context=context)
+
+    def summary(self):
+        """Returns a one-line description of the index size."""
+        active = int(self.documents['active'].astype(bool).sum()) if len(self.documents) else 0
+        return (f"{active:,} transcripts | {len(self.sentence_doc):,} sentences | "
+                f"{len(self.vocabulary):,} tokens | {len(self.keys):,} postings")
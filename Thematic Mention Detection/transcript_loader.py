@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Finds the yearly transcript workbooks and loads them through cached Parquet sidecar files.
+"""
+
+# Background: Loading the yearly transcript workbooks (RAW 20xx-Cal TRANSCRIPT.xlsx, several hundred MB each)
+# with pd.read_excel takes minutes per file, and every script listed the years by hand. This loader finds every
+# year file by its name, converts each workbook once into a Parquet sidecar file, and reads the sidecars on later
+# runs. A sidecar is rebuilt only when its workbook changed (modification time / size, confirmed by a content
+# hash), and stale workbooks are converted in parallel worker processes.
+
+# How to Use:
+# - transcript_df = load_transcript_workbooks(transcript_folder, sidecar_dir)
+# - Standalone conversion (what the loader runs in a separate process):
+#     python transcript_loader.py "<sidecar dir>" "<workbook 1>" "<workbook 2>" ... --workers 4
+
+# Sidecar layout (inside sidecar_dir):
+#   RAW 2024-Cal TRANSCRIPT.parquet   the workbook's first sheet
+#   RAW 2024-Cal TRANSCRIPT.json      {'mtime', 'size', 'sha1'} of the workbook the sidecar was built from
+
+# Note: like sharded_filter.py, the process pool is started from this module's __main__ block in a separate
+# Python process, because Windows workers would otherwise re-run the calling script.
+
+
+#Import Libraries
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Yearly transcript workbooks produced by Data Scrape/01_PDF Scraper.py
+TRANSCRIPT_FILE_PATTERN = re.compile(r'^RAW (\d{4})-Cal TRANSCRIPT\.xlsx$', flags=re.IGNORECASE)
+
+
+def discover_transcript_files(folder, first_year=None, last_year=None):
+    """
+    Finds every yearly transcript workbook in a folder.
+
+    Returns:
+        dict of year (int) -> workbook path, sorted by year.
+    """
+    files = {}
+    for file_name in os.listdir(folder):
+        match = TRANSCRIPT_FILE_PATTERN.match(file_name)
+        if match is None:
+            continue
+        year = int(match.group(1))
+        if (first_year is None or year >= first_year) and (last_year is None or year <= last_year):
+            files[year] = os.path.join(folder, file_name)
+    return dict(sorted(files.items()))
+
+
+def file_sha1(path, block_size=1 << 20):
+    """Content hash of a file, read in 1 MB blocks."""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _sidecar_paths(workbook_path, sidecar_dir):
+    stem = os.path.splitext(os.path.basename(workbook_path))[0]
+    return os.path.join(sidecar_dir, stem + '.parquet'), os.path.join(sidecar_dir, stem + '.json')
+
+
+def sidecar_is_current(workbook_path, sidecar_dir):
+    """
+    True if the workbook's sidecar exists and was built from the workbook as it is now.
+
+    The modification time and size are checked first; if they changed, the content hash decides (so a
+    copied or touched but unchanged workbook does not trigger a re-read) and the stored stamp is refreshed.
+    """
+    parquet_path, stamp_path = _sidecar_paths(workbook_path, sidecar_dir)
+    if not (os.path.exists(parquet_path) and os.path.exists(stamp_path)):
+        return False
+
+    with open(stamp_path, encoding='utf-8') as f:
+        stamp = json.load(f)
+    stat = os.stat(workbook_path)
+    if stamp.get('mtime') == stat.st_mtime and stamp.get('size') == stat.st_size:
+        return True
+
+    if stamp.get('sha1') != file_sha1(workbook_path):
+        return False
+    _write_stamp(stamp_path, workbook_path, stamp['sha1'])
+    return True
+
+
+def _write_stamp(stamp_path, workbook_path, sha1):
+    stat = os.stat(workbook_path)
+    with open(stamp_path, 'w', encoding='utf-8') as f:
+        json.dump({'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': sha1}, f)
+
+
+def _parquet_safe(df):
+    """Turns object columns holding mixed types (e.g. numeric tickers among strings) into strings, keeping NaN."""
+    for column in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[column], skipna=True) not in ('string', 'empty'):
+            df[column] = df[column].map(lambda value: value if pd.isna(value) else str(value))
+    return df
+
+
+def convert_workbook(workbook_path, sidecar_dir):
+    """Reads one workbook and writes its Parquet sidecar and stamp. Returns (workbook name, rows, seconds)."""
+    start_time = time.time()
+    parquet_path, stamp_path = _sidecar_paths(workbook_path, sidecar_dir)
+
+    # Hash before reading, so a workbook replaced mid-read is picked up again on the next run
+    sha1 = file_sha1(workbook_path)
+    df = _parquet_safe(pd.read_excel(workbook_path))
+
+    # Write to temporary files first so an interrupted conversion never leaves a half-written sidecar
+    df.to_parquet(parquet_path + '.tmp', index=False)
+    os.replace(parquet_path + '.tmp', parquet_path)
+    _write_stamp(stamp_path, workbook_path, sha1)
+    return os.path.basename(workbook_path), len(df), time.time() - start_time
+
+
+def convert_workbooks(workbook_paths, sidecar_dir, n_workers):
+    """Converts several workbooks on a process pool (pd.read_excel is CPU bound, so threads would not help)."""
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(convert_workbook, path, sidecar_dir) for path in workbook_paths]
+        for future in as_completed(futures):
+            name, rows, seconds = future.result()
+            print(f"Converted {name}: {rows:,} rows in {seconds:.1f} seconds.")
+
+
+def load_transcript_workbooks(folder, sidecar_dir, first_year=None, last_year=None, n_workers=None):
+    """
+    Loads every yearly transcript workbook in a folder, using the Parquet sidecars where they are current.
+
+    Parameters:
+        folder (str): Folder with the RAW 20xx-Cal TRANSCRIPT.xlsx workbooks.
+        sidecar_dir (str): Folder for the Parquet sidecars.
+        first_year, last_year (int or None): Optional range of years to load.
+        n_workers (int or None): Worker processes for converting stale workbooks (default: one per workbook, up to the core count).
+
+    Returns:
+        pd.DataFrame with the rows of every workbook, in year order.
+    """
+    os.makedirs(sidecar_dir, exist_ok=True)
+    workbook_paths = discover_transcript_files(folder, first_year, last_year)
+    if not workbook_paths:
+        raise FileNotFoundError(f"No 'RAW <year>-Cal TRANSCRIPT.xlsx' workbooks found in {folder}")
+
+    stale_paths = [path for path in workbook_paths.values() if not sidecar_is_current(path, sidecar_dir)]
+    print(f"Transcript workbooks: {list(workbook_paths)} | {len(workbook_paths) - len(stale_paths)} cached, "
+          f"{len(stale_paths)} to convert.")
+
+    if len(stale_paths) == 1:
+        convert_workbook(stale_paths[0], sidecar_dir)
+    elif stale_paths:
+        n_workers = n_workers or min(len(stale_paths), os.cpu_count())
+        subprocess.run([sys.executable, os.path.abspath(__file__), sidecar_dir, *stale_paths,
+                        '--workers', str(n_workers)], check=True)
+
+    return pd.concat([pd.read_parquet(_sidecar_paths(path, sidecar_dir)[0]) for path in workbook_paths.values()],
+                     ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert transcript workbooks into Parquet sidecar files.')
+    parser.add_argument('sidecar_dir', help='Folder for the Parquet sidecars')
+    parser.add_argument('workbooks', nargs='+', help='Workbook paths to convert')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    args = parser.parse_args()
+
+    convert_workbooks(args.workbooks, args.sidecar_dir, args.workers)
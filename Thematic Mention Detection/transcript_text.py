@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Shared sentence, word and normalization helpers for the thematic mention pipeline.
+"""
+
+# Background: Shared text helpers for the thematic mention pipeline.
+# Sentences and word tokens are returned as character offsets into the original transcript,
+# so later steps can slice out exactly the text they need without re-splitting it.
+
+# How to Use:
+# - Import from any script in this folder: `from transcript_text import sentence_offsets, word_tokens`
+# - Offsets are [start, end) positions, so `text[start:end]` returns the sentence or token.
+
+
+#Import Libraries
+import re
+from functools import lru_cache
+import numpy as np
+
+# Bump when the sentence rule changes, since cached sentence positions and index files depend on it
+SENTENCE_RULE_VERSION = 3
+
+# Candidate sentence ends: a run of '.', '!' or '?' (plus closing quotes/brackets) followed by whitespace.
+# Decimals such as "3.5" never match.
+SENTENCE_BREAK_PATTERN = re.compile(r'[.!?]+["\')\]]*\s+')
+
+# Lowercase words that end with a period without ending the sentence ("Apple Inc. reported ...")
+ABBREVIATIONS = frozenset([
+    'inc', 'corp', 'co', 'ltd', 'llc', 'plc', 'bros', 'dept', 'govt', 'intl', 'mfg', 'assn',
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'gen', 'sen', 'gov', 'pres',
+    'vs', 'etc', 'approx', 'cf', 'al', 'vol', 'fig',
+    'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+    'mn', 'bn', 'mln', 'bln', 'yr', 'yrs', 'qtr',
+])
+
+# Initials and dotted acronyms ("U.S.", "e.g.", "J. Smith"): letters each followed by a period
+INITIALS_PATTERN = re.compile(r'(?:[A-Za-z]\.)*[A-Za-z]')
+
+# Word tokens are runs of letters/digits; hyphens, apostrophes and other punctuation act as separators
+WORD_PATTERN = re.compile(r'\w+')
+
+# Bump when light_stem changes, since cached counts of the normalized matching mode depend on it
+NORMALIZATION_VERSION = 3
+
+# Shortest stem light_stem leaves after removing a suffix ("news" stays "news", not "new"); the -ion rule needs one
+# letter more ("station" stays apart from "stat")
+MIN_STEM_LENGTH = 4
+
+# Letters that count as vowels, and the last letters after which a short -ing / -ed stem gets no 'e' back
+VOWELS = frozenset('aeiou')
+NO_E_AFTER = frozenset('wxy')
+
+# Words that look inflected but are not inflections of a shorter word, left as they are
+UNSTEMMED_WORDS = frozenset(['news', 'series', 'species', 'means', 'united', 'lens', 'always', 'perhaps', 'thanks'])
+
+
+def _is_false_break(text, match):
+    """True if a candidate sentence end is an abbreviation, an initial or followed by a lowercase word."""
+    # "... the u.s. and ..." / "... approx. five ...": sentences do not start with a lowercase letter
+    if match.end() < len(text) and text[match.end()].islower():
+        return True
+
+    # Only a single bare period can belong to an abbreviation ("?", "!", "..." and '."' end the sentence)
+    if match.group().rstrip() != '.':
+        return False
+
+    # The whitespace-delimited word in front of the period, without opening quotes or brackets
+    word_start = max(text.rfind(' ', 0, match.start()), text.rfind('\n', 0, match.start())) + 1
+    word = text[word_start:match.start()].lstrip('"\'([')
+    return word.lower() in ABBREVIATIONS or INITIALS_PATTERN.fullmatch(word) is not None
+
+
+def sentence_offsets(text):
+    """
+    Splits a transcript into sentences and returns their character offsets.
+
+    A sentence ends at '.', '!' or '?' followed by whitespace, except after common abbreviations
+    ("Inc.", "Corp.", "Mr."), initials and acronyms ("U.S.", "e.g.") or before a lowercase word.
+    Decimals such as "3.5" are never split. The whitespace between sentences belongs to neither, and leading
+    whitespace to no sentence (a transcript with an empty Management section starts with the "\n" separator, and
+    its first sentence must start in the Q&A section).
+
+    This is the only sentence tokenizer of the pipeline: the filter, the excerpts and the transcript
+    index all reuse these offsets.
+
+    Parameters:
+        text (str): Transcript text.
+
+    Returns:
+        np.ndarray of shape (n_sentences, 2) with the [start, end) offset of each sentence.
+    """
+    if not isinstance(text, str) or len(text) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    starts = [len(text) - len(text.lstrip())]
+    ends = []
+    for match in SENTENCE_BREAK_PATTERN.finditer(text):
+        if _is_false_break(text, match):
+            continue
+        ends.append(match.start() + len(match.group().rstrip()))
+        starts.append(match.end())
+    ends.append(len(text))
+
+    # Text ending in punctuation and whitespace leaves an empty last piece, which is not a sentence
+    if starts[-1] == ends[-1] and len(starts) > 1:
+        starts.pop()
+        ends.pop()
+
+    return np.column_stack([starts, ends]).astype(np.int64)
+
+
+def word_tokens(text):
+    """
+    Tokenizes text into lowercase word tokens.
+
+    Parameters:
+        text (str): Any text (a transcript, a sentence or a keyword).
+
+    Returns:
+        tokens (list of str): Lowercased word tokens.
+        starts (np.ndarray): Character offset where each token starts.
+    """
+    if not isinstance(text, str) or len(text) == 0:
+        return [], np.empty(0, dtype=np.int64)
+
+    tokens = []
+    starts = []
+    for match in WORD_PATTERN.finditer(text):
+        tokens.append(match.group().lower())
+        starts.append(match.start())
+
+    return tokens, np.asarray(starts, dtype=np.int64)
+
+
+@lru_cache(maxsize=None)
+def _restores_e(stem):
+    """
+    True for a short -ing / -ed stem that lost a final 'e', in the shape of "hir(ing)", "rat(ed)" or "us(ing)":
+    consonant-vowel-consonant or vowel-consonant, not ending in w, x or y.
+    """
+    if len(stem) not in (2, 3) or stem[-1] in VOWELS or stem[-1] in NO_E_AFTER or stem[-2] not in VOWELS:
+        return False
+    return len(stem) == 2 or stem[-3] not in VOWELS
+
+
+def light_stem(token):
+    """
+    Reduces a lowercase word to a light stem, so plurals and common inflections match their base form:
+    "tariffs" -> "tariff", "companies" -> "company", "automating" / "automated" / "automation" -> "automat",
+    "price" / "pricing" / "priced" -> "pric", "shipping" -> "ship". Short words (3 letters or fewer) and words
+    with digits are left as they are.
+
+    Deliberately much lighter than a full Porter stemmer: it only strips plural endings, -ing / -ed / -ion
+    (after 't') and a final 'e', and only when at least MIN_STEM_LENGTH letters remain, so short words do not
+    collapse into other words ("news" / "new", "sales" / "sal", "rating" / "rat", "station" / "state").
+    Shorter -ing / -ed stems of 'e' words get their 'e' back instead ("hiring" / "hired" -> "hire",
+    "using" / "used" -> "use").
+    """
+    if len(token) <= 3 or not token.isalpha() or token in UNSTEMMED_WORDS:
+        return token
+
+    # Plurals ("uses" -> "use" is the one 3-letter stem allowed)
+    if token.endswith('ies'):
+        if len(token) - 3 >= MIN_STEM_LENGTH:
+            token = token[:-3] + 'y'
+    elif token.endswith('sses'):
+        token = token[:-2]
+    elif token.endswith('s') and not token.endswith(('ss', 'us', 'is')) and \
+            (len(token) - 1 >= MIN_STEM_LENGTH or token.endswith('es') and len(token) == MIN_STEM_LENGTH):
+        token = token[:-1]
+
+    # Inflections ("shipping" -> "shipp" -> "ship"); -ion keeps its 't' ("automation" -> "automat")
+    for suffix, min_length in (('ing', 2), ('ed', 2), ('tion', MIN_STEM_LENGTH + 1)):
+        stem = token[:-len(suffix)] + ('t' if suffix == 'tion' else '')
+        if token.endswith(suffix) and len(stem) >= min_length:
+            if stem[-1] == stem[-2] and stem[-1] not in 'flsz':
+                stem = stem[:-1]
+            elif suffix != 'tion' and _restores_e(stem):
+                return stem + 'e'
+            if len(stem) >= MIN_STEM_LENGTH:
+                return stem
+            break
+
+    # "price" and "pric(ing)", "automate" and "automat(ion)" share a stem
+    if token.endswith('e') and len(token) - 1 >= MIN_STEM_LENGTH:
+        token = token[:-1]
+    return token
+
+
+def normalized_tokens(text):
+    """
+    Tokenizes text into the normalized token stream of the normalized matching mode: lowercased word tokens,
+    split at hyphens and other punctuation ("AI-driven" -> "ai", "driven"), each reduced by light_stem.
+
+    Returns:
+        tokens (list of str): Normalized tokens.
+        starts, ends (list of int): [start, end) character offsets of each token in text.
+    """
+    if not isinstance(text, str) or len(text) == 0:
+        return [], [], []
+
+    tokens, starts, ends = [], [], []
+    for match in WORD_PATTERN.finditer(text):
+        tokens.append(light_stem(match.group().lower()))
+        starts.append(match.start())
+        ends.append(match.end())
+    return tokens, starts, ends
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Cleans generated keywords and tunes theme vocabularies against the transcript corpus.
+"""
+
+# Background: 00_Keyword_Generator.py returns the raw lines of the LLM response ("1. machine learning",
+# "- **Automation**", generic terms like "technology" or "growth"), and those went straight into
+# Thematic Vocab.xlsx. Keywords that never occur only make the theme regex longer; hyper-frequent ones
+# ("growth") match in nearly every call and swamp the theme counts. This module cleans a candidate list and
+# scores every candidate against the local corpus, using the persisted transcript index (transcript_index.py):
+#   - Hits / Sentences / Transcripts: how often and how widely the keyword occurs (document frequency)
+#   - Seed Co-occurrence / PMI: how much more often the keyword occurs in transcripts that also mention the
+#     seed terms (the theme name, or a few hand-picked core keywords) than chance would predict
+#       PMI = log2( P(keyword and seed) / (P(keyword) * P(seed)) ), over transcripts
+# and mines the sentences mentioning the seeds for words and two-word phrases that co-occur with them much
+# more often than chance (high sentence-level PMI), as suggested expansions.
+
+# How to Use:
+# - keywords = clean_keyword_lines(raw_lines)                  (numbering, bullets, quotes, duplicates removed)
+# - index = TranscriptIndex.load(index_file_path)              (built by 02_Transcript_Index.py)
+# - lean_keywords, scores, expansions = tune_vocabulary(index, keywords, seed_keywords=['AI'])
+#   scores has one row per candidate with its statistics and a 'Status' ('keep' or the reason it was dropped).
+
+# Drop rules (all thresholds are arguments of tune_vocabulary):
+#   'zero hits'      the keyword never occurs in the indexed corpus
+#   'stopword-like'  the keyword consists only of stopwords, or occurs in more than max_transcript_share of calls
+#   'low PMI'        the keyword co-occurs with the seeds no more often than min_pmi allows (seeds are always kept)
+
+
+#Import Libraries
+import re
+import numpy as np
+import pandas as pd
+
+from transcript_index import POSITION_BITS
+from transcript_text import word_tokens
+
+# Function words and earnings call boilerplate that never make a useful keyword on their own
+STOPWORDS = frozenset('''
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her here
+hers him his how i if in into is it its itself just me more most my no nor not now of off on once only or other
+our ours out over own same she should so some such than that the their theirs them then there these they this
+those through to too under until up very was we were what when where which while who whom why will with would
+you your yours
+quarter quarters year years call thanks thank question questions think see going know well really good great
+lot kind sort things thing like just yes okay right maybe still much many new one two first next last
+business company companies market markets customer customers growth impact increase decrease
+'''.split())
+
+# Leading list markers of LLM output: "1.", "12)", "(3)", "-", "*", "•", "a."
+LIST_MARKER_PATTERN = re.compile(r'^\s*(?:\(?\d+[.)\]:]|\(?[a-zA-Z][.)](?=\s)|[-*•·–—>#]+)\s*')
+
+# Keywords longer than this (in word tokens) are sentences or explanations rather than keywords
+MAX_KEYWORD_TOKENS = 6
+
+
+#%% Cleaning
+
+def clean_keyword(line):
+    """
+    Strips list numbering, bullets, markdown emphasis, quotes and trailing punctuation from one LLM line.
+
+    An explanation after a colon or a spaced dash ("Automation: use of machines to ...") is dropped.
+    Returns '' if nothing usable is left.
+    """
+    keyword = LIST_MARKER_PATTERN.sub('', line.strip())
+    keyword = re.split(r':\s| [-–—] ', keyword, maxsplit=1)[0]
+    keyword = keyword.replace('**', '').replace('__', '').replace('`', '')
+    keyword = keyword.strip().strip('"\'“”‘’').strip().rstrip('.,;:!?').strip()
+    return re.sub(r'\s+', ' ', keyword)
+
+
+def clean_keyword_lines(lines, max_tokens=MAX_KEYWORD_TOKENS):
+    """
+    Cleans raw LLM lines into a keyword list.
+
+    Parameters:
+        lines (list of str): Raw response lines (or already split keywords).
+        max_tokens (int): Keywords with more word tokens are dropped as explanations.
+
+    Returns:
+        list of str: Cleaned keywords, in their original order, without case-insensitive duplicates.
+    """
+    keywords = []
+    seen = set()
+    for line in lines:
+        keyword = clean_keyword(line) if isinstance(line, str) else ''
+        tokens, _ = word_tokens(keyword)
+        if not tokens or len(tokens) > max_tokens or keyword.lower() in seen:
+            continue
+        seen.add(keyword.lower())
+        keywords.append(keyword)
+    return keywords
+
+
+#%% Corpus Statistics
+
+def _active_counts(index):
+    """Number of active transcripts and of their sentences (retired transcripts keep no postings)."""
+    active = index.documents[index.documents['active'].astype(bool)]
+    return len(active), int(active['n_sentences'].sum())
+
+
+def keyword_sentences(index, keyword):
+    """Returns the keys of every hit of a keyword and the sorted, unique sentence ids it occurs in."""
+    keys = index.phrase_keys(keyword)
+    return keys, np.unique(keys >> POSITION_BITS)
+
+
+def keyword_statistics(index, keywords, seed_keywords=()):
+    """
+    Scores keywords against the indexed corpus.
+
+    Parameters:
+        index (TranscriptIndex): The transcript index.
+        keywords (list of str): Candidate keywords.
+        seed_keywords (list of str): Core terms of the theme; co-occurrence and PMI are measured against
+                                     transcripts mentioning any of them.
+
+    Returns:
+        pd.DataFrame with one row per keyword: 'Keyword', 'Seed', 'Hits', 'Sentences', 'Transcripts',
+        'Transcript Share', 'Seed Co-occurrence' (transcripts with both) and 'PMI' (NaN for seeds and
+        keywords without hits, or if no seed occurs).
+    """
+    n_transcripts, _ = _active_counts(index)
+    seed_set = {seed.lower() for seed in seed_keywords}
+    seed_sentences = np.unique(np.concatenate(
+        [keyword_sentences(index, seed)[1] for seed in seed_keywords] or [np.empty(0, dtype=np.int64)]))
+    seed_documents = np.unique(index.sentence_doc[seed_sentences])
+
+    rows = []
+    for keyword in keywords:
+        keys, sentences = keyword_sentences(index, keyword)
+        documents = np.unique(index.sentence_doc[sentences])
+        both = np.intersect1d(documents, seed_documents, assume_unique=True)
+        is_seed = keyword.lower() in seed_set
+
+        pmi = np.nan
+        if not is_seed and len(documents) and len(seed_documents) and n_transcripts:
+            # log2(0) = -inf: the keyword never appears in a transcript mentioning the seeds
+            with np.errstate(divide='ignore'):
+                pmi = np.log2(len(both) * n_transcripts / (len(documents) * len(seed_documents)))
+
+        rows.append({
+            'Keyword': keyword,
+            'Seed': is_seed,
+            'Hits': len(keys),
+            'Sentences': len(sentences),
+            'Transcripts': len(documents),
+            'Transcript Share': len(documents) / n_transcripts if n_transcripts else 0.0,
+            'Seed Co-occurrence': len(both),
+            'PMI': pmi,
+        })
+    return pd.DataFrame(rows, columns=['Keyword', 'Seed', 'Hits', 'Sentences', 'Transcripts', 'Transcript Share',
+                                       'Seed Co-occurrence', 'PMI'])
+
+
+def is_stopword_like(keyword):
+    """True if every word token of the keyword is a stopword or a number."""
+    tokens, _ = word_tokens(keyword)
+    return all(token in STOPWORDS or token.isdigit() for token in tokens)
+
+
+def suggest_expansions(index, seed_keywords, existing_keywords=(), min_cooccurrence=5, min_pmi=1.0, top_n=25,
+                       max_sentences=50000):
+    """
+    Mines the sentences mentioning the seed terms for words and two-word phrases strongly associated with them.
+
+    Every word and two-word phrase (without stopwords, numbers, single letters or seed tokens) in the seed
+    sentences is scored by its sentence-level PMI with the seeds:
+        PMI = log2( sentences with term and seed * N / (sentences with seed * sentences with term) )
+
+    Parameters:
+        existing_keywords (list of str): Keywords already in the vocabulary (not suggested again).
+        min_cooccurrence (int): Minimum number of seed sentences a term must occur in.
+        min_pmi (float): Minimum PMI (1.0 = twice as often in seed sentences as chance predicts).
+        top_n (int): Number of suggestions to return.
+        max_sentences (int): Seed sentences sampled at most (deterministically), to bound the mining time.
+
+    Returns:
+        pd.DataFrame with 'Term', 'Seed Co-occurrence', 'Sentences' and 'PMI', highest PMI first.
+    """
+    _, n_sentences = _active_counts(index)
+    seed_sentences = np.unique(np.concatenate(
+        [keyword_sentences(index, seed)[1] for seed in seed_keywords] or [np.empty(0, dtype=np.int64)]))
+    columns = ['Term', 'Seed Co-occurrence', 'Sentences', 'PMI']
+    if len(seed_sentences) == 0:
+        return pd.DataFrame(columns=columns)
+    n_seed = len(seed_sentences)
+    if n_seed > max_sentences:
+        seed_sentences = np.random.default_rng(0).choice(seed_sentences, max_sentences, replace=False)
+
+    excluded_tokens = {token for seed in seed_keywords for token in word_tokens(seed)[0]}
+    existing = {' '.join(word_tokens(keyword)[0]) for keyword in list(existing_keywords) + list(seed_keywords)}
+
+    # Sentence frequency of every candidate within the seed sentences (each term counted once per sentence)
+    texts = index.documents['Transcript']
+    cooccurrence = {}
+    for sentence_id in seed_sentences:
+        start, end = index.sentence_bounds[sentence_id]
+        tokens, _ = word_tokens(texts.loc[index.sentence_doc[sentence_id]][start:end])
+        terms = set()
+        for i, token in enumerate(tokens):
+            if token in excluded_tokens or token.isdigit():
+                continue
+            if token not in STOPWORDS and len(token) > 2:
+                terms.add(token)
+            if i + 1 < len(tokens):
+                following = tokens[i + 1]
+                if (following not in excluded_tokens and not following.isdigit() and min(len(token), len(following)) > 1
+                        and token not in STOPWORDS and following not in STOPWORDS):
+                    terms.add(f'{token} {following}')
+        for term in terms:
+            cooccurrence[term] = cooccurrence.get(term, 0) + 1
+
+    # Scale the counts of a sample back up to all seed sentences
+    scale = n_seed / len(seed_sentences)
+    rows = []
+    for term, count in cooccurrence.items():
+        count = count * scale
+        if count < min_cooccurrence or term in existing:
+            continue
+        sentences = len(keyword_sentences(index, term)[1])
+        pmi = np.log2(count * n_sentences / (n_seed * sentences))
+        if pmi >= min_pmi:
+            rows.append({'Term': term, 'Seed Co-occurrence': int(round(count)), 'Sentences': sentences, 'PMI': pmi})
+
+    suggestions = pd.DataFrame(rows, columns=columns)
+    return suggestions.sort_values(['PMI', 'Seed Co-occurrence'], ascending=False).head(top_n).reset_index(drop=True)
+
+
+#%% Vocabulary Tuning
+
+def tune_vocabulary(index, keywords, seed_keywords=(), max_transcript_share=0.5, min_pmi=0.0,
+                    n_expansions=25, min_cooccurrence=5):
+    """
+    Cleans a candidate keyword list, scores it against the corpus and drops unhelpful keywords.
+
+    Parameters:
+        index (TranscriptIndex): The transcript index.
+        keywords (list of str): Candidate keywords (raw LLM lines are cleaned first).
+        seed_keywords (list of str): Core terms of the theme (e.g. the theme name); always kept.
+        max_transcript_share (float): Keywords found in a larger share of all transcripts are dropped as stopword-like.
+        min_pmi (float or None): Keywords whose transcript-level PMI with the seeds is below this are dropped
+                                 (0 = no more often than chance); None disables the rule.
+        n_expansions (int): Number of suggested expansions to mine (0 disables mining).
+        min_cooccurrence (int): Minimum seed sentences an expansion must occur in.
+
+    Returns:
+        lean_keywords (list of str): The kept keywords, seeds first.
+        scores (pd.DataFrame): keyword_statistics of every candidate plus 'Status'.
+        expansions (pd.DataFrame): suggest_expansions output (not added to lean_keywords).
+    """
+    seed_keywords = clean_keyword_lines(seed_keywords)
+    candidates = clean_keyword_lines(list(seed_keywords) + clean_keyword_lines(keywords))
+    scores = keyword_statistics(index, candidates, seed_keywords)
+
+    status = pd.Series('keep', index=scores.index)
+    status[scores['Hits'] == 0] = 'zero hits'
+    stopword_like = scores['Keyword'].map(is_stopword_like) | (scores['Transcript Share'] > max_transcript_share)
+    status[(status == 'keep') & stopword_like] = 'stopword-like'
+    if min_pmi is not None:
+        status[(status == 'keep') & (scores['PMI'] < min_pmi)] = 'low PMI'
+    status[scores['Seed'] & (scores['Hits'] > 0)] = 'keep'
+    scores['Status'] = status
+
+    lean_keywords = scores.loc[scores['Status'] == 'keep', 'Keyword'].to_list()
+    expansions = (suggest_expansions(index, seed_keywords, candidates, min_cooccurrence, top_n=n_expansions)
+                  if n_expansions and seed_keywords else pd.DataFrame(columns=['Term', 'Seed Co-occurrence', 'Sentences', 'PMI']))
+    return lean_keywords, scores, expansions